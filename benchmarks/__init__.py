@@ -0,0 +1,9 @@
+"""HTTP benchmarks for the inventory app at realistic data volumes.
+
+Seeds a file-backed SQLite database (reused between runs with the same volumes), drives every
+route through the Flask test client and a threaded local WSGI server, and writes throughput,
+latency percentiles and queries per request to a JSON file named after the current commit:
+
+    python -m benchmarks --products 100000 --movements 10000000
+    python -m benchmarks.compare benchmarks/results/<old>.json benchmarks/results/<new>.json
+"""
@@ -0,0 +1,100 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+
+import sqlalchemy
+
+from inventory_app import create_app, db
+from inventory_app.config import ProductionConfig
+from .runner import TestClientDriver, WSGIServerDriver, run_benchmarks
+from .seed import ensure_seeded
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def create_bench_app(path):
+    # Same wiring as tests.base.BaseTestCase, against a file database with the production engine profile
+    return create_app('test', config_overrides={
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path,
+        'SQLITE_PRAGMAS': ProductionConfig.SQLITE_PRAGMAS,
+        'INSTRUMENTATION_ENABLED': True, # Queries per request come from the Server-Timing header
+        'SLOW_QUERY_THRESHOLD_MS': float('inf'),
+    })
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--movements', type=int, default=10000000)
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the generated data.')
+    parser.add_argument('--db', help='SQLite file to seed or reuse (default: benchmarks/data/bench-<products>-<movements>.db).')
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario and driver.')
+    parser.add_argument('--warmup', type=int, default=1, help='Unmeasured requests per scenario before measuring.')
+    parser.add_argument('--threads', type=int, default=8, help='Client threads for the WSGI server driver.')
+    parser.add_argument('--drivers', default='test_client,wsgi_server', help='Comma-separated: test_client, wsgi_server.')
+    parser.add_argument('--only', help='Comma-separated substrings; run only scenarios whose name contains one.')
+    parser.add_argument('--heavy', action='store_true', help='Also run whole-table scenarios (exports, full replays).')
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/<commit>-<timestamp>.json).')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    path = os.path.abspath(args.db or os.path.join(BENCH_DIR, 'data', f'bench-{args.products}-{args.movements}.db'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    app = create_bench_app(path)
+    with app.app_context():
+        ensure_seeded(path, args.products, args.movements, seed=args.seed)
+        db.session.remove()
+
+    drivers = []
+    for name in args.drivers.split(','):
+        if name == 'test_client':
+            drivers.append(TestClientDriver(app))
+        elif name == 'wsgi_server':
+            drivers.append(WSGIServerDriver(app, threads=args.threads))
+        else:
+            sys.exit(f'Unknown driver: {name}')
+    results = run_benchmarks(app, drivers, args.requests, warmup=args.warmup, include_heavy=args.heavy,
+                             only=args.only.split(',') if args.only else None)
+
+    commit = current_commit()
+    started = datetime.datetime.utcnow()
+    report = {
+        'meta': {
+            'commit': commit,
+            'timestamp': started.isoformat(timespec='seconds') + 'Z',
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'sqlite': sqlite3.sqlite_version,
+            'products': args.products,
+            'movements': args.movements,
+            'seed': args.seed,
+            'requests': args.requests,
+            'threads': args.threads,
+        },
+        'results': results,
+    }
+    output = args.output or os.path.join(BENCH_DIR, 'results', f'{commit}-{started:%Y%m%dT%H%M%S}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as stream:
+        json.dump(report, stream, indent=2)
+    print(f'Results written to {output}')
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Compare two benchmark result files: python -m benchmarks.compare BASELINE CANDIDATE [--tolerance 10]
+
+Prints the change in p95 latency, throughput and queries per request for every scenario both
+files ran, and exits with status 1 if any scenario regressed by more than the tolerance.
+"""
+
+import argparse
+import json
+import sys
+
+
+def _change(old, new):
+    if not old or new is None:
+        return None
+    return (new - old) / old * 100
+
+
+def compare(baseline, candidate, tolerance=10.0):
+    """Return (rows, regressions) comparing two result dicts."""
+    rows, regressions = [], []
+    for driver, scenarios in candidate['results'].items():
+        for name, figures in scenarios.items():
+            before = baseline['results'].get(driver, {}).get(name)
+            if before is None:
+                continue
+            p95 = _change(before['latency_ms']['p95'], figures['latency_ms']['p95'])
+            throughput = _change(before['throughput_rps'], figures['throughput_rps'])
+            queries_before = before['queries_per_request']['mean']
+            queries_after = figures['queries_per_request']['mean']
+            row = (driver, name, p95, throughput, queries_before, queries_after)
+            rows.append(row)
+            if (p95 is not None and p95 > tolerance) or (throughput is not None and throughput < -tolerance) \
+                    or (queries_before is not None and queries_after is not None and queries_after > queries_before):
+                regressions.append(row)
+    return rows, regressions
+
+
+def _format(value):
+    return '     n/a' if value is None else f'{value:+7.1f}%'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.compare', description=__doc__)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--tolerance', type=float, default=10.0, help='Allowed p95/throughput change in percent.')
+    args = parser.parse_args(argv)
+    with open(args.baseline) as stream:
+        baseline = json.load(stream)
+    with open(args.candidate) as stream:
+        candidate = json.load(stream)
+    print(f"{baseline['meta']['commit']} -> {candidate['meta']['commit']}")
+    rows, regressions = compare(baseline, candidate, args.tolerance)
+    for driver, name, p95, throughput, queries_before, queries_after in rows:
+        flag = ' REGRESSION' if (driver, name, p95, throughput, queries_before, queries_after) in regressions else ''
+        print(f'{driver:12} {name:30} p95 {_format(p95)}  throughput {_format(throughput)}  '
+              f'queries {queries_before} -> {queries_after}{flag}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,227 @@
+# Benchmark drivers and statistics.
+# Every scenario is one route with fixed arguments. The in-process driver sends requests one at
+# a time through Flask's test client; the server driver runs the app in a threaded local WSGI
+# server and sends them from several client threads. Queries per request are read from the
+# Server-Timing header added by inventory_app.instrumentation.
+
+import datetime
+import http.client
+import re
+import threading
+import time
+import urllib.parse
+
+from flask import url_for
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from inventory_app.instrumentation import percentile
+from inventory_app import db
+from inventory_app.listing import product_cursor
+from inventory_app.shards import shard_product
+from inventory_app.models import Product, User
+from .seed import BENCH_ADMIN, BENCH_PASSWORD, HISTORY_DAYS
+
+_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+class Scenario:
+    def __init__(self, name, method, path, data=None, heavy=False):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.heavy = heavy # Whole-table work (exports, full ledger replays); only run with --heavy
+
+
+def build_scenarios(app):
+    """Resolve the routes to exercise against the seeded data."""
+    with app.app_context():
+        by_stock = Product.query.order_by(Product.quantity.desc(), Product.id)
+        hot = by_stock.offset(1).first()
+        if hot.stock_shards is None:
+            # The runner-up SKU sells from sharded counters, to compare with the single-row `stocked`
+            shard_product(hot.id, app.config.get('STOCK_SHARDS', 8))
+            db.session.commit()
+        hot_id = hot.id
+        stocked = by_stock.first()
+        clerk = User.query.filter(User.username != BENCH_ADMIN).first()
+        total = Product.query.count()
+        middle = Product.query.order_by(Product.name, Product.id).offset(total // 2).first()
+        middle_cursor = product_cursor('name', middle)
+        category_id = stocked.category_id
+    with app.test_request_context():
+        today = datetime.date.today()
+        mid_history = today - datetime.timedelta(days=HISTORY_DAYS // 2)
+        return [
+            Scenario('index', 'GET', url_for('main.index')),
+            Scenario('products', 'GET', url_for('main.products')),
+            Scenario('products_middle_page', 'GET', url_for('main.products', cursor=middle_cursor)),
+            Scenario('products_by_category_price', 'GET', url_for('main.products', category_id=category_id, sort='-price')),
+            Scenario('product_search', 'GET', url_for('main.product_search', q=stocked.name.split()[-1][:5])),
+            Scenario('reports_index', 'GET', url_for('main.reports_index')),
+            Scenario('low_stock_report', 'GET', url_for('main.low_stock_report')),
+            Scenario('movements_report', 'GET', url_for('main.inventory_movements_report')),
+            Scenario('movements_report_by_product', 'GET', url_for('main.inventory_movements_report', product_id=stocked.id)),
+            Scenario('movements_report_by_user', 'GET', url_for('main.inventory_movements_report', user_id=clerk.id)),
+            Scenario('stock_as_of_report', 'GET', url_for('main.stock_as_of_report', as_of=today.isoformat())),
+            Scenario('performance_report', 'GET', url_for('main.performance_report')),
+            Scenario('edit_product_form', 'GET', url_for('main.edit_product', product_id=stocked.id)),
+            Scenario('add_stock', 'POST', url_for('main.add_stock', product_id=stocked.id),
+                     data={'quantity_added': '1', 'notes': 'benchmark'}),
+            Scenario('remove_stock', 'POST', url_for('main.remove_stock', product_id=stocked.id),
+                     data={'quantity_removed': '1', 'reason': 'sale', 'notes': 'benchmark'}),
+            Scenario('remove_stock_sharded', 'POST', url_for('main.remove_stock', product_id=hot_id),
+                     data={'quantity_removed': '1', 'reason': 'sale', 'notes': 'benchmark'}),
+            Scenario('api_products', 'GET', url_for('api.products')),
+            Scenario('api_product_detail', 'GET', url_for('api.product_detail', product_id=stocked.id)),
+            Scenario('api_product_search', 'GET', url_for('api.product_search', q=stocked.sku[:6])),
+            # Before the seeded snapshot, so the ledger is replayed from the start
+            Scenario('stock_as_of_report_mid_history', 'GET', url_for('main.stock_as_of_report', as_of=mid_history.isoformat()), heavy=True),
+            Scenario('export_products_csv', 'GET', url_for('main.export_data', kind='products', fmt='csv'), heavy=True),
+            Scenario('export_movements_ndjson', 'GET', url_for('main.export_data', kind='movements', fmt='ndjson'), heavy=True),
+        ]
+
+
+def summarize(samples, elapsed):
+    """Turn (latency ms, status, queries or None) samples into the reported figures."""
+    latencies = sorted(sample[0] for sample in samples)
+    queries = [sample[2] for sample in samples if sample[2] is not None]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for sample in samples if sample[1] >= 400),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'max': round(latencies[-1], 3),
+        },
+        'queries_per_request': {
+            'mean': round(sum(queries) / len(queries), 2) if queries else None,
+            'max': max(queries) if queries else None,
+        },
+    }
+
+
+def _queries(server_timing):
+    match = _QUERIES.search(server_timing or '')
+    return int(match.group(1)) if match else None
+
+
+class TestClientDriver:
+    """Sequential requests through app.test_client(), in process."""
+    name = 'test_client'
+
+    def __init__(self, app):
+        self.app = app
+        self.client = app.test_client()
+        self.client.post(url_for_path(app, 'main.login'),
+                         data={'email_or_username': BENCH_ADMIN, 'password': BENCH_PASSWORD})
+
+    def run(self, scenario, requests, warmup=1):
+        for _ in range(warmup):
+            self._request(scenario)
+        samples = []
+        started = time.perf_counter()
+        for _ in range(requests):
+            samples.append(self._request(scenario))
+        return summarize(samples, time.perf_counter() - started)
+
+    def _request(self, scenario):
+        started = time.perf_counter()
+        response = self.client.open(scenario.path, method=scenario.method, data=scenario.data)
+        response.get_data() # Drain streamed bodies
+        return (time.perf_counter() - started) * 1000, response.status_code, _queries(response.headers.get('Server-Timing'))
+
+    def close(self):
+        pass
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, code='-', size='-'):
+        pass # One access log line per request would dominate the output
+
+
+class WSGIServerDriver:
+    """Concurrent requests from `threads` client threads against a threaded local WSGI server."""
+    name = 'wsgi_server'
+
+    def __init__(self, app, threads=8):
+        self.threads = threads
+        self.host = app.config.get('SERVER_NAME') or 'localhost'
+        self.server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=_QuietRequestHandler)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        status, headers, _ = self._send('POST', url_for_path(app, 'main.login'),
+                                        {'email_or_username': BENCH_ADMIN, 'password': BENCH_PASSWORD}, cookie=None)
+        self.cookie = '; '.join(value.split(';', 1)[0] for name, value in headers if name.lower() == 'set-cookie')
+
+    def _send(self, method, path, data, cookie):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=300)
+        headers = {'Host': self.host}
+        body = None
+        if cookie:
+            headers['Cookie'] = cookie
+        if data is not None:
+            body = urllib.parse.urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status, response.getheaders(), response.getheader('Server-Timing')
+        finally:
+            connection.close()
+
+    def _request(self, scenario):
+        started = time.perf_counter()
+        status, _, server_timing = self._send(scenario.method, scenario.path, scenario.data, self.cookie)
+        return (time.perf_counter() - started) * 1000, status, _queries(server_timing)
+
+    def run(self, scenario, requests, warmup=1):
+        for _ in range(warmup):
+            self._request(scenario)
+        samples, lock = [], threading.Lock()
+        per_thread = [requests // self.threads + (1 if i < requests % self.threads else 0) for i in range(self.threads)]
+
+        def worker(count):
+            local = [self._request(scenario) for _ in range(count)]
+            with lock:
+                samples.extend(local)
+
+        workers = [threading.Thread(target=worker, args=(count,)) for count in per_thread if count]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return summarize(samples, time.perf_counter() - started)
+
+    def close(self):
+        self.server.shutdown()
+        self.thread.join()
+
+
+def url_for_path(app, endpoint, **values):
+    with app.test_request_context():
+        return url_for(endpoint, **values)
+
+
+def run_benchmarks(app, drivers, requests, warmup=1, include_heavy=False, only=None, progress=print):
+    """Run every selected scenario with every driver. Returns {driver: {scenario: figures}}."""
+    scenarios = [scenario for scenario in build_scenarios(app)
+                 if (include_heavy or not scenario.heavy) and (not only or any(name in scenario.name for name in only))]
+    results = {}
+    for driver in drivers:
+        results[driver.name] = {}
+        try:
+            for scenario in scenarios:
+                figures = driver.run(scenario, requests, warmup=warmup)
+                results[driver.name][scenario.name] = figures
+                progress(f"{driver.name:12} {scenario.name:30} {figures['throughput_rps']:>9} req/s  "
+                         f"p95 {figures['latency_ms']['p95']:>9} ms  "
+                         f"{figures['queries_per_request']['mean']} queries  {figures['errors']} errors")
+        finally:
+            driver.close()
+    return results
@@ -0,0 +1,124 @@
+# Deterministic seeding of a benchmark database.
+# Movements are generated twice from the same random seed: the first pass only tracks each
+# product's running quantity (so stock never goes negative and the final quantities match the
+# ledger), the second pass inserts them. Memory stays bounded by the product count.
+
+import datetime
+import json
+import os
+import random
+
+from inventory_app import db
+from inventory_app.facets import resolve_names
+from inventory_app.models import Category, InventoryMovement, Product, Supplier, User
+from inventory_app.summary import is_low_stock, low_stock_threshold, rebuild_summary
+from inventory_app.snapshots import take_snapshot
+
+BENCH_ADMIN = 'bench-admin'
+BENCH_PASSWORD = 'bench-password'
+CLERKS = 10
+CATEGORIES = 20
+SUPPLIERS = 50
+HISTORY_DAYS = 365
+CHUNK_SIZE = 50000
+ENTRY_TYPES = ('stock_entry', 'return')
+EXIT_TYPES = ('sale', 'sale', 'sale', 'damage', 'internal_use')
+
+
+def _movement_stream(seed, products, movements, quantities):
+    """Yield (product index, quantity change, movement type), keeping `quantities` (running
+    stock per product) up to date so no product goes negative."""
+    rng = random.Random(seed)
+    for _ in range(movements):
+        index = rng.randrange(products)
+        if quantities[index] == 0 or rng.random() < 0.4:
+            change, movement_type = rng.randint(5, 50), rng.choice(ENTRY_TYPES)
+        else:
+            change, movement_type = -rng.randint(1, min(quantities[index], 20)), rng.choice(EXIT_TYPES)
+        quantities[index] += change
+        yield index, change, movement_type
+
+
+def _insert_chunks(table, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            db.session.execute(table.insert(), chunk)
+            db.session.commit()
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+        db.session.commit()
+
+
+def seed_database(products, movements, seed=0, progress=print):
+    """Create the tables and fill them with `products` products and `movements` movements."""
+    db.create_all()
+    admin = User(username=BENCH_ADMIN, email='bench-admin@example.com', role='admin')
+    admin.set_password(BENCH_PASSWORD)
+    db.session.add(admin)
+    db.session.add_all(User(username=f'clerk{i}', email=f'clerk{i}@example.com') for i in range(CLERKS))
+    db.session.commit()
+    user_ids = [user_id for (user_id,) in db.session.query(User.id).order_by(User.id)]
+
+    progress(f'Computing final quantities for {products} products...')
+    quantities = [0] * products
+    for _ in _movement_stream(seed, products, movements, quantities):
+        pass
+    rng = random.Random(seed + 1)
+    threshold = low_stock_threshold()
+    started = datetime.datetime.utcnow() - datetime.timedelta(days=HISTORY_DAYS)
+    connection = db.session.connection()
+    category_ids = resolve_names(connection, Category, [f'Category {index:02d}' for index in range(CATEGORIES)])
+    supplier_ids = resolve_names(connection, Supplier, [f'Supplier {index:02d}' for index in range(SUPPLIERS)])
+    db.session.commit()
+
+    def product_rows():
+        for index in range(products):
+            reorder_point = rng.choice((None, None, None, 5, 20, 50))
+            yield dict(id=index + 1, name=f'Product {index:07d}', sku=f'SKU{index:07d}',
+                       description=f'Benchmark product {index} for the {index % CATEGORIES} line',
+                       quantity=quantities[index], price=round(rng.uniform(0.5, 500), 2),
+                       category_id=category_ids[f'Category {index % CATEGORIES:02d}'],
+                       supplier_id=supplier_ids[f'Supplier {index % SUPPLIERS:02d}'],
+                       reorder_point=reorder_point,
+                       low_stock=is_low_stock(quantities[index], threshold, reorder_point),
+                       date_added=started, last_updated=started)
+
+    progress(f'Inserting {products} products...')
+    _insert_chunks(Product.__table__, product_rows())
+
+    step = datetime.timedelta(days=HISTORY_DAYS) / max(movements, 1)
+    stream = _movement_stream(seed, products, movements, [0] * products)
+
+    def movement_rows():
+        for number, (index, change, movement_type) in enumerate(stream):
+            if number and number % 1000000 == 0:
+                progress(f'  {number} movements...')
+            yield dict(product_id=index + 1, user_id=user_ids[number % len(user_ids)], quantity_change=change,
+                       movement_type=movement_type, timestamp=started + step * number,
+                       notes=None, reference_id=f'BENCH-{number}' if number % 10 == 0 else None)
+
+    progress(f'Inserting {movements} movements...')
+    _insert_chunks(InventoryMovement.__table__, movement_rows())
+    rebuild_summary()
+    take_snapshot(force=True)
+
+
+def ensure_seeded(path, products, movements, seed=0, progress=print):
+    """Seed the database at `path` unless it already holds exactly these volumes (see the sidecar file)."""
+    meta_path = path + '.json'
+    meta = {'products': products, 'movements': movements, 'seed': seed}
+    if os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path) as stream:
+            if json.load(stream) == meta:
+                progress(f'Reusing seeded database {path}')
+                return False
+    for stale in (path, meta_path, path + '-wal', path + '-shm'):
+        if os.path.exists(stale):
+            os.remove(stale)
+    seed_database(products, movements, seed=seed, progress=progress)
+    with open(meta_path, 'w') as stream:
+        json.dump(meta, stream)
+    return True
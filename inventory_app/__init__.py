@@ -3,27 +3,40 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_wtf.csrf import CSRFProtect
 from flask_login import LoginManager
 import os
+import time
 
 # Import config
 from .config import config_by_name
+from .database import RoutingSession, configure_engine_options, create_replica_engine, register_sqlite_pragmas
+from .instrumentation import init_instrumentation
 
 # Initialize extensions globally but without an app
-db = SQLAlchemy() # No metadata here, models.py will handle it.
+db = SQLAlchemy(session_options={'class_': RoutingSession}) # No metadata here, models.py will handle it.
 csrf = CSRFProtect()
 login_manager = LoginManager()
 login_manager.login_view = 'main.login' # Assuming routes will be in a 'main' blueprint or similar
 login_manager.login_message_category = "info"
 
 
-def create_app(config_name=None):
+def create_app(config_name=None, config_overrides=None):
     if config_name is None:
         config_name = os.getenv('FLASK_ENV', 'default')
 
     app = Flask(__name__)
     app.config.from_object(config_by_name[config_name])
+    # Optional mapping applied on top of the config class, e.g. a file-backed database for stress tests
+    if config_overrides:
+        app.config.update(config_overrides)
 
     # Initialize extensions with the app
+    configure_engine_options(app) # Pool sizing from the config class
     db.init_app(app)
+    replica_engine = create_replica_engine(app)
+    with app.app_context():
+        engines = [db.engine] + ([replica_engine] if replica_engine is not None else [])
+        register_sqlite_pragmas(app, engines)
+        # Opt-in per-request SQL/template timings (INSTRUMENTATION_ENABLED)
+        init_instrumentation(app, engines)
     csrf.init_app(app)
     login_manager.init_app(app)
 
@@ -50,14 +63,26 @@ def create_app(config_name=None):
 
     # User loader for Flask-Login
     # Needs to be defined after User model is available and login_manager is initialized.
+    # Identities are served from an in-process cache (see user_cache.py), so most
+    # authenticated requests only read the user's auth_version.
     from .models import User  # Import User model
+    from .user_cache import load_cached_user
+    from .fragments import init_fragment_cache
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return load_cached_user(user_id)
+
+    # Cached product rows and report bodies (see fragments.py)
+    init_fragment_cache(app)
+    # Compiled templates shared between workers (JINJA_BYTECODE_CACHE_DIR)
+    from .warmup import configure_bytecode_cache, warm_up
+    configure_bytecode_cache(app)
 
     # Import and register Blueprints here
     from .routes import main as main_blueprint # Import the blueprint from routes.py
     app.register_blueprint(main_blueprint)
+    from .api import api as api_blueprint
+    app.register_blueprint(api_blueprint, url_prefix='/api')
     # If you have other blueprints, register them too:
     # from .auth_routes import auth as auth_blueprint
     # app.register_blueprint(auth_blueprint, url_prefix='/auth')
@@ -71,4 +96,168 @@ def create_app(config_name=None):
             init_db_func(app)
         print("Database initialized and tables created.")
 
+    # CLI command to bulk-load products from a CSV/NDJSON file
+    import click
+    from .importer import import_products, detect_format, IMPORT_FORMATS
+    @app.cli.command("import-products")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--user", "username", required=True, help="Username recorded on the initial stock movements.")
+    @click.option("--format", "fmt", type=click.Choice(IMPORT_FORMATS), default=None, help="Defaults to the file extension.")
+    @click.option("--chunk-size", type=int, default=None, help="Rows per bulk insert and commit.")
+    def import_products_command(path, username, fmt, chunk_size):
+        with app.app_context():
+            user = User.query.filter_by(username=username).first()
+            if user is None:
+                raise click.BadParameter(f"No user named {username!r}.", param_hint="--user")
+            try:
+                fmt = fmt or detect_format(path)
+            except ValueError as exc:
+                raise click.BadParameter(str(exc), param_hint="PATH")
+            with open(path, encoding='utf-8-sig', newline='') as stream:
+                result = import_products(stream, fmt, user.id, chunk_size=chunk_size)
+        for line_no, message in result.errors:
+            print(f"Line {line_no}: {message}")
+        print(f"Imported {result.created} products, rejected {result.rejected} rows.")
+
+    # CLI commands to stream exports to a file or stdout
+    from .exporter import iter_export, parse_since, EXPORT_FORMATS
+    def register_export_command(kind):
+        @app.cli.command(f"export-{kind}")
+        @click.option("--format", "fmt", type=click.Choice(EXPORT_FORMATS), default='csv')
+        @click.option("--since", default=None, help="Only rows changed at or after this ISO date/datetime.")
+        @click.option("--output", "-o", default='-', help="Output file (default: stdout).")
+        def export_command(fmt, since, output):
+            try:
+                since = parse_since(since)
+            except ValueError:
+                raise click.BadParameter("Use an ISO date or datetime, e.g. 2024-03-31.", param_hint="--since")
+            with app.app_context(), click.open_file(output, 'w', encoding='utf-8') as stream:
+                for chunk in iter_export(kind, fmt, since):
+                    stream.write(chunk)
+    register_export_command('products')
+    register_export_command('movements')
+
+    # Product search: importing the module registers the FTS5 DDL that create_all() runs on SQLite
+    from .search import rebuild_search_index
+    @app.cli.command("rebuild-search-index")
+    def rebuild_search_index_command():
+        with app.app_context():
+            backend = rebuild_search_index()
+        print(f"Search index rebuilt (backend: {backend}).")
+
+    # Stock snapshots for point-in-time inventory queries
+    from .snapshots import take_snapshot
+    @app.cli.command("take-stock-snapshot")
+    @click.option("--every", type=click.IntRange(min=1), default=None,
+                  help="Keep running and take a snapshot every N minutes.")
+    @click.option("--force", is_flag=True, help="Snapshot even if nothing moved since the last one.")
+    def take_stock_snapshot_command(every, force):
+        while True:
+            with app.app_context():
+                snapshot = take_snapshot(force=force)
+                if snapshot is None:
+                    print("No movements since the last snapshot; skipped.")
+                else:
+                    print(f"Snapshot {snapshot.id} taken at {snapshot.taken_at:%Y-%m-%d %H:%M:%S}: "
+                          f"{snapshot.product_count} products, {snapshot.total_units} units "
+                          f"(up to movement {snapshot.last_movement_id}).")
+            if every is None:
+                break
+            time.sleep(every * 60)
+
+    # Inventory summary counters: importing the module registers the mapper events that keep them current
+    from .summary import rebuild_summary
+    @app.cli.command("rebuild-summary")
+    def rebuild_summary_command():
+        with app.app_context():
+            summary = rebuild_summary()
+            print(f"Inventory summary rebuilt: {summary.product_count} products, "
+                  f"{summary.total_units} units, {summary.low_stock_count} low stock.")
+
+    # Schema upgrades for databases created by older versions (see migrations.py)
+    from .migrations import migrate
+    @app.cli.command("migrate-db")
+    def migrate_db_command():
+        with app.app_context():
+            applied = migrate()
+        print(f"Applied: {', '.join(applied)}." if applied else "Database schema is up to date.")
+
+    # Bulk price changes from a CSV price list (sku,price)
+    from .pricing import update_prices, read_price_list
+    @app.cli.command("update-prices")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    def update_prices_command(path):
+        with app.app_context(), open(path, newline='', encoding='utf-8') as stream:
+            result = update_prices(read_price_list(stream))
+        print(f"Updated {result.updated} prices.")
+        if result.unknown_skus:
+            print(f"Unknown SKUs ({len(result.unknown_skus)}): {', '.join(result.unknown_skus[:20])}")
+
+    # Background job worker (see jobs.py)
+    from .jobs import run_worker
+    @app.cli.command("worker")
+    @click.option("--processes", type=int, default=None, help="Pool size; 0 runs jobs in this process.")
+    @click.option("--poll-interval", type=float, default=None, help="Seconds between queue checks when idle.")
+    @click.option("--once", is_flag=True, help="Exit once the queue is empty.")
+    def worker_command(processes, poll_interval, once):
+        processes = app.config.get('JOB_WORKER_PROCESSES', 2) if processes is None else processes
+        poll_interval = app.config.get('JOB_POLL_INTERVAL', 2) if poll_interval is None else poll_interval
+        print(f"Job worker started with {processes} process(es).")
+        run_worker(app, processes=processes, poll_interval=poll_interval, once=once,
+                   app_args=(config_name, config_overrides))
+
+    # Tiered storage of old inventory movements (see archive.py)
+    from .archive import archive_movements
+    @app.cli.command("archive-movements")
+    def archive_movements_command():
+        with app.app_context():
+            segments = archive_movements()
+            for segment in segments:
+                print(f"Archived {segment.row_count} movements of {segment.month:%Y-%m} to {segment.file_name}.")
+        if not segments:
+            print("Nothing to archive.")
+
+    # Sharded stock counters for hot products (see shards.py)
+    from .models import Product
+    from .shards import fold_stock_shards, shard_product, unshard_product
+    @app.cli.command("shard-stock")
+    @click.argument("sku")
+    @click.option("--shards", type=click.IntRange(min=2), default=None,
+                  help="Number of counter rows (default: STOCK_SHARDS).")
+    @click.option("--off", is_flag=True, help="Move the stock back into the product row.")
+    def shard_stock_command(sku, shards, off):
+        with app.app_context():
+            product = Product.query.filter_by(sku=sku).first()
+            if product is None:
+                raise click.ClickException(f"Unknown SKU: {sku}")
+            if off:
+                quantity = unshard_product(product.id)
+                db.session.commit()
+                print(f"{sku}: {quantity} units back in a single counter.")
+            else:
+                shards = shards or app.config.get('STOCK_SHARDS', 8)
+                quantity = shard_product(product.id, shards)
+                db.session.commit()
+                print(f"{sku}: {quantity} units split over {shards} counters.")
+
+    @app.cli.command("fold-stock-shards")
+    @click.option("--every", type=click.FloatRange(min=0.1), default=None,
+                  help="Keep running and fold every N seconds.")
+    def fold_stock_shards_command(every):
+        while True:
+            with app.app_context():
+                changed = fold_stock_shards()
+                db.session.commit()
+            if every is None:
+                print(f"Folded the shard totals of {changed} product(s).")
+                break
+            time.sleep(every)
+
+    # Deploy step: fill the shared template bytecode cache before the workers start
+    @app.cli.command("warmup")
+    def warmup_command():
+        timings = warm_up(app)
+        print(f"Compiled {timings['templates']} templates in {timings['templates_ms']} ms; "
+              f"opened {timings['connections']} database connection(s) in {timings['connect_ms']} ms.")
+
     return app
@@ -0,0 +1,219 @@
+# JSON API blueprint, registered under /api.
+# Uses the same session login as the HTML pages; unauthenticated or unauthorized calls get a
+# JSON error instead of the login redirect and flash message used by the main blueprint.
+# State-changing calls are CSRF protected: send the token in the X-CSRFToken header.
+
+from functools import wraps
+import hashlib
+
+from flask import Blueprint, jsonify, request, current_app, abort, url_for
+from flask_login import current_user
+from sqlalchemy import and_, or_, select
+
+from . import db
+from .models import Product, Job
+from .money import to_cents
+from .jobs import JOB_KINDS, enqueue_job as queue_job, job_params
+from .pagination import encode_cursor, decode_cursor, InvalidCursor
+from .stock import apply_batch
+from .summary import get_summary
+from .search import search_products
+from .facets import FACETS, facet_counts
+
+api = Blueprint('api', __name__)
+
+
+def api_login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return jsonify(error='Authentication required.'), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def api_admin_required(f):
+    @wraps(f)
+    @api_login_required
+    def decorated_function(*args, **kwargs):
+        if current_user.role != 'admin':
+            return jsonify(error='Admin role required.'), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+@api.route('/stock/batch', methods=['POST'])
+@api_admin_required
+def stock_batch():
+    """Apply a batch of stock adjustments.
+
+    Body: {"mode": "atomic" | "partial", "lines": [{"product_id" or "sku", "delta", "movement_type",
+    "reference_id", "notes"}, ...]}. Responds 200 when the batch was committed and 409 when an
+    atomic batch was rolled back; either way the body reports the outcome of every line.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('lines'), list):
+        return jsonify(error='Expected a JSON object with a "lines" list.'), 400
+    mode = payload.get('mode', 'atomic')
+    if mode not in ('atomic', 'partial'):
+        return jsonify(error='mode must be "atomic" or "partial".'), 400
+    max_lines = current_app.config.get('STOCK_BATCH_MAX_LINES', 1000)
+    if len(payload['lines']) > max_lines:
+        return jsonify(error=f'A batch can have at most {max_lines} lines.'), 413
+    result = apply_batch(payload['lines'], current_user.id, atomic=(mode == 'atomic'))
+    return jsonify(result.as_dict()), 200 if result.committed else 409
+
+
+def product_to_dict(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'description': product.description,
+        'sku': product.sku,
+        'category': product.category,
+        'supplier': product.supplier,
+        'quantity': product.quantity,
+        'reorder_point': product.reorder_point,
+        'low_stock': product.low_stock,
+        'price': float(product.price),
+        'price_cents': to_cents(product.price),
+        'date_added': product.date_added.isoformat() if product.date_added else None,
+        'last_updated': product.last_updated.isoformat() if product.last_updated else None,
+    }
+
+
+def _not_modified(etag, last_modified):
+    """True if the request's validators show the client already has this representation."""
+    if request.if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110, 13.2.2)
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def _conditional_response(etag, last_modified, build_body):
+    """Answer 304 if the client's copy is current, otherwise call build_body() and send it with validators."""
+    if _not_modified(etag, last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build_body())
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache' # Always revalidate; a 304 is cheap
+    return response
+
+
+@api.route('/products')
+@api_login_required
+def products():
+    """List products by name with keyset pagination (?limit=, ?cursor=).
+
+    The ETag is derived from the catalogue version kept in the summary row, so an unchanged
+    catalogue answers a conditional GET without running the listing query.
+    """
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    cursor = request.args.get('cursor')
+    summary = get_summary()
+    arguments = f'limit={limit}&cursor={cursor or ""}'
+    etag = f'products-v{summary.catalogue_version}-' + hashlib.sha1(arguments.encode('utf-8')).hexdigest()[:16]
+
+    def build_body():
+        query = Product.query
+        if cursor:
+            try:
+                last_name, last_id = decode_cursor(cursor, 2)
+            except InvalidCursor:
+                abort(400)
+            query = query.filter(Product.name >= last_name,
+                                 or_(Product.name > last_name, and_(Product.name == last_name, Product.id > last_id)))
+        items = query.order_by(Product.name, Product.id).limit(limit + 1).all()
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor(items[-1].name, items[-1].id)
+        return {'products': [product_to_dict(product) for product in items],
+                'next_cursor': next_cursor, 'total': summary.product_count}
+
+    return _conditional_response(etag, summary.catalogue_updated, build_body)
+
+
+@api.route('/products/<int:product_id>')
+@api_login_required
+def product_detail(product_id):
+    # Validators come from a primary-key lookup of last_updated; the full row is only loaded on a miss
+    last_updated = db.session.execute(select(Product.last_updated).where(Product.id == product_id)).first()
+    if last_updated is None:
+        return jsonify(error='Product not found.'), 404
+    last_updated = last_updated[0]
+    etag = f'product-{product_id}-{last_updated.isoformat() if last_updated else "0"}'
+    return _conditional_response(etag, last_updated, lambda: product_to_dict(db.session.get(Product, product_id)))
+
+
+@api.route('/products/search')
+@api_login_required
+def product_search():
+    """Type-ahead search: ?q= is matched as prefixes of the words in name, description, SKU, category and supplier."""
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    results = search_products(request.args.get('q', ''), limit=limit)
+    return jsonify(products=[{'id': product.id, 'name': product.name, 'sku': product.sku, 'quantity': product.quantity}
+                             for product in results])
+
+
+@api.route('/facets')
+@api_login_required
+def facets():
+    """Categories and suppliers in use with their product counts, for filter sidebars."""
+    summary = get_summary()
+    etag = f'facets-v{summary.catalogue_version}'
+    return _conditional_response(etag, summary.catalogue_updated, lambda: {
+        facet: [{'id': facet_id, 'name': name, 'count': count}
+                for facet_id, name, count in facet_counts(facet, summary.catalogue_version)]
+        for facet in FACETS})
+
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'params': job_params(job),
+        'status': job.status,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'error': job.error,
+        'result_name': job.result_name,
+        'result_size': job.result_size,
+        'download_url': url_for('main.job_download', job_id=job.id) if job.status == 'succeeded' else None,
+    }
+
+
+@api.route('/jobs/<kind>', methods=['POST'])
+@api_admin_required
+def enqueue_job(kind):
+    """Queue a background job; the JSON body holds its parameters. Poll /api/jobs/<id> for the outcome."""
+    job_kind = JOB_KINDS.get(kind)
+    if job_kind is None:
+        return jsonify(error='Unknown job kind.'), 404
+    payload = request.get_json(silent=True) or {}
+    if not isinstance(payload, dict):
+        return jsonify(error='Expected a JSON object.'), 400
+    try:
+        params = job_kind.parse_params(payload)
+    except ValueError as exc:
+        return jsonify(error=str(exc)), 400
+    job = queue_job(kind, params, user_id=current_user.id)
+    response = jsonify(job_to_dict(job))
+    response.status_code = 202
+    response.headers['Location'] = url_for('api.job_detail', job_id=job.id)
+    return response
+
+
+@api.route('/jobs/<int:job_id>')
+@api_login_required
+def job_detail(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None or (current_user.role != 'admin' and job.user_id != current_user.id):
+        return jsonify(error='Job not found.'), 404
+    return jsonify(job_to_dict(job))
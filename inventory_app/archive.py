@@ -0,0 +1,284 @@
+# Tiered storage of the inventory movement ledger.
+# `flask archive-movements` moves whole months of movements older than ARCHIVE_AFTER_DAYS out of
+# the live inventory_movement table into gzip NDJSON segment files in ARCHIVE_DIR. Each segment
+# gets a MovementArchiveSegment row (month, id and timestamp range) plus one MovementArchiveTotal
+# row per product with its net quantity change, so the hot table and its indexes only hold recent
+# history. Readers span both tiers: ledger pages and exports merge archived rows in on the same
+# (timestamp, id) order, and stock and reconciliation totals add the per-segment totals, opening
+# a file only when a query cuts through the middle of a segment.
+# Segment files are written once and never modified; the rows of recently read segments are kept
+# in a small per-process LRU.
+
+import datetime
+import gzip
+import heapq
+import json
+import os
+
+from flask import current_app
+from sqlalchemy import and_, delete, func, insert, select
+
+from . import db
+from .cache import LRUCache
+from .models import InventoryMovement, MovementArchiveSegment, MovementArchiveTotal
+
+ARCHIVED_FIELDS = ('id', 'timestamp', 'product_id', 'user_id', 'movement_type',
+                   'quantity_change', 'reference_id', 'notes')
+
+
+class ArchivedMovement:
+    """An archived ledger row, with the attributes templates read from an InventoryMovement."""
+    __slots__ = ARCHIVED_FIELDS + ('product', 'user')
+    archived = True
+
+    def __init__(self, row, product=None, user=None):
+        for field in ARCHIVED_FIELDS:
+            setattr(self, field, row[field])
+        self.product = product
+        self.user = user
+
+    def __repr__(self):
+        return f'<ArchivedMovement {self.id} {self.movement_type} for Product ID {self.product_id}>'
+
+
+def archive_dir():
+    directory = os.path.join(current_app.instance_path, current_app.config.get('ARCHIVE_DIR', 'archive'))
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def segment_path(segment):
+    return os.path.join(archive_dir(), segment.file_name)
+
+
+def get_segment_cache():
+    cache = current_app.extensions.get('archive_segment_cache')
+    if cache is None:
+        cache = current_app.extensions['archive_segment_cache'] = LRUCache(
+            max_size=current_app.config.get('ARCHIVE_SEGMENT_CACHE_SIZE', 4))
+    return cache
+
+
+def _encode(row):
+    return json.dumps({field: row[field].isoformat() if field == 'timestamp' else row[field]
+                       for field in ARCHIVED_FIELDS}, separators=(',', ':')) + '\n'
+
+
+def _decode(line):
+    row = json.loads(line)
+    row['timestamp'] = datetime.datetime.fromisoformat(row['timestamp'])
+    return row
+
+
+def iter_segment(segment):
+    """Yield the rows (dicts) of a segment oldest first, without caching them."""
+    with gzip.open(segment_path(segment), 'rt', encoding='utf-8') as stream:
+        for line in stream:
+            yield _decode(line)
+
+
+def segment_rows(segment):
+    """All rows of a segment, oldest first; shared between callers, so treat them as read-only."""
+    cache = get_segment_cache()
+    rows = cache.get(segment.file_name)
+    if rows is None:
+        rows = list(iter_segment(segment))
+        cache.set(segment.file_name, rows)
+    return rows
+
+
+def _month_start(value):
+    return datetime.datetime(value.year, value.month, 1)
+
+
+def _next_month(month):
+    return datetime.datetime(month.year + (month.month == 12), month.month % 12 + 1, 1)
+
+
+def archive_horizon(now=None):
+    """Movements before this moment are archived: the start of the month ARCHIVE_AFTER_DAYS ago."""
+    now = now or datetime.datetime.utcnow()
+    return _month_start(now - datetime.timedelta(days=current_app.config.get('ARCHIVE_AFTER_DAYS', 365)))
+
+
+def archive_movements(now=None):
+    """Move every whole month of live movements before archive_horizon() into archive segments.
+
+    Each month is written to its own file and then, in one transaction, recorded and deleted from
+    the live table. The newest live movement is never archived: SQLite hands out max(id) + 1 to
+    new rows, so keeping it guarantees archived ids are never reused. Returns the new segments.
+    """
+    horizon = archive_horizon(now)
+    movement_table = InventoryMovement.__table__
+    newest_id = db.session.execute(select(func.max(movement_table.c.id))).scalar()
+    if newest_id is None:
+        return []
+    archivable = (movement_table.c.timestamp < horizon, movement_table.c.id < newest_id)
+    oldest = db.session.execute(select(func.min(movement_table.c.timestamp)).where(*archivable)).scalar()
+    segments = []
+    month = _month_start(oldest) if oldest is not None else horizon
+    while month < horizon:
+        segment = _archive_month(month, _next_month(month), archivable)
+        if segment is not None:
+            segments.append(segment)
+        month = _next_month(month)
+    return segments
+
+
+def _archive_month(start, end, archivable):
+    movement_table = InventoryMovement.__table__
+    in_month = (*archivable, movement_table.c.timestamp >= start, movement_table.c.timestamp < end)
+    rows = db.session.execute(
+        select(*(movement_table.c[field] for field in ARCHIVED_FIELDS)).where(*in_month)
+        .order_by(movement_table.c.timestamp, movement_table.c.id)
+        .execution_options(yield_per=1000)).mappings()
+    partial = os.path.join(archive_dir(), f'movements-{start:%Y-%m}.part')
+    totals = {} # product id -> [quantity change, movement count]
+    count, first, last, first_id, last_id = 0, None, None, None, None
+    with gzip.open(partial, 'wt', encoding='utf-8') as stream:
+        for row in rows:
+            stream.write(_encode(row))
+            total = totals.setdefault(row['product_id'], [0, 0])
+            total[0] += row['quantity_change']
+            total[1] += 1
+            count += 1
+            first = first or row['timestamp']
+            last = row['timestamp']
+            first_id = row['id'] if first_id is None else min(first_id, row['id'])
+            last_id = row['id'] if last_id is None else max(last_id, row['id'])
+    if not count:
+        os.remove(partial)
+        db.session.rollback()
+        return None
+
+    file_name = f'movements-{start:%Y-%m}-{first_id}-{last_id}.ndjson.gz'
+    path = os.path.join(archive_dir(), file_name)
+    os.replace(partial, path)
+    try:
+        segment = MovementArchiveSegment(month=start.date(), file_name=file_name, row_count=count,
+                                         first_movement_id=first_id, last_movement_id=last_id,
+                                         first_timestamp=first, last_timestamp=last)
+        db.session.add(segment)
+        db.session.flush()
+        db.session.execute(insert(MovementArchiveTotal), [
+            {'segment_id': segment.id, 'product_id': product_id, 'quantity_change': change, 'movement_count': moved}
+            for product_id, (change, moved) in totals.items()])
+        deleted = db.session.execute(delete(movement_table).where(*in_month, movement_table.c.id <= last_id)).rowcount
+        if deleted != count:
+            raise RuntimeError(f'Archived {count} movements of {start:%Y-%m} but deleted {deleted}.')
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        os.remove(path)
+        raise
+    return segment
+
+
+def segments_query(start=None, end=None, product_ids=None):
+    """Segments that may hold movements in [start, end) for any of `product_ids`."""
+    query = MovementArchiveSegment.query
+    if start is not None:
+        query = query.filter(MovementArchiveSegment.last_timestamp >= start)
+    if end is not None:
+        query = query.filter(MovementArchiveSegment.first_timestamp < end)
+    if product_ids is not None:
+        query = query.filter(MovementArchiveSegment.id.in_(
+            select(MovementArchiveTotal.segment_id).where(MovementArchiveTotal.product_id.in_(product_ids))))
+    return query
+
+
+def latest_archived_id():
+    return db.session.execute(select(func.coalesce(func.max(MovementArchiveSegment.last_movement_id), 0))).scalar()
+
+
+def _matches(row, filters):
+    return (('product_ids' not in filters or row['product_id'] in filters['product_ids'])
+            and ('user_ids' not in filters or row['user_id'] in filters['user_ids'])
+            and ('movement_type' not in filters or row['movement_type'] == filters['movement_type'])
+            and ('start' not in filters or row['timestamp'] >= filters['start'])
+            and ('end' not in filters or row['timestamp'] < filters['end']))
+
+
+def archived_page(filters, before=None, limit=50):
+    """Up to `limit` archived rows matching the ledger `filters`, newest first.
+
+    `before` is an exclusive (timestamp, id) keyset bound. Segments are read newest first and only
+    until no remaining segment can hold a row newer than the ones already collected.
+    """
+    end = filters.get('end')
+    if before is not None and (end is None or before[0] < end):
+        end = before[0] + datetime.timedelta(microseconds=1)
+    segments = segments_query(filters.get('start'), end, filters.get('product_ids'))\
+        .order_by(MovementArchiveSegment.last_timestamp.desc(), MovementArchiveSegment.id.desc()).all()
+    found = []
+    for segment in segments:
+        if len(found) >= limit and segment.last_timestamp < found[limit - 1]['timestamp']:
+            break
+        for row in reversed(segment_rows(segment)):
+            key = (row['timestamp'], row['id'])
+            if before is not None and key >= tuple(before):
+                continue
+            if _matches(row, filters):
+                found.append(row)
+        found.sort(key=lambda row: (row['timestamp'], row['id']), reverse=True)
+        del found[limit:]
+    return found
+
+
+def archived_deltas(after_id=0, as_of=None):
+    """Net quantity change per product of the archived movements with id > after_id at or before as_of.
+
+    Segments entirely inside the window contribute their stored totals; only segments the window
+    cuts through are read.
+    """
+    deltas = {}
+    segment = MovementArchiveSegment
+    whole = [segment.first_movement_id > after_id]
+    if as_of is not None:
+        whole.append(segment.last_timestamp <= as_of)
+    totals = db.session.execute(
+        select(MovementArchiveTotal.product_id, func.sum(MovementArchiveTotal.quantity_change))
+        .join(segment, segment.id == MovementArchiveTotal.segment_id).where(*whole)
+        .group_by(MovementArchiveTotal.product_id)).all()
+    for product_id, change in totals:
+        deltas[product_id] = change
+    partial = segment.query.filter(segment.last_movement_id > after_id, ~and_(*whole))
+    if as_of is not None:
+        partial = partial.filter(segment.first_timestamp <= as_of)
+    for cut in partial:
+        for row in segment_rows(cut):
+            if row['id'] > after_id and (as_of is None or row['timestamp'] <= as_of):
+                deltas[row['product_id']] = deltas.get(row['product_id'], 0) + row['quantity_change']
+    return deltas
+
+
+def archived_totals_statement():
+    """SELECT of (product_id, total) with the net archived quantity change per product."""
+    return select(MovementArchiveTotal.product_id, func.sum(MovementArchiveTotal.quantity_change).label('total'))\
+        .group_by(MovementArchiveTotal.product_id)
+
+
+def archived_stream(since=None):
+    """Yield archived rows oldest first (by timestamp, id), optionally only those at or after `since`.
+
+    Segments whose time ranges overlap (a month archived in several runs) are merged; the others
+    are read one after another, so only a few files are open at a time.
+    """
+    query = segments_query(start=since)\
+        .order_by(MovementArchiveSegment.first_timestamp, MovementArchiveSegment.id)
+    group, group_end = [], None
+    for segment in query.all():
+        if group and segment.first_timestamp > group_end:
+            yield from _merge_segments(group, since)
+            group = []
+        group.append(segment)
+        group_end = max(group_end, segment.last_timestamp) if group_end else segment.last_timestamp
+    if group:
+        yield from _merge_segments(group, since)
+
+
+def _merge_segments(segments, since):
+    streams = [iter_segment(segment) for segment in segments]
+    for row in heapq.merge(*streams, key=lambda row: (row['timestamp'], row['id'])):
+        if since is None or row['timestamp'] >= since:
+            yield row
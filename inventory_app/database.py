@@ -0,0 +1,103 @@
+# Database engine profiles.
+# Engine options come from the config class: SQLITE_PRAGMAS are applied to every new SQLite
+# connection, DB_POOL_* size the connection pool of server databases. When a read replica is
+# configured (REPLICA_DATABASE_URI), code running inside use_replica() sends its SELECTs there;
+# flushes, DML and anything outside the block keep using the primary database.
+# The replica is not a Flask-SQLAlchemy bind: no model lives only there, and binds are
+# registered on the shared db object for every app.
+
+import contextlib
+
+import sqlalchemy as sa
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+_REPLICA_KEY = 'use_replica'
+
+
+def is_sqlite(uri):
+    return sa.engine.make_url(uri).get_backend_name() == 'sqlite'
+
+
+def engine_options(config, uri):
+    """SQLAlchemy create_engine() options for `uri` under `config`."""
+    options = {}
+    if is_sqlite(uri):
+        return options
+    for option, key in (('pool_size', 'DB_POOL_SIZE'), ('max_overflow', 'DB_MAX_OVERFLOW'),
+                        ('pool_timeout', 'DB_POOL_TIMEOUT'), ('pool_recycle', 'DB_POOL_RECYCLE')):
+        if config.get(key) is not None:
+            options[option] = config[key]
+    if config.get('DB_POOL_PRE_PING'):
+        options['pool_pre_ping'] = True
+    return options
+
+
+def configure_engine_options(app):
+    """Fill in engine options for the primary database. Call before db.init_app()."""
+    options = engine_options(app.config, app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**options, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+
+
+def create_replica_engine(app):
+    """Create the read replica engine if REPLICA_DATABASE_URI is set; stored in app.extensions."""
+    uri = app.config.get('REPLICA_DATABASE_URI')
+    if not uri:
+        return None
+    engine = sa.create_engine(uri, **engine_options(app.config, uri))
+    app.extensions['replica_engine'] = engine
+    return engine
+
+
+def get_replica_engine():
+    return current_app.extensions.get('replica_engine')
+
+
+def _pragma_listener(pragmas):
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+    return set_sqlite_pragmas
+
+
+def register_sqlite_pragmas(app, engines):
+    """Apply SQLITE_PRAGMAS to each new connection of the SQLite engines in `engines`."""
+    pragmas = dict(app.config.get('SQLITE_PRAGMAS') or {})
+    if not pragmas:
+        return
+    for engine in engines:
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', _pragma_listener(pragmas))
+
+
+class RoutingSession(Session):
+    """db.session class that sends reads to the replica engine inside use_replica()."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get(_REPLICA_KEY) and not self._flushing \
+                and getattr(clause, 'is_select', False):
+            replica = get_replica_engine()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextlib.contextmanager
+def use_replica(enabled=True):
+    """Route the SELECTs of db.session to the read replica (if configured) inside the block.
+
+    Rows read this way may lag behind the primary; use it for reports, not read-modify-write.
+    use_replica(False) forces the primary again inside an outer use_replica() block.
+    """
+    session = current_app.extensions['sqlalchemy'].session()
+    previous = session.info.get(_REPLICA_KEY, False)
+    session.info[_REPLICA_KEY] = enabled
+    try:
+        yield session
+    finally:
+        session.info[_REPLICA_KEY] = previous
@@ -0,0 +1,278 @@
+# Live product and stock change events, streamed to browsers over Server-Sent Events.
+# Product writes queue an event on the session (the Product mapper events cover ORM writes such as
+# add_product and edit_product; stock.py queues the Core quantity UPDATEs of add_stock, remove_stock
+# and batches), and the events are published only once the transaction commits. Several changes to
+# the same product in one transaction are coalesced into one event.
+# Publishing goes through the app's EventBroker: every open /events/stock connection holds one
+# bounded in-process queue, so an idle viewer costs a connection and no queries. With several
+# worker processes EVENTS_BACKEND='file' fans events out through an append-only NDJSON file in the
+# instance folder that every process tails (a local stand-in for a shared pub/sub service);
+# 'local' (the default) only reaches viewers connected to the same process.
+
+import collections
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from .models import Product
+
+try:
+    import fcntl
+except ImportError: # Windows: rotation then relies on the inode check alone
+    fcntl = None
+
+logger = logging.getLogger('inventory_app.events')
+
+_EVENTS_KEY = 'product_events'
+RECONNECT_MS = 3000 # Delay the browser waits before reconnecting a closed stream
+# When one transaction produces several events for a product, the strongest type wins
+_PRECEDENCE = {'stock.changed': 0, 'product.updated': 1, 'product.created': 2, 'product.deleted': 3}
+
+
+class Subscription:
+    """One viewer's bounded queue of pending events. Closed by the broker if the viewer falls behind."""
+
+    def __init__(self, max_size):
+        self.queue = queue.Queue(max_size)
+        self.closed = False
+
+    def get(self, timeout):
+        """Next event, or None after `timeout` seconds without one."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBroker:
+    """In-process fan-out of events to the open subscriptions, with a replay buffer for reconnects."""
+
+    def __init__(self, queue_size=100, buffer_size=1000):
+        self.queue_size = queue_size
+        self._subscriptions = set()
+        self._recent = collections.deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, last_event_id=None):
+        """Open a subscription; events newer than `last_event_id` still in the buffer are queued first."""
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            if last_event_id is not None:
+                for event in self._recent:
+                    if event['id'] > last_event_id:
+                        subscription.queue.put_nowait(event)
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscriptions)
+
+    def next_id(self):
+        return next(self._ids)
+
+    def publish(self, event):
+        """Publish an event (a dict with 'type' and 'data') to the subscribers of every process."""
+        self.deliver(dict(event, id=self.next_id()))
+
+    def deliver(self, event):
+        """Hand an event to this process's subscribers."""
+        with self._lock:
+            self._recent.append(event)
+            for subscription in list(self._subscriptions):
+                try:
+                    subscription.queue.put_nowait(event)
+                except queue.Full:
+                    # A stalled viewer must not hold events for everyone; it reconnects with Last-Event-ID
+                    subscription.closed = True
+                    self._subscriptions.discard(subscription)
+
+
+class FileEventBroker(EventBroker):
+    """EventBroker whose publish() appends to a shared file that every process tails.
+
+    Event ids are time-based (nanoseconds), so they stay comparable across processes.
+    """
+
+    def __init__(self, path, poll_interval=0.5, max_bytes=1024 * 1024, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.poll_interval = poll_interval
+        self.max_bytes = max_bytes
+        self._tailer = None
+        self._last_id = 0
+
+    def next_id(self):
+        with self._lock:
+            self._last_id = max(self._last_id + 1, time.time_ns())
+            return self._last_id
+
+    def subscribe(self, last_event_id=None):
+        self._start_tailer()
+        return super().subscribe(last_event_id)
+
+    def publish(self, event):
+        line = json.dumps(dict(event, id=self.next_id()), separators=(',', ':')) + '\n'
+        # Small O_APPEND writes from several processes do not interleave on a local file system
+        with open(self.path, 'a', encoding='utf-8') as stream:
+            stream.write(line)
+            stream.flush()
+            if stream.tell() > self.max_bytes:
+                self._rotate(stream)
+
+    def _rotate(self, stream):
+        """Move the full file (open as `stream`) to .1, unless another process already rotated it."""
+        if fcntl is not None:
+            fcntl.flock(stream.fileno(), fcntl.LOCK_EX) # Released when the stream is closed
+        try:
+            current = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        # Checked under the lock: a second rotation would replace the .1 that tailers are still reading
+        if current.st_ino == os.fstat(stream.fileno()).st_ino and current.st_size > self.max_bytes:
+            os.replace(self.path, self.path + '.1') # Tailers notice the new file and start reading it
+
+    def _start_tailer(self):
+        with self._lock:
+            if self._tailer is not None and self._tailer.is_alive(): # Threads do not survive a fork
+                return
+            self._tailer = threading.Thread(target=self._tail, name='event-tailer', daemon=True)
+            self._tailer.start()
+
+    def _tail(self):
+        stream, inode, first = None, None, True
+        while True:
+            try:
+                current = os.stat(self.path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current != inode:
+                if stream is not None:
+                    self._read_lines(stream) # Whatever was appended before the rotation
+                    stream.close()
+                stream, inode = (open(self.path, 'rb'), current) if current is not None else (None, None)
+                if stream is not None and first:
+                    stream.seek(0, os.SEEK_END) # Only events published from now on; files appearing later are read whole
+            first = False
+            if stream is not None:
+                self._read_lines(stream)
+            time.sleep(self.poll_interval)
+
+    def _read_lines(self, stream):
+        while True:
+            line = stream.readline()
+            if not line:
+                return
+            if not line.endswith(b'\n'): # Partial write; read it again on the next poll
+                stream.seek(-len(line), os.SEEK_CUR)
+                return
+            try:
+                self.deliver(json.loads(line))
+            except ValueError:
+                logger.warning('Skipping malformed event line: %r', line[:200])
+
+
+def get_event_broker():
+    broker = current_app.extensions.get('event_broker')
+    if broker is None:
+        config = current_app.config
+        options = dict(queue_size=config.get('EVENTS_QUEUE_SIZE', 100), buffer_size=config.get('EVENTS_BUFFER_SIZE', 1000))
+        if config.get('EVENTS_BACKEND', 'local') == 'file':
+            os.makedirs(current_app.instance_path, exist_ok=True)
+            broker = FileEventBroker(os.path.join(current_app.instance_path, config.get('EVENTS_FILE', 'events.ndjson')),
+                                     poll_interval=config.get('EVENTS_POLL_INTERVAL', 0.5), **options)
+        else:
+            broker = EventBroker(**options)
+        current_app.extensions['event_broker'] = broker
+    return broker
+
+
+def format_sse(event):
+    """Serialize an event in the text/event-stream wire format."""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], separators=(',', ':'))}\n\n"
+
+
+def event_stream(broker, subscription, heartbeat=15, max_duration=None):
+    """Yield the subscription's events as text/event-stream chunks until it ends.
+
+    A comment line goes out every `heartbeat` seconds without events so proxies keep the connection
+    open. The stream ends after `max_duration` seconds, or when the broker dropped a viewer that fell
+    behind; browsers then reconnect on their own and resume from Last-Event-ID.
+    """
+    deadline = time.monotonic() + max_duration if max_duration else None
+    try:
+        yield f'retry: {RECONNECT_MS}\n\n'
+        while True:
+            wait = heartbeat if deadline is None else max(0, min(heartbeat, deadline - time.monotonic()))
+            event = subscription.get(wait)
+            if event is not None:
+                yield format_sse(event)
+            elif subscription.closed:
+                return
+            else:
+                yield ': keepalive\n\n'
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def queue_product_event(session, event_type, product_id, **data):
+    """Publish a product event once `session` commits."""
+    events = session.info.setdefault(_EVENTS_KEY, {})
+    previous = events.get(product_id)
+    if previous is not None:
+        data = {**previous['data'], **data}
+        if _PRECEDENCE[previous['type']] > _PRECEDENCE[event_type]:
+            event_type = previous['type']
+    events[product_id] = {'type': event_type, 'data': dict(data, product_id=product_id)}
+
+
+def product_event_data(product):
+    return {'name': product.name, 'sku': product.sku, 'quantity': product.quantity,
+            'low_stock': bool(product.low_stock), 'price': str(product.price) if product.price is not None else None}
+
+
+@event.listens_for(Product, 'after_insert')
+def _product_inserted(mapper, connection, target):
+    queue_product_event(object_session(target), 'product.created', target.id, **product_event_data(target))
+
+
+@event.listens_for(Product, 'after_update')
+def _product_updated(mapper, connection, target):
+    queue_product_event(object_session(target), 'product.updated', target.id, **product_event_data(target))
+
+
+@event.listens_for(Product, 'after_delete')
+def _product_deleted(mapper, connection, target):
+    queue_product_event(object_session(target), 'product.deleted', target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_product_events(session):
+    events = session.info.pop(_EVENTS_KEY, None)
+    if events and has_app_context():
+        broker = get_event_broker()
+        for queued in events.values():
+            try:
+                broker.publish(queued)
+            except OSError: # The write is committed; a lost notification only delays the viewers
+                logger.exception('Could not publish %s event', queued['type'])
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_product_events(session, previous_transaction):
+    session.info.pop(_EVENTS_KEY, None)
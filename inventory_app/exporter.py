@@ -0,0 +1,123 @@
+# Streaming CSV/NDJSON export of the product catalogue and the movement history.
+# Rows are pulled with yield_per (a server-side cursor where the driver supports one) and written
+# out one at a time, so memory use does not depend on the size of the export. The movement export
+# merges the archived history (archive.py) in front of the live table in the same order.
+
+import csv
+import datetime
+import decimal
+import heapq
+import io
+import json
+
+from sqlalchemy import select
+
+from . import db
+from .archive import archived_stream
+from .models import Category, Product, InventoryMovement, Supplier, User
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+EXPORT_MIMETYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+YIELD_PER = 1000
+
+PRODUCT_COLUMNS = (
+    Product.id, Product.name, Product.description, Product.quantity, Product.price, Product.sku,
+    Category.name.label('category'), Supplier.name.label('supplier'),
+    Product.reorder_point, Product.date_added, Product.last_updated,
+)
+MOVEMENT_COLUMNS = (
+    InventoryMovement.id, InventoryMovement.timestamp, InventoryMovement.product_id,
+    Product.name.label('product_name'), Product.sku.label('product_sku'),
+    InventoryMovement.user_id, User.username,
+    InventoryMovement.movement_type, InventoryMovement.quantity_change,
+    InventoryMovement.reference_id, InventoryMovement.notes,
+)
+
+
+def parse_since(value):
+    """Parse an ISO date or datetime; returns None for empty values, raises ValueError if malformed."""
+    if not value:
+        return None
+    return datetime.datetime.fromisoformat(value)
+
+
+def _stream(statement):
+    result = db.session.execute(statement.execution_options(yield_per=YIELD_PER))
+    for row in result.mappings():
+        yield row
+
+
+def product_rows(since=None):
+    statement = select(*PRODUCT_COLUMNS)\
+        .outerjoin(Category, Product.category_id == Category.id)\
+        .outerjoin(Supplier, Product.supplier_id == Supplier.id)\
+        .order_by(Product.id)
+    if since is not None:
+        statement = statement.where(Product.last_updated >= since)
+    return _stream(statement)
+
+
+def movement_rows(since=None):
+    statement = select(*MOVEMENT_COLUMNS)\
+        .outerjoin(Product, InventoryMovement.product_id == Product.id)\
+        .outerjoin(User, InventoryMovement.user_id == User.id)\
+        .order_by(InventoryMovement.timestamp, InventoryMovement.id)
+    if since is not None:
+        statement = statement.where(InventoryMovement.timestamp >= since)
+    return heapq.merge(_archived_movement_rows(since), _stream(statement),
+                       key=lambda row: (row['timestamp'], row['id']))
+
+
+def _archived_movement_rows(since=None):
+    products = users = None
+    for row in archived_stream(since):
+        if products is None: # Names are looked up only when there is archived history to export
+            products = {product.id: product for product in db.session.execute(select(Product.id, Product.name, Product.sku))}
+            users = dict(db.session.execute(select(User.id, User.username)).all())
+        product = products.get(row['product_id'])
+        yield {**row, 'product_name': product.name if product else None,
+               'product_sku': product.sku if product else None, 'username': users.get(row['user_id'])}
+
+
+EXPORTS = {
+    'products': ([column.key for column in PRODUCT_COLUMNS], product_rows),
+    'movements': ([column.key for column in MOVEMENT_COLUMNS], movement_rows),
+}
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value) # Prices have two decimals, which a float's shortest repr preserves
+    raise TypeError(f'Cannot serialize {type(value).__name__}')
+
+
+def iter_csv(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([row[column].isoformat() if isinstance(row[column], datetime.datetime) else row[column]
+                         for column in columns])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # The header is flushed with the first row; an empty export still gets it.
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_ndjson(columns, rows):
+    for row in rows:
+        yield json.dumps({column: row[column] for column in columns}, default=_json_default) + '\n'
+
+
+def iter_export(kind, fmt, since=None):
+    """Yield the export `kind` ('products' or 'movements') as text chunks in format `fmt`."""
+    columns, rows = EXPORTS[kind]
+    if fmt == 'csv':
+        return iter_csv(columns, rows(since))
+    if fmt == 'ndjson':
+        return iter_ndjson(columns, rows(since))
+    raise ValueError(f'Unsupported export format: {fmt}')
@@ -0,0 +1,137 @@
+# Category and supplier lookup tables.
+# Products reference Category and Supplier rows by integer id; Product.category/.supplier still
+# read and assign plain text. Names assigned through the ORM are resolved to ids just before the
+# session flushes (one lookup per distinct name, creating missing rows), and bulk writers call
+# resolve_names() themselves. Names are matched case- and whitespace-insensitively (facet_key)
+# and never renamed in place, which is what lets the search index read them through a view.
+# Each lookup row carries product_count, the number of products using it, adjusted on the same
+# connection as every product write (like the inventory summary), so facet lists with counts
+# are a read of a few small rows. rebuild_facet_counts() recomputes them from the product table.
+
+from flask import current_app
+from sqlalchemy import event, func, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from . import db
+from .cache import LRUCache
+from .models import Category, Product, Supplier, facet_key, normalize_facet_name
+
+FACETS = {'category': Category, 'supplier': Supplier}
+
+
+def _insert_missing(connection, model, rows):
+    """INSERT rows that may already exist (a concurrent writer created them); existing keys are skipped."""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        connection.execute(insert(model), rows)
+        return
+    connection.execute(dialect_insert(model).on_conflict_do_nothing(index_elements=['key']), rows)
+
+
+def resolve_names(connection, model, names):
+    """Return {name: id} for the given category or supplier names, creating the missing rows.
+
+    Blank names are left out. Names differing only in case or spacing map to the same row; a new
+    row takes the spelling of the first of them.
+    """
+    names = [name for name in names if normalize_facet_name(name) is not None]
+    if not names:
+        return {}
+    wanted = {}
+    for name in names:
+        wanted.setdefault(facet_key(name), normalize_facet_name(name))
+    found = dict(connection.execute(select(model.key, model.id).where(model.key.in_(wanted))).all())
+    missing = [{'key': key, 'name': name, 'product_count': 0} for key, name in wanted.items() if key not in found]
+    if missing:
+        _insert_missing(connection, model, missing)
+        found.update(connection.execute(
+            select(model.key, model.id).where(model.key.in_([row['key'] for row in missing]))).all())
+    return {name: found[facet_key(name)] for name in names}
+
+
+def apply_count_deltas(connection, model, deltas):
+    """Add {id: delta} to the product_count of the given lookup rows."""
+    for facet_id, delta in deltas.items():
+        if facet_id is not None and delta:
+            connection.execute(update(model).where(model.id == facet_id)
+                               .values(product_count=model.product_count + delta))
+
+
+def rebuild_facet_counts():
+    """Recompute every product_count from the product table. Does not commit."""
+    for facet, model in FACETS.items():
+        column = getattr(Product, f'{facet}_id')
+        counts = select(func.count(Product.id)).where(column == model.id).scalar_subquery()
+        db.session.execute(update(model).values(product_count=counts))
+
+
+def get_facet_cache():
+    cache = current_app.extensions.get('facet_cache')
+    if cache is None:
+        cache = current_app.extensions['facet_cache'] = LRUCache(max_size=8)
+    return cache
+
+
+def facet_counts(facet, version=None):
+    """[(id, name, product count)] of the categories or suppliers in use, by name.
+
+    With a catalogue `version` the list is cached until the next product write.
+    """
+    model = FACETS[facet]
+    if version is not None:
+        rows = get_facet_cache().get((facet, version))
+        if rows is not None:
+            return rows
+    rows = [tuple(row) for row in db.session.execute(
+        select(model.id, model.name, model.product_count).where(model.product_count > 0).order_by(model.name))]
+    if version is not None:
+        get_facet_cache().set((facet, version), rows)
+    return rows
+
+
+@event.listens_for(Session, 'before_flush')
+def _resolve_pending_names(session, flush_context, instances):
+    pending = [product for product in list(session.new) + list(session.dirty)
+               if isinstance(product, Product) and product.__dict__.get('pending_facets')]
+    if not pending:
+        return
+    connection = session.connection()
+    for facet, model in FACETS.items():
+        names = [product.pending_facets[facet] for product in pending if facet in product.pending_facets]
+        ids = resolve_names(connection, model, names)
+        for product in pending:
+            if facet in product.pending_facets:
+                setattr(product, f'{facet}_ref', session.get(model, ids[product.pending_facets.pop(facet)]))
+
+
+def _id_change(target, attribute):
+    history = inspect(target).attrs[attribute].history
+    if not history.has_changes():
+        return None, None
+    return (history.deleted[0] if history.deleted else None), getattr(target, attribute)
+
+
+@event.listens_for(Product, 'after_insert')
+def _product_inserted(mapper, connection, target):
+    for facet, model in FACETS.items():
+        apply_count_deltas(connection, model, {getattr(target, f'{facet}_id'): 1})
+
+
+@event.listens_for(Product, 'after_update')
+def _product_updated(mapper, connection, target):
+    for facet, model in FACETS.items():
+        old, new = _id_change(target, f'{facet}_id')
+        if old != new:
+            apply_count_deltas(connection, model, {old: -1, new: 1})
+
+
+@event.listens_for(Product, 'after_delete')
+def _product_deleted(mapper, connection, target):
+    for facet, model in FACETS.items():
+        history = inspect(target).attrs[f'{facet}_id'].history
+        facet_id = history.deleted[0] if history.deleted else getattr(target, f'{facet}_id')
+        apply_count_deltas(connection, model, {facet_id: -1})
@@ -0,0 +1,192 @@
+# Demand forecast and reorder suggestions from the sales in the movement ledger.
+# Daily sales per product over the last FORECAST_WINDOW_DAYS whole days (live and archived) are
+# summed in SQL and scattered into one product x day numpy matrix. The moving-average daily
+# demand and its day-to-day standard deviation are then computed for every product at once.
+# History ends at midnight UTC, so those statistics only change once a day. They are cached
+# per day, in memory and as an .npz file in FORECAST_CACHE_DIR shared by every worker. Each
+# report combines the cached statistics with the current quantities, which is one product query.
+#
+# Suggested order = demand over (lead time + review period) + safety stock - quantity on hand,
+# with safety stock = FORECAST_SERVICE_FACTOR x std x sqrt(lead time + review period).
+
+import datetime
+import glob
+import os
+import threading
+import zipfile
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from . import db
+from .archive import archived_stream
+from .cache import LRUCache
+from .database import use_replica
+from .models import InventoryMovement, Product
+from .shards import live_quantity
+
+try:
+    import numpy
+except ImportError: # Optional dependency; the forecast reports say so instead of failing
+    numpy = None
+
+SALE = 'sale'
+
+
+class ForecastUnavailable(RuntimeError):
+    pass
+
+
+class DemandHistory:
+    """Daily demand statistics per product for the `window` days before `end` (a date, exclusive)."""
+
+    def __init__(self, end, window, product_ids, mean, std):
+        self.end = end
+        self.window = window
+        self.product_ids = product_ids # Sorted int64 array
+        self.mean = mean
+        self.std = std
+
+    def lookup(self, product_ids):
+        """(mean, std) arrays aligned with `product_ids`; products without history get zeros."""
+        if not len(self.product_ids):
+            return numpy.zeros(len(product_ids)), numpy.zeros(len(product_ids))
+        positions = numpy.minimum(numpy.searchsorted(self.product_ids, product_ids), len(self.product_ids) - 1)
+        found = self.product_ids[positions] == product_ids
+        return numpy.where(found, self.mean[positions], 0.0), numpy.where(found, self.std[positions], 0.0)
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ForecastUnavailable('The demand forecast requires numpy (pip install numpy).')
+
+
+def _daily_sales(start, end):
+    """(product ids, days, units) of the sales in [start, end) aggregated per product and day."""
+    day = func.date(InventoryMovement.timestamp)
+    rows = db.session.execute(
+        select(InventoryMovement.product_id, day, -func.sum(InventoryMovement.quantity_change))
+        .where(InventoryMovement.movement_type == SALE,
+               InventoryMovement.timestamp >= start, InventoryMovement.timestamp < end)
+        .group_by(InventoryMovement.product_id, day)).all()
+    product_ids = [row[0] for row in rows]
+    days = [row[1] for row in rows]
+    units = [row[2] for row in rows]
+    for row in archived_stream(since=start):
+        if row['timestamp'] >= end:
+            break
+        if row['movement_type'] == SALE:
+            product_ids.append(row['product_id'])
+            days.append(row['timestamp'].date())
+            units.append(-row['quantity_change'])
+    return (numpy.array(product_ids, dtype=numpy.int64), numpy.array(days, dtype='datetime64[D]'),
+            numpy.array(units, dtype=numpy.float32))
+
+
+def compute_demand(end, window):
+    """Build the product x day sales matrix for the `window` days before `end` and summarize it."""
+    _require_numpy()
+    start = end - datetime.timedelta(days=window)
+    product_ids = numpy.array(db.session.execute(select(Product.id).order_by(Product.id)).scalars().all(),
+                              dtype=numpy.int64)
+    sold_ids, days, units = _daily_sales(datetime.datetime.combine(start, datetime.time()),
+                                         datetime.datetime.combine(end, datetime.time()))
+    matrix = numpy.zeros((len(product_ids), window), dtype=numpy.float32)
+    if len(product_ids) and len(sold_ids):
+        rows = numpy.minimum(numpy.searchsorted(product_ids, sold_ids), len(product_ids) - 1)
+        known = product_ids[rows] == sold_ids # Sales of deleted products are dropped
+        columns = (days - numpy.datetime64(start, 'D')).astype(numpy.int64)
+        numpy.add.at(matrix, (rows[known], columns[known]), units[known])
+    return DemandHistory(end, window, product_ids, matrix.mean(axis=1, dtype=numpy.float64),
+                         matrix.std(axis=1, dtype=numpy.float64))
+
+
+def forecast_cache_dir():
+    directory = os.path.join(current_app.instance_path, current_app.config.get('FORECAST_CACHE_DIR', 'forecast'))
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def get_forecast_cache():
+    cache = current_app.extensions.get('forecast_cache')
+    if cache is None:
+        cache = current_app.extensions['forecast_cache'] = LRUCache(
+            max_size=current_app.config.get('FORECAST_CACHE_SIZE', 2))
+    return cache
+
+
+def _load_history(path, end, window):
+    try:
+        with numpy.load(path) as data:
+            return DemandHistory(end, window, data['product_ids'], data['mean'], data['std'])
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+
+def _save_history(path, history):
+    # Each writer gets its own temporary file, so one worker never moves another's half-written
+    # file into place (numpy.savez appends .npz to names without it)
+    partial = f'{path}.{os.getpid()}.{threading.get_ident()}.part.npz'
+    numpy.savez(partial, product_ids=history.product_ids, mean=history.mean, std=history.std)
+    os.replace(partial, path)
+    for stale in glob.glob(os.path.join(os.path.dirname(path), 'demand-*.npz')):
+        if stale != path and not stale.endswith('.part.npz'):
+            try:
+                os.remove(stale)
+            except FileNotFoundError: # Another worker cleaned it up first
+                pass
+
+
+def demand_history(today=None):
+    """Demand statistics for the FORECAST_WINDOW_DAYS whole days before `today` (UTC), cached per day."""
+    _require_numpy()
+    end = today or datetime.datetime.utcnow().date()
+    window = current_app.config.get('FORECAST_WINDOW_DAYS', 90)
+    key = (end, window)
+    cache = get_forecast_cache()
+    history = cache.get(key)
+    if history is None:
+        path = os.path.join(forecast_cache_dir(), f'demand-{end.isoformat()}-{window}d.npz')
+        history = _load_history(path, end, window) if os.path.exists(path) else None
+        if history is None:
+            with use_replica():
+                history = compute_demand(end, window)
+            _save_history(path, history)
+        cache.set(key, history)
+    return history
+
+
+def reorder_suggestions(today=None, limit=None, only_selling=True):
+    """Rows (dicts) with each product's demand, days of cover and suggested order, most urgent first.
+
+    Days of cover is None for products without demand. With `only_selling` products that sold
+    nothing in the window are left out.
+    """
+    history = demand_history(today)
+    config = current_app.config
+    horizon = config.get('FORECAST_LEAD_TIME_DAYS', 7) + config.get('FORECAST_REVIEW_DAYS', 14)
+    with use_replica():
+        # Shard totals for sharded products: their Product.quantity is only as of the last fold
+        products = db.session.execute(select(Product.id, Product.name, Product.sku,
+                                             live_quantity().label('quantity'))
+                                      .order_by(Product.id)).all()
+    if not products:
+        return []
+    ids = numpy.array([row.id for row in products], dtype=numpy.int64)
+    quantity = numpy.array([row.quantity for row in products], dtype=numpy.float64)
+    demand, deviation = history.lookup(ids)
+    safety_stock = config.get('FORECAST_SERVICE_FACTOR', 1.65) * deviation * numpy.sqrt(horizon)
+    suggested = numpy.ceil(numpy.maximum(demand * horizon + safety_stock - quantity, 0)).astype(numpy.int64)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        cover = numpy.where(demand > 0, quantity / demand, numpy.inf)
+
+    order = numpy.lexsort((-demand, cover)) # Fewest days of cover first, then highest demand
+    if only_selling:
+        order = order[demand[order] > 0]
+    if limit is not None:
+        order = order[:limit]
+    return [{'product_id': int(ids[i]), 'name': products[i].name, 'sku': products[i].sku,
+             'quantity': int(quantity[i]), 'daily_demand': round(float(demand[i]), 2),
+             'days_of_cover': round(float(cover[i]), 1) if numpy.isfinite(cover[i]) else None,
+             'suggested_order': int(suggested[i])}
+            for i in order.tolist()]
@@ -1,7 +1,33 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField, BooleanField, SelectField
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from wtforms import StringField, PasswordField, SubmitField, BooleanField, SelectField, TextAreaField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError
 from .models import User # Corrected: Relative import
+from .money import cents_to_decimal, to_cents
+import decimal
+
+# Product field rules, shared by ProductForm and the bulk importer (inventory_app.importer)
+PRODUCT_NAME_MIN_LENGTH = 2
+PRODUCT_FIELD_MAX_LENGTHS = {'name': 100, 'description': 500, 'sku': 50, 'category': 100, 'supplier': 100}
+
+def parse_quantity(value):
+    try:
+        val = int(value)
+    except (TypeError, ValueError):
+        raise ValidationError('Invalid quantity. Must be a whole number.')
+    if val < 0:
+        raise ValidationError('Quantity cannot be negative.')
+    return val
+
+def parse_price(value):
+    """Return the price as a Decimal rounded to cents."""
+    try:
+        val = cents_to_decimal(to_cents(str(value).strip()))
+    except (TypeError, ValueError, decimal.InvalidOperation):
+        raise ValidationError('Invalid price. Must be a number.')
+    if val < 0:
+        raise ValidationError('Price cannot be negative.')
+    return val
 
 class RegistrationForm(FlaskForm):
     username = StringField('Username',
@@ -34,30 +60,30 @@ class LoginForm(FlaskForm):
     submit = SubmitField('Login')
 
 class ProductForm(FlaskForm):
-    name = StringField('Product Name', validators=[DataRequired(), Length(min=2, max=100)])
-    description = StringField('Description', validators=[Length(max=500)]) # Using StringField for simple textarea
+    name = StringField('Product Name', validators=[DataRequired(), Length(min=PRODUCT_NAME_MIN_LENGTH, max=PRODUCT_FIELD_MAX_LENGTHS['name'])])
+    description = StringField('Description', validators=[Length(max=PRODUCT_FIELD_MAX_LENGTHS['description'])]) # Using StringField for simple textarea
     quantity = StringField('Quantity', validators=[DataRequired()]) # Use StringField to accept 0, then convert
     price = StringField('Price', validators=[DataRequired()]) # Use StringField, then convert
-    sku = StringField('SKU (Stock Keeping Unit)', validators=[Length(max=50)])
-    category = StringField('Category', validators=[Length(max=100)])
-    supplier = StringField('Supplier', validators=[Length(max=100)])
+    sku = StringField('SKU (Stock Keeping Unit)', validators=[Length(max=PRODUCT_FIELD_MAX_LENGTHS['sku'])])
+    category = StringField('Category', validators=[Length(max=PRODUCT_FIELD_MAX_LENGTHS['category'])])
+    supplier = StringField('Supplier', validators=[Length(max=PRODUCT_FIELD_MAX_LENGTHS['supplier'])])
+    reorder_point = StringField('Reorder Point (blank = default low stock threshold)') # Optional, converted like quantity
     submit = SubmitField('Save Product')
 
     def validate_quantity(self, quantity):
-        try:
-            val = int(quantity.data)
-            if val < 0:
-                raise ValidationError('Quantity cannot be negative.')
-        except ValueError:
-            raise ValidationError('Invalid quantity. Must be a whole number.')
+        parse_quantity(quantity.data)
+
+    def validate_reorder_point(self, reorder_point):
+        if reorder_point.data not in (None, ''):
+            parse_quantity(reorder_point.data)
 
     def validate_price(self, price):
-        try:
-            val = float(price.data)
-            if val < 0:
-                raise ValidationError('Price cannot be negative.')
-        except ValueError:
-            raise ValidationError('Invalid price. Must be a number.')
+        parse_price(price.data)
+
+class ImportProductsForm(FlaskForm):
+    file = FileField('Products file (CSV or NDJSON)', validators=[
+        FileRequired(), FileAllowed(['csv', 'ndjson', 'jsonl'], 'Only CSV or NDJSON files are accepted.')])
+    submit = SubmitField('Import Products')
 
 class StockAdjustmentForm(FlaskForm):
     quantity_change = StringField('Quantity Change', validators=[DataRequired()])
@@ -117,3 +143,12 @@ class RemoveStockForm(FlaskForm):
                 raise ValidationError('Quantity to remove must be a positive number.')
         except ValueError:
             raise ValidationError('Invalid quantity. Must be a whole number.')
+
+class BatchStockAdjustmentForm(FlaskForm):
+    # One adjustment per line: SKU (or #product_id), quantity change, movement type[, reference ID]
+    lines = TextAreaField('Adjustment lines', validators=[DataRequired()])
+    mode = SelectField('If a line fails', choices=[
+        ('atomic', 'Reject the whole batch'),
+        ('partial', 'Apply the remaining lines')
+    ], default='atomic', validators=[DataRequired()])
+    submit = SubmitField('Apply Batch')
@@ -0,0 +1,72 @@
+# Cache of rendered template fragments.
+# Product table rows are cached under (product id, last_updated, viewer role) through the
+# cache_fragment call block; report bodies under the catalogue version kept in the summary row
+# plus the request arguments (until the summary row exists they are rendered uncached). Every
+# product write path already moves last_updated or the catalogue version forward, so an outdated
+# entry is never looked up again and just ages out of the LRU (FRAGMENT_CACHE_SIZE entries per
+# process). Username changes, which the movement report shows but which touch neither, clear the
+# whole cache.
+# Fragments are shared between users: forms inside them must use fragment_csrf_token(), whose
+# marker is replaced with the current user's token each time the fragment is served.
+
+from flask import current_app, has_app_context
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+from markupsafe import Markup
+from sqlalchemy import event
+
+from .cache import LRUCache
+from .models import User
+
+CSRF_MARKER = '__fragment_csrf_token__'
+
+
+def get_fragment_cache():
+    cache = current_app.extensions.get('fragment_cache')
+    if cache is None:
+        cache = current_app.extensions['fragment_cache'] = LRUCache(
+            max_size=current_app.config.get('FRAGMENT_CACHE_SIZE', 2000))
+    return cache
+
+
+def viewer_role():
+    return current_user.role if current_user.is_authenticated else None
+
+
+def cached_fragment(key, render):
+    """Return the fragment cached under `key` (plus the viewer's role), calling `render()` on a miss.
+
+    A key with a None part (no version known yet) is rendered without touching the cache.
+    """
+    if any(part is None for part in key):
+        html = str(render())
+    else:
+        cache = get_fragment_cache()
+        key = (*key, viewer_role())
+        html = cache.get(key)
+        if html is None:
+            html = str(render())
+            cache.set(key, html)
+    if CSRF_MARKER in html:
+        html = html.replace(CSRF_MARKER, generate_csrf())
+    return Markup(html)
+
+
+def cache_fragment(*key, caller):
+    """Jinja call block: {% call cache_fragment('product_row', product.id, product.last_updated) %}...{% endcall %}"""
+    return cached_fragment(key, caller)
+
+
+def fragment_csrf_token():
+    return CSRF_MARKER
+
+
+def init_fragment_cache(app):
+    app.jinja_env.globals.update(cache_fragment=cache_fragment, fragment_csrf_token=fragment_csrf_token)
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    if has_app_context():
+        get_fragment_cache().clear()
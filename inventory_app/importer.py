@@ -0,0 +1,186 @@
+# Bulk product import from CSV or NDJSON.
+# Files are read row by row, validated with the same rules as ProductForm and written in chunks:
+# one uniqueness lookup for names and one for SKUs per chunk, one bulk INSERT for the products,
+# one for their initial_stock movements, a summary counter update and a commit. Category and
+# supplier names are resolved to their lookup rows once per chunk (facets.py).
+
+import csv
+import io
+import json
+
+from flask import current_app
+from sqlalchemy import insert, select
+from wtforms.validators import ValidationError
+
+from . import db
+from .forms import PRODUCT_NAME_MIN_LENGTH, PRODUCT_FIELD_MAX_LENGTHS, parse_quantity, parse_price
+from .models import Category, Product, InventoryMovement, Supplier
+from . import facets, summary
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+MAX_REPORTED_ERRORS = 100 # Rows beyond this are still counted, just not itemized
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.rejected = 0
+        self.errors = [] # (line number, message), capped at MAX_REPORTED_ERRORS
+
+    def reject(self, line_no, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_no, message))
+
+
+def detect_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension in ('ndjson', 'jsonl'):
+        return 'ndjson'
+    if extension == 'csv':
+        return 'csv'
+    raise ValueError(f'Cannot tell the format of {filename!r}; use a .csv or .ndjson file.')
+
+
+def iter_rows(stream, fmt):
+    """Yield (line number, row dict) from a text stream without reading it all into memory."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'ndjson':
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_no, None
+                continue
+            yield line_no, row if isinstance(row, dict) else None
+    else:
+        raise ValueError(f'Unsupported import format: {fmt}')
+
+
+def _text(row, field):
+    value = row.get(field)
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def validate_row(row):
+    """Return the column values for a product row, raising ValidationError like ProductForm would."""
+    if row is None:
+        raise ValidationError('Row is not a valid record.')
+    values = {field: _text(row, field) for field in PRODUCT_FIELD_MAX_LENGTHS}
+    if not values['name']:
+        raise ValidationError('Product name is required.')
+    if len(values['name']) < PRODUCT_NAME_MIN_LENGTH:
+        raise ValidationError(f'Product name must be at least {PRODUCT_NAME_MIN_LENGTH} characters long.')
+    for field, max_length in PRODUCT_FIELD_MAX_LENGTHS.items():
+        if len(values[field]) > max_length:
+            raise ValidationError(f'{field} cannot be longer than {max_length} characters.')
+    if _text(row, 'quantity') == '' or _text(row, 'price') == '':
+        raise ValidationError('Quantity and price are required.')
+    values['quantity'] = parse_quantity(_text(row, 'quantity'))
+    values['price'] = parse_price(_text(row, 'price'))
+    values['reorder_point'] = parse_quantity(_text(row, 'reorder_point')) if _text(row, 'reorder_point') else None
+    values['sku'] = values['sku'] or None
+    return values
+
+
+def _write_chunk(chunk, user_id, result):
+    names = [values['name'] for _, values in chunk]
+    skus = [values['sku'] for _, values in chunk if values['sku']]
+    taken_names = {name for (name,) in db.session.query(Product.name).filter(Product.name.in_(names))}
+    taken_skus = {sku for (sku,) in db.session.query(Product.sku).filter(Product.sku.in_(skus))} if skus else set()
+
+    rows = []
+    for line_no, values in chunk:
+        if values['name'] in taken_names:
+            result.reject(line_no, f"Product name already exists: {values['name']}")
+        elif values['sku'] in taken_skus:
+            result.reject(line_no, f"Product SKU already exists: {values['sku']}")
+        else:
+            rows.append(values)
+    if not rows:
+        return
+
+    # Bulk statements bypass the Product mapper events, so the low-stock flag and the summary are set here.
+    threshold = summary.low_stock_threshold()
+    for values in rows:
+        values['low_stock'] = summary.is_low_stock(values['quantity'], threshold, values['reorder_point'])
+    connection = db.session.connection()
+    for facet, model in (('category', Category), ('supplier', Supplier)):
+        ids = facets.resolve_names(connection, model, [values[facet] for values in rows])
+        counts = {}
+        for values in rows:
+            facet_id = values[f'{facet}_id'] = ids.get(values.pop(facet))
+            counts[facet_id] = counts.get(facet_id, 0) + 1
+        facets.apply_count_deltas(connection, model, counts)
+
+    # render_nulls keeps rows with and without a SKU in a single executemany
+    statement = insert(Product).execution_options(render_nulls=True)
+    if db.session.get_bind().dialect.insert_returning:
+        inserted = db.session.execute(statement.returning(Product.id, Product.name), rows)
+    else: # MySQL/MariaDB: names are unique, so one query finds the new ids
+        db.session.execute(statement, rows)
+        inserted = db.session.execute(select(Product.id, Product.name)
+                                      .where(Product.name.in_([values['name'] for values in rows])))
+    ids_by_name = {name: product_id for product_id, name in inserted}
+    movements = [dict(product_id=ids_by_name[values['name']], user_id=user_id,
+                      quantity_change=values['quantity'], movement_type='initial_stock',
+                      notes='Product imported with initial stock.')
+                 for values in rows if values['quantity'] > 0]
+    if movements:
+        db.session.execute(insert(InventoryMovement), movements)
+
+    summary.apply_delta(db.session.connection(),
+                        product_count=len(rows),
+                        total_units=sum(values['quantity'] for values in rows),
+                        low_stock_count=sum(1 for values in rows if values['low_stock']))
+    for values in rows:
+        if values['low_stock']:
+            summary.queue_low_stock_change(db.session(), ids_by_name[values['name']], True)
+    db.session.commit()
+    result.created += len(rows)
+
+
+def import_products(stream, fmt, user_id, chunk_size=None):
+    """Import products from a text stream. Each chunk is committed on its own.
+
+    Invalid rows and rows whose name or SKU is already taken (in the database or earlier in the
+    file) are rejected and reported; the rest of the file is still imported.
+    """
+    chunk_size = chunk_size or current_app.config.get('IMPORT_CHUNK_SIZE', 1000)
+    result = ImportResult()
+    seen_names, seen_skus = set(), set()
+    chunk = []
+    for line_no, row in iter_rows(stream, fmt):
+        try:
+            values = validate_row(row)
+        except ValidationError as exc:
+            result.reject(line_no, str(exc))
+            continue
+        if values['name'] in seen_names:
+            result.reject(line_no, f"Duplicate product name in file: {values['name']}")
+            continue
+        if values['sku'] and values['sku'] in seen_skus:
+            result.reject(line_no, f"Duplicate product SKU in file: {values['sku']}")
+            continue
+        seen_names.add(values['name'])
+        if values['sku']:
+            seen_skus.add(values['sku'])
+        chunk.append((line_no, values))
+        if len(chunk) >= chunk_size:
+            _write_chunk(chunk, user_id, result)
+            chunk = []
+    if chunk:
+        _write_chunk(chunk, user_id, result)
+    return result
+
+
+def open_text_stream(binary_stream):
+    # utf-8-sig strips the byte order mark spreadsheet tools like to prepend
+    return io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
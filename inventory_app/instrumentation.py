@@ -0,0 +1,137 @@
+# Opt-in request instrumentation (INSTRUMENTATION_ENABLED).
+# For every request it records the number of SQL statements and the time spent in them (engine
+# cursor events), template render time and total handler time. The figures are sent back in a
+# Server-Timing header, written as one JSON log line to the 'inventory_app.requests' logger and
+# added to a rolling per-endpoint window used by the admin performance page. Statements slower
+# than SLOW_QUERY_THRESHOLD_MS are logged to 'inventory_app.slow_queries' with their endpoint.
+# Times for streamed responses (exports) stop when the handler returns, before the body is sent.
+
+import collections
+import json
+import logging
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+
+request_logger = logging.getLogger('inventory_app.requests')
+slow_query_logger = logging.getLogger('inventory_app.slow_queries')
+
+
+class RequestStats:
+    """Rolling window of the most recent request timings for each endpoint."""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._samples = {} # endpoint -> deque of (total ms, db ms, statement count)
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, total_ms, db_ms, statements):
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None:
+                samples = self._samples[endpoint] = collections.deque(maxlen=self.window)
+            samples.append((total_ms, db_ms, statements))
+
+    def summary(self):
+        """Return one dict per endpoint with the sample count, p50/p95/p99 and mean DB figures."""
+        with self._lock:
+            snapshot = {endpoint: list(samples) for endpoint, samples in self._samples.items()}
+        rows = []
+        for endpoint, samples in sorted(snapshot.items()):
+            totals = sorted(sample[0] for sample in samples)
+            rows.append({
+                'endpoint': endpoint,
+                'count': len(samples),
+                'p50': percentile(totals, 50),
+                'p95': percentile(totals, 95),
+                'p99': percentile(totals, 99),
+                'mean_db_ms': sum(sample[1] for sample in samples) / len(samples),
+                'mean_statements': sum(sample[2] for sample in samples) / len(samples),
+            })
+        return rows
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    rank = max(1, -(-len(sorted_values) * pct // 100)) # ceil without floats
+    return sorted_values[int(rank) - 1]
+
+
+def get_request_stats():
+    return current_app.extensions.get('request_stats')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info['query_start'].pop()) * 1000
+    if not has_request_context() or 'perf' not in g:
+        return
+    g.perf['statements'] += 1
+    g.perf['db_ms'] += elapsed_ms
+    if elapsed_ms >= current_app.config.get('SLOW_QUERY_THRESHOLD_MS', 200):
+        slow_query_logger.warning(json.dumps({
+            'endpoint': request.endpoint, 'path': request.path,
+            'duration_ms': round(elapsed_ms, 2), 'statement': statement,
+        }))
+
+
+def _cursor_error(exception_context):
+    # after_cursor_execute does not run for failed statements; drop their start time
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('query_start'):
+        connection.info['query_start'].pop()
+
+
+def _before_render(sender, template, context, **extra):
+    if 'perf' in g:
+        g.perf['render_start'].append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    if 'perf' in g and g.perf['render_start']:
+        g.perf['template_ms'] += (time.perf_counter() - g.perf['render_start'].pop()) * 1000
+
+
+def _start_request():
+    g.perf = {'start': time.perf_counter(), 'statements': 0, 'db_ms': 0.0, 'template_ms': 0.0, 'render_start': []}
+
+
+def _finish_request(response):
+    perf = g.pop('perf', None)
+    if perf is None:
+        return response
+    total_ms = (time.perf_counter() - perf['start']) * 1000
+    response.headers['Server-Timing'] = ', '.join((
+        f'db;dur={perf["db_ms"]:.2f};desc="{perf["statements"]} queries"',
+        f'tpl;dur={perf["template_ms"]:.2f}',
+        f'total;dur={total_ms:.2f}',
+    ))
+    endpoint = request.endpoint or 'unmatched'
+    request_logger.info(json.dumps({
+        'endpoint': endpoint, 'method': request.method, 'path': request.path, 'status': response.status_code,
+        'statements': perf['statements'], 'db_ms': round(perf['db_ms'], 2),
+        'template_ms': round(perf['template_ms'], 2), 'total_ms': round(total_ms, 2),
+    }))
+    if endpoint != 'static':
+        get_request_stats().add(endpoint, total_ms, perf['db_ms'], perf['statements'])
+    return response
+
+
+def init_instrumentation(app, engines):
+    """Wire the request hooks and the cursor events on `engines` if INSTRUMENTATION_ENABLED is set."""
+    if not app.config.get('INSTRUMENTATION_ENABLED'):
+        return
+    app.extensions['request_stats'] = RequestStats(window=app.config.get('INSTRUMENTATION_WINDOW', 1000))
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(engine, 'handle_error', _cursor_error)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
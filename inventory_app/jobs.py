@@ -0,0 +1,287 @@
+# Background jobs for work too long for a web request (full-history exports, reconciliation...).
+# The web app only inserts a queued Job row. `flask worker` claims queued jobs with a conditional
+# UPDATE (so several workers never run the same job) and runs each one in a process pool; the job
+# streams its output to a file in JOB_OUTPUT_DIR, which /jobs/<id>/download serves once the job
+# has succeeded. Each pool process builds its own app from the same config, so no connection or
+# session is shared with the parent.
+# New job kinds register themselves with @job_kind(); parse_params() validates the submitted
+# form values at enqueue time and run() writes the output to an open text file.
+
+import concurrent.futures
+import datetime
+import json
+import logging
+import os
+import socket
+import time
+
+from flask import current_app
+from sqlalchemy import func, select, union_all, update
+
+from . import db
+from .archive import archived_totals_statement
+from .exporter import EXPORTS, EXPORT_FORMATS, EXPORT_MIMETYPES, iter_export, iter_csv, parse_since
+from .models import Job, Product, InventoryMovement
+from .forecast import reorder_suggestions
+from .shards import live_quantity
+from .valuation import VALUATION_GROUPINGS, inventory_valuation
+
+logger = logging.getLogger('inventory_app.jobs')
+
+JOB_KINDS = {}
+
+
+class JobKind:
+    def __init__(self, name, title, run, parse_params):
+        self.name = name
+        self.title = title
+        self.run = run # run(params, stream) -> dict(name=download name, mimetype=...)
+        self.parse_params = parse_params # parse_params(form) -> params dict; raises ValueError
+
+
+def job_kind(name, title, parse_params=lambda form: {}):
+    """Register the decorated function as the runner of the job kind `name`."""
+    def register(run):
+        JOB_KINDS[name] = JobKind(name, title, run, parse_params)
+        return run
+    return register
+
+
+def job_output_dir():
+    directory = os.path.join(current_app.instance_path, current_app.config.get('JOB_OUTPUT_DIR', 'jobs'))
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def job_output_path(job):
+    return os.path.join(job_output_dir(), job.result_file)
+
+
+def job_params(job):
+    return json.loads(job.params or '{}')
+
+
+def enqueue_job(kind, params=None, user_id=None):
+    """Queue a job of a registered kind and commit it. Returns the Job."""
+    if kind not in JOB_KINDS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    job = Job(kind=kind, params=json.dumps(params or {}), user_id=user_id, status='queued')
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim_next_job(worker=None):
+    """Mark the oldest queued job as running and return its id, or None if the queue is empty."""
+    values = dict(status='running', started_at=datetime.datetime.utcnow(), worker=worker or worker_id())
+    oldest = select(Job.id).where(Job.status == 'queued').order_by(Job.id).limit(1)
+    if db.session.get_bind().dialect.update_returning:
+        claimed = db.session.execute(
+            update(Job).where(Job.id == oldest.scalar_subquery(), Job.status == 'queued')
+                       .values(**values).returning(Job.id)
+        ).scalar()
+    else:
+        # Without UPDATE ... RETURNING (MySQL, older SQLite): the conditional UPDATE decides which
+        # worker gets the job; one that loses the race moves on to the next queued job
+        while True:
+            claimed = db.session.execute(oldest).scalar()
+            if claimed is None:
+                break
+            if db.session.execute(update(Job).where(Job.id == claimed, Job.status == 'queued')
+                                  .values(**values)).rowcount == 1:
+                break
+    db.session.commit()
+    return claimed
+
+
+def _finish(job_id, **values):
+    db.session.execute(update(Job).where(Job.id == job_id)
+                       .values(finished_at=datetime.datetime.utcnow(), **values))
+    db.session.commit()
+
+
+def run_job(job_id):
+    """Run a claimed job to completion in the current app context, recording the outcome on the row."""
+    job = db.session.get(Job, job_id)
+    kind = JOB_KINDS.get(job.kind)
+    result_file = f'{job.id}-{job.kind}'
+    path = os.path.join(job_output_dir(), result_file)
+    partial = path + '.part'
+    started = time.perf_counter()
+    try:
+        if kind is None:
+            raise ValueError(f'Unknown job kind: {job.kind}')
+        with open(partial, 'w', newline='', encoding='utf-8') as stream:
+            result = kind.run(job_params(job), stream)
+        os.replace(partial, path) # Only complete files are ever served
+        db.session.rollback() # End the job's read transaction before recording the result
+        _finish(job_id, status='succeeded', result_file=result_file, result_name=result['name'],
+                result_mimetype=result['mimetype'], result_size=os.path.getsize(path))
+        logger.info(json.dumps({'job': job_id, 'kind': job.kind, 'status': 'succeeded',
+                                'duration_ms': round((time.perf_counter() - started) * 1000, 2)}))
+    except Exception as exc:
+        db.session.rollback()
+        if os.path.exists(partial):
+            os.remove(partial)
+        logger.exception('Job %s (%s) failed', job_id, job.kind)
+        _finish(job_id, status='failed', error=f'{type(exc).__name__}: {exc}')
+
+
+def fail_interrupted_jobs():
+    """Mark as failed the running jobs claimed by worker processes of this host that no longer exist."""
+    host = socket.gethostname()
+    failed = 0
+    for job in Job.query.filter(Job.status == 'running', Job.worker.like(f'{host}:%')).all():
+        pid = int(job.worker.rsplit(':', 1)[1])
+        if not _process_exists(pid):
+            job.status, job.error = 'failed', 'Interrupted: the worker exited before the job finished.'
+            job.finished_at = datetime.datetime.utcnow()
+            failed += 1
+    db.session.commit()
+    return failed
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Pool process side: each process builds its own app (and engine) once, in the initializer
+_worker_app = None
+
+
+def _init_pool_process(config_name, config_overrides):
+    global _worker_app
+    from . import create_app
+    _worker_app = create_app(config_name, config_overrides)
+
+
+def _run_in_pool(job_id):
+    with _worker_app.app_context():
+        run_job(job_id)
+
+
+def run_worker(app, processes=2, poll_interval=2.0, once=False, app_args=(None, None)):
+    """Claim and run queued jobs until interrupted (or, with once=True, until the queue is empty).
+
+    processes=0 runs the jobs one at a time in this process; otherwise they run in a pool of
+    `processes` processes built with create_app(*app_args).
+    """
+    worker = worker_id()
+    with app.app_context():
+        fail_interrupted_jobs()
+    if processes == 0:
+        while True:
+            with app.app_context():
+                job_id = claim_next_job(worker)
+                if job_id is not None:
+                    run_job(job_id)
+            if job_id is None:
+                if once:
+                    return
+                time.sleep(poll_interval)
+
+    running = {} # future -> job id
+    with concurrent.futures.ProcessPoolExecutor(processes, initializer=_init_pool_process, initargs=app_args) as pool:
+        while True:
+            for future in [future for future in running if future.done()]:
+                job_id = running.pop(future)
+                if future.exception() is not None:
+                    # The pool process died (run_job records ordinary failures itself)
+                    logger.error('Worker process for job %s failed: %r', job_id, future.exception())
+                    with app.app_context():
+                        _finish(job_id, status='failed', error=f'Worker process failed: {future.exception()!r}')
+            claimed = False
+            while len(running) < processes:
+                with app.app_context():
+                    job_id = claim_next_job(worker)
+                if job_id is None:
+                    break
+                running[pool.submit(_run_in_pool, job_id)] = job_id
+                claimed = True
+            if claimed:
+                continue
+            if once and not running:
+                return
+            if running:
+                concurrent.futures.wait(running, timeout=poll_interval, return_when=concurrent.futures.FIRST_COMPLETED)
+            else:
+                time.sleep(poll_interval)
+
+
+def _export_params(form):
+    kind, fmt = form.get('kind'), form.get('fmt', 'csv')
+    if kind not in EXPORTS or fmt not in EXPORT_FORMATS:
+        raise ValueError('Unknown export kind or format.')
+    since = form.get('since') or None
+    parse_since(since) # Validate now rather than fail in the worker
+    return {'kind': kind, 'fmt': fmt, 'since': since}
+
+
+@job_kind('export', 'Exportación', parse_params=_export_params)
+def run_export(params, stream):
+    for chunk in iter_export(params['kind'], params['fmt'], parse_since(params.get('since'))):
+        stream.write(chunk)
+    return {'name': f"{params['kind']}.{params['fmt']}", 'mimetype': EXPORT_MIMETYPES[params['fmt']]}
+
+
+RECONCILIATION_COLUMNS = ['product_id', 'sku', 'name', 'quantity', 'ledger_quantity', 'difference']
+
+
+@job_kind('reconciliation', 'Conciliación de stock contra movimientos')
+def run_reconciliation(params, stream):
+    """Write one CSV row per product whose quantity differs from the sum of its movements."""
+    live = select(InventoryMovement.product_id, func.sum(InventoryMovement.quantity_change).label('total'))\
+        .group_by(InventoryMovement.product_id)
+    both = union_all(live, archived_totals_statement()).subquery()
+    ledger = select(both.c.product_id, func.sum(both.c.total).label('total')).group_by(both.c.product_id).subquery()
+    ledger_quantity = func.coalesce(ledger.c.total, 0)
+    quantity = live_quantity() # Shard totals for sharded products
+    statement = select(Product.id.label('product_id'), Product.sku, Product.name, quantity.label('quantity'),
+                       ledger_quantity.label('ledger_quantity'),
+                       (quantity - ledger_quantity).label('difference'))\
+        .outerjoin(ledger, ledger.c.product_id == Product.id)\
+        .where(quantity != ledger_quantity)\
+        .order_by(Product.id)
+    rows = db.session.execute(statement.execution_options(yield_per=1000)).mappings()
+    for chunk in iter_csv(RECONCILIATION_COLUMNS, rows):
+        stream.write(chunk)
+    return {'name': 'reconciliation.csv', 'mimetype': 'text/csv'}
+
+
+VALUATION_COLUMNS = ['level', 'first', 'second', 'products', 'units', 'value']
+
+
+def _valuation_params(form):
+    by = form.get('by', 'category')
+    if by not in VALUATION_GROUPINGS:
+        raise ValueError('Unknown valuation grouping.')
+    return {'by': by}
+
+
+@job_kind('valuation', 'Valoración del inventario', parse_params=_valuation_params)
+def run_valuation(params, stream):
+    rows = ({**row, 'value': str(row['value'])} for row in inventory_valuation(params['by']))
+    for chunk in iter_csv(VALUATION_COLUMNS, rows):
+        stream.write(chunk)
+    return {'name': f"valuation-by-{params['by']}.csv", 'mimetype': 'text/csv'}
+
+
+REORDER_COLUMNS = ['product_id', 'sku', 'name', 'quantity', 'daily_demand', 'days_of_cover', 'suggested_order']
+
+
+@job_kind('reorder', 'Sugerencias de reabastecimiento')
+def run_reorder(params, stream):
+    """Write the demand forecast and suggested order of every product, most urgent first."""
+    for chunk in iter_csv(REORDER_COLUMNS, reorder_suggestions(only_selling=False)):
+        stream.write(chunk)
+    return {'name': 'reorder-suggestions.csv', 'mimetype': 'text/csv'}
@@ -0,0 +1,114 @@
+# Inventory movement ledger queries.
+# Pages are walked newest-first with a keyset cursor on (timestamp, id), so the cost of a page
+# does not depend on how deep into the history it is. Every filter combination is backed by
+# one of the composite indexes declared on InventoryMovement. Movements moved to the archive
+# (see archive.py) are merged into the same order, and read only when the page reaches back to them.
+
+import datetime
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import joinedload, load_only
+
+from . import db
+from .archive import ArchivedMovement, archived_page, segments_query
+from .models import InventoryMovement, MovementArchiveSegment, Product, User
+from .pagination import InvalidCursor, encode_cursor, decode_cursor
+
+MAX_PER_PAGE = 200
+
+
+def _parse_date(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_ledger_filters(args):
+    """Build a filter dict from request args. Unknown or malformed values are ignored."""
+    filters = {}
+    product_term = (args.get('product') or '').strip()
+    if args.get('product_id', type=int):
+        filters['product_ids'] = [args.get('product_id', type=int)]
+    elif product_term:
+        # Exact SKU or name match, both of which are unique indexed columns.
+        filters['product_ids'] = [row.id for row in db.session.query(Product.id).filter(
+            (Product.sku == product_term) | (Product.name == product_term))]
+    username = (args.get('user') or '').strip()
+    if args.get('user_id', type=int):
+        filters['user_ids'] = [args.get('user_id', type=int)]
+    elif username:
+        filters['user_ids'] = [row.id for row in db.session.query(User.id).filter(User.username == username)]
+    if args.get('movement_type'):
+        filters['movement_type'] = args.get('movement_type')
+    start_date = _parse_date(args.get('start_date'))
+    if start_date:
+        filters['start'] = start_date
+    end_date = _parse_date(args.get('end_date'))
+    if end_date:
+        filters['end'] = end_date + datetime.timedelta(days=1) # End date is inclusive
+    return filters
+
+
+def apply_ledger_filters(query, filters):
+    if 'product_ids' in filters:
+        query = query.filter(InventoryMovement.product_id.in_(filters['product_ids']))
+    if 'user_ids' in filters:
+        query = query.filter(InventoryMovement.user_id.in_(filters['user_ids']))
+    if 'movement_type' in filters:
+        query = query.filter(InventoryMovement.movement_type == filters['movement_type'])
+    if 'start' in filters:
+        query = query.filter(InventoryMovement.timestamp >= filters['start'])
+    if 'end' in filters:
+        query = query.filter(InventoryMovement.timestamp < filters['end'])
+    return query
+
+
+def movement_page(filters, cursor=None, per_page=50):
+    """Return (movements, next_cursor) for one page of the ledger, newest first.
+
+    Raises pagination.InvalidCursor if the cursor cannot be decoded. Archived movements come
+    back as archive.ArchivedMovement objects.
+    """
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    last_timestamp = last_id = None
+    query = InventoryMovement.query.options(
+        joinedload(InventoryMovement.product).load_only(Product.name, Product.sku),
+        joinedload(InventoryMovement.user).load_only(User.username),
+    )
+    query = apply_ledger_filters(query, filters)
+    if cursor:
+        last_timestamp, last_id = decode_cursor(cursor, 2)
+        if not isinstance(last_timestamp, datetime.datetime) or not isinstance(last_id, int):
+            raise InvalidCursor('Malformed cursor.')
+        # The leading "<=" gives the planner a range seek on the index; the OR breaks ties on id.
+        query = query.filter(
+            InventoryMovement.timestamp <= last_timestamp,
+            or_(InventoryMovement.timestamp < last_timestamp,
+                and_(InventoryMovement.timestamp == last_timestamp, InventoryMovement.id < last_id)))
+    rows = query.order_by(InventoryMovement.timestamp.desc(), InventoryMovement.id.desc())\
+                .limit(per_page + 1).all()
+    rows = _merge_archived(rows, filters, None if cursor is None else (last_timestamp, last_id), per_page + 1)
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id)
+    return rows, next_cursor
+
+
+def _merge_archived(rows, filters, before, limit):
+    """Merge the archived movements that belong on this page into the live `rows`."""
+    newest_archived = segments_query(filters.get('start'), filters.get('end'), filters.get('product_ids'))\
+        .with_entities(func.max(MovementArchiveSegment.last_timestamp)).scalar()
+    if newest_archived is None or (len(rows) == limit and rows[-1].timestamp > newest_archived):
+        return rows # The page ends before the archived history starts
+    archived = archived_page(filters, before, limit)
+    if not archived:
+        return rows
+    products = {product.id: product for product in Product.query.options(load_only(Product.name, Product.sku))
+                .filter(Product.id.in_({row['product_id'] for row in archived}))}
+    users = {user.id: user for user in User.query.options(load_only(User.username))
+             .filter(User.id.in_({row['user_id'] for row in archived}))}
+    archived = [ArchivedMovement(row, products.get(row['product_id']), users.get(row['user_id'])) for row in archived]
+    merged = sorted(rows + archived, key=lambda movement: (movement.timestamp, movement.id), reverse=True)
+    return merged[:limit]
@@ -0,0 +1,157 @@
+# Product listing queries: filters, sort orders and keyset pagination.
+# Pages are walked with a cursor on (sort value, id) instead of OFFSET, so a deep page costs the
+# same as the first one. Each sort order, alone or under a category, supplier or stock filter,
+# is an index range scan on one of the composite indexes declared on Product (SQLite appends the
+# rowid to every index, which supplies the id tie-break). Sorting by quantity inside a category
+# or supplier sorts that facet's rows instead: quantity indexes are updated by every stock
+# movement, so only the two that the whole-catalogue listings need are kept.
+#
+# Totals come from counters that are already maintained (the summary row, a facet's
+# product_count) when they answer the filter exactly; other filters are counted up to
+# PRODUCT_COUNT_LIMIT rows and reported as a lower bound beyond that.
+
+import decimal
+
+from flask import current_app
+from sqlalchemy import and_, func, or_, select
+
+from . import db
+from .facets import FACETS
+from .models import Product
+from .money import cents_to_decimal, to_cents
+from .pagination import InvalidCursor, encode_cursor, decode_cursor
+
+MAX_PER_PAGE = 100
+
+# Sort parameter -> (column, descending)
+SORTS = {
+    'name': (Product.name, False),
+    '-name': (Product.name, True),
+    'price': (Product.price, False),
+    '-price': (Product.price, True),
+    'quantity': (Product.quantity, False),
+    '-quantity': (Product.quantity, True),
+}
+DEFAULT_SORT = 'name'
+
+STOCK_STATES = ('ok', 'low', 'out')
+
+
+def _parse_price(value):
+    try:
+        return cents_to_decimal(to_cents(value.strip())) if value and value.strip() else None
+    except (ArithmeticError, ValueError):
+        return None
+
+
+def parse_product_filters(args):
+    """Build a filter dict from request args. Unknown or malformed values are ignored."""
+    filters = {}
+    for facet in FACETS:
+        facet_id = args.get(f'{facet}_id', type=int)
+        if facet_id:
+            filters[f'{facet}_id'] = facet_id
+    if args.get('stock') in STOCK_STATES:
+        filters['stock'] = args.get('stock')
+    min_price = _parse_price(args.get('min_price'))
+    if min_price is not None:
+        filters['min_price'] = min_price
+    max_price = _parse_price(args.get('max_price'))
+    if max_price is not None:
+        filters['max_price'] = max_price
+    return filters
+
+
+def parse_sort(value):
+    return value if value in SORTS else DEFAULT_SORT
+
+
+def apply_product_filters(query, filters):
+    for facet in FACETS:
+        if f'{facet}_id' in filters:
+            query = query.filter(getattr(Product, f'{facet}_id') == filters[f'{facet}_id'])
+    stock = filters.get('stock')
+    if stock == 'ok':
+        query = query.filter(Product.low_stock.is_(False))
+    elif stock == 'low': # Low but not out, so the three states do not overlap
+        query = query.filter(Product.low_stock.is_(True), Product.quantity > 0)
+    elif stock == 'out':
+        query = query.filter(Product.quantity == 0)
+    if 'min_price' in filters:
+        query = query.filter(Product.price >= filters['min_price'])
+    if 'max_price' in filters:
+        query = query.filter(Product.price <= filters['max_price'])
+    return query
+
+
+def _cursor_value(sort, product):
+    value = getattr(product, SORTS[sort][0].key)
+    return str(value) if isinstance(value, decimal.Decimal) else value # Prices travel as strings
+
+
+def product_cursor(sort, product):
+    """Cursor for the page that follows `product` in the given sort order."""
+    return encode_cursor(sort, _cursor_value(sort, product), product.id)
+
+
+def _decode_product_cursor(cursor, sort):
+    cursor_sort, value, last_id = decode_cursor(cursor, 3)
+    if cursor_sort != sort or not isinstance(last_id, int):
+        raise InvalidCursor('Malformed cursor.')
+    column = SORTS[sort][0]
+    if column is Product.price:
+        try:
+            value = decimal.Decimal(value)
+        except (TypeError, decimal.InvalidOperation) as exc:
+            raise InvalidCursor('Malformed cursor.') from exc
+    elif not isinstance(value, int if column is Product.quantity else str) or isinstance(value, bool):
+        raise InvalidCursor('Malformed cursor.')
+    return value, last_id
+
+
+def product_page(filters, sort=DEFAULT_SORT, cursor=None, per_page=20):
+    """Return (products, next_cursor) for one page of the listing.
+
+    Raises pagination.InvalidCursor if the cursor cannot be decoded or belongs to another sort order.
+    """
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    column, descending = SORTS[sort]
+    query = apply_product_filters(Product.query, filters)
+    if cursor:
+        last_value, last_id = _decode_product_cursor(cursor, sort)
+        # As in the ledger: the leading range gives the planner an index seek, the OR breaks ties on id.
+        if descending:
+            query = query.filter(column <= last_value,
+                                 or_(column < last_value, and_(column == last_value, Product.id < last_id)))
+        else:
+            query = query.filter(column >= last_value,
+                                 or_(column > last_value, and_(column == last_value, Product.id > last_id)))
+    order = (column.desc(), Product.id.desc()) if descending else (column, Product.id)
+    rows = query.order_by(*order).limit(per_page + 1).all()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = product_cursor(sort, rows[-1])
+    return rows, next_cursor
+
+
+def product_total(filters, summary):
+    """Return (count, exact) for the products matching `filters`.
+
+    `exact` is False when the count stopped at PRODUCT_COUNT_LIMIT (the true total is larger);
+    count is None when that limit is 0, which turns counting off for such filters.
+    """
+    if not filters:
+        return summary.product_count, True
+    if len(filters) == 1:
+        [(key, value)] = filters.items()
+        if key.endswith('_id'):
+            model = FACETS[key[:-len('_id')]]
+            count = db.session.scalar(select(model.product_count).where(model.id == value))
+            return count or 0, True
+    limit = current_app.config.get('PRODUCT_COUNT_LIMIT', 1000)
+    if not limit:
+        return None, False
+    matching = apply_product_filters(select(Product.id), filters).limit(limit + 1).subquery()
+    count = db.session.scalar(select(func.count()).select_from(matching))
+    return min(count, limit), count <= limit
@@ -0,0 +1,159 @@
+# In-place upgrades of databases created by older versions of the app (`flask migrate-db`).
+# db.create_all() only adds missing tables, so each step below inspects the live schema and
+# changes what is missing or outdated; every step is a no-op on an up-to-date database and the
+# whole run can be repeated safely. Steps run in the order of MIGRATIONS; add new ones at the end
+# unless a later step depends on the schema they produce.
+
+import collections
+
+from sqlalchemy import inspect, text
+
+from . import db
+from .models import Category, Supplier, facet_key, normalize_facet_name
+from .money import prices_to_cents
+
+PRICE_CHUNK_SIZE = 10000
+
+
+def _product_columns(connection):
+    return {column['name'] for column in inspect(connection).get_columns('product')}
+
+
+def add_low_stock_columns(connection):
+    """Per-product reorder points and the maintained low_stock flag."""
+    columns = _product_columns(connection)
+    if 'low_stock' in columns:
+        return False
+    if 'reorder_point' not in columns:
+        connection.execute(text('ALTER TABLE product ADD COLUMN reorder_point INTEGER'))
+    connection.execute(text('ALTER TABLE product ADD COLUMN low_stock BOOLEAN NOT NULL DEFAULT 0'))
+    from .summary import refresh_low_stock_flags
+    refresh_low_stock_flags()
+    return True
+
+
+def convert_price_to_cents(connection):
+    """Float product.price -> integer product.price_cents, rounded half up to the cent."""
+    columns = _product_columns(connection)
+    if 'price_cents' in columns:
+        return False
+    connection.execute(text('ALTER TABLE product ADD COLUMN price_cents INTEGER NOT NULL DEFAULT 0'))
+    last_id = 0
+    while True:
+        rows = connection.execute(text('SELECT id, price FROM product WHERE id > :last_id ORDER BY id LIMIT :limit'),
+                                  {'last_id': last_id, 'limit': PRICE_CHUNK_SIZE}).all()
+        if not rows:
+            break
+        cents = prices_to_cents([price or 0 for _, price in rows])
+        connection.execute(text('UPDATE product SET price_cents = :cents WHERE id = :id'),
+                           [{'cents': value, 'id': product_id} for (product_id, _), value in zip(rows, cents)])
+        last_id = rows[-1][0]
+    connection.execute(text('ALTER TABLE product DROP COLUMN price')) # SQLite 3.35+
+    return True
+
+
+def normalize_categories_and_suppliers(connection):
+    """Free-text product.category/supplier -> category_id/supplier_id referencing deduplicated lookup rows.
+
+    Values differing only in case or spacing become one row, named with their most common spelling.
+    """
+    from .facets import apply_count_deltas, resolve_names
+    from .search import FTS5_DROP
+    columns = _product_columns(connection)
+    if 'category_id' in columns:
+        return False
+    if connection.dialect.name == 'sqlite':
+        for statement in FTS5_DROP: # Its triggers read the old columns; create_search_index rebuilds it
+            connection.execute(text(statement))
+    for facet, model in (('category', Category), ('supplier', Supplier)):
+        connection.execute(text(f'ALTER TABLE product ADD COLUMN {facet}_id INTEGER REFERENCES {model.__tablename__}(id)'))
+        if facet not in columns:
+            continue
+        spellings = collections.defaultdict(collections.Counter) # key -> Counter of normalized spellings
+        raw_values = connection.execute(text(f'SELECT {facet}, COUNT(*) FROM product WHERE {facet} IS NOT NULL GROUP BY {facet}')).all()
+        for raw, count in raw_values:
+            if normalize_facet_name(raw) is not None:
+                spellings[facet_key(raw)][normalize_facet_name(raw)] += count
+        ids = resolve_names(connection, model, [counter.most_common(1)[0][0] for counter in spellings.values()])
+        ids_by_key = {facet_key(name): facet_id for name, facet_id in ids.items()}
+        # One pass over product through a temporary raw value -> id map
+        connection.execute(text('CREATE TEMPORARY TABLE facet_map (raw TEXT PRIMARY KEY, facet_id INTEGER)'))
+        mapping = [{'raw': raw, 'facet_id': ids_by_key[facet_key(raw)]} for raw, _ in raw_values
+                   if normalize_facet_name(raw) is not None]
+        if mapping:
+            connection.execute(text('INSERT INTO facet_map (raw, facet_id) VALUES (:raw, :facet_id)'), mapping)
+        connection.execute(text(f'UPDATE product SET {facet}_id = (SELECT facet_id FROM facet_map WHERE raw = product.{facet}) '
+                                f'WHERE {facet} IS NOT NULL'))
+        connection.execute(text('DROP TABLE facet_map'))
+        counts = collections.Counter()
+        for raw, count in raw_values:
+            if normalize_facet_name(raw) is not None:
+                counts[ids_by_key[facet_key(raw)]] += count
+        apply_count_deltas(connection, model, counts)
+        connection.execute(text(f'ALTER TABLE product DROP COLUMN {facet}'))
+    return True
+
+
+def add_stock_shards_column(connection):
+    """product.stock_shards, set on products whose stock lives in stock_shard rows."""
+    if 'stock_shards' in _product_columns(connection):
+        return False
+    connection.execute(text('ALTER TABLE product ADD COLUMN stock_shards INTEGER'))
+    return True
+
+
+def add_user_auth_version_column(connection):
+    """user.auth_version, which cached identities are checked against on every request."""
+    if 'auth_version' in {column['name'] for column in inspect(connection).get_columns('user')}:
+        return False
+    connection.execute(text('ALTER TABLE "user" ADD COLUMN auth_version INTEGER NOT NULL DEFAULT 0'))
+    return True
+
+
+def create_missing_indexes(connection):
+    """Indexes declared on the models after their tables were created."""
+    created = False
+    inspector = inspect(connection)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+                created = True
+    return created
+
+
+def create_search_index(connection):
+    """FTS5 product index (SQLite), which create_all() only adds together with the product table."""
+    from .search import FTS5SearchBackend, fts5_available
+    if not fts5_available(connection) or inspect(connection).has_table('product_fts'):
+        return False
+    FTS5SearchBackend.rebuild()
+    return True
+
+
+MIGRATIONS = [
+    add_low_stock_columns,
+    convert_price_to_cents,
+    normalize_categories_and_suppliers, # Before the indexes and the search index, which use its columns
+    create_missing_indexes,
+    create_search_index,
+    add_stock_shards_column,
+    add_user_auth_version_column,
+]
+
+
+def migrate():
+    """Bring the database schema up to date. Returns the names of the steps that changed something."""
+    db.create_all() # New tables
+    applied = []
+    for step in MIGRATIONS:
+        if step(db.session.connection()):
+            applied.append(step.__name__)
+        db.session.commit()
+    if applied:
+        from .summary import rebuild_summary
+        rebuild_summary()
+    return applied
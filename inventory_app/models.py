@@ -2,7 +2,9 @@ from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 import datetime
-from sqlalchemy import MetaData
+from sqlalchemy import MetaData, select
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm.attributes import flag_dirty
 
 # Convention for naming constraints
 # See: https://alembic.sqlalchemy.org/en/latest/naming.html
@@ -20,6 +22,7 @@ metadata = MetaData(
 # This avoids creating a new SQLAlchemy instance here.
 # The instance in __init__.py will be initialized with the app.
 from . import db # Import db from __init__.py of the current package
+from .money import Cents
 
 class User(UserMixin, db.Model):
     __tablename__ = 'user'
@@ -29,6 +32,7 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(256)) # Increased length for future hash algo
     role = db.Column(db.String(20), default='user', nullable=False) # 'user' or 'admin'
     is_active = db.Column(db.Boolean, default=True, nullable=False)
+    auth_version = db.Column(db.Integer, default=0, nullable=False) # Bumped when role or is_active changes (see user_cache.py)
     date_created = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
     def set_password(self, password):
@@ -40,24 +44,128 @@ class User(UserMixin, db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+def normalize_facet_name(value):
+    """Category/supplier name as stored: surrounding and repeated whitespace removed; blank is None."""
+    name = ' '.join(str(value).split()) if value is not None else ''
+    return name or None
+
+def facet_key(name):
+    """Lookup key that makes 'Tools', 'tools' and ' TOOLS ' the same category."""
+    return normalize_facet_name(name).casefold()
+
+class Category(db.Model):
+    # Lookup table behind Product.category; rows are found or created by name (see facets.py)
+    __tablename__ = 'category'
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(100), nullable=False, unique=True) # facet_key(name)
+    name = db.Column(db.String(100), nullable=False) # Spelling of the first product that used it
+    product_count = db.Column(db.Integer, nullable=False, default=0) # Maintained by inventory_app.facets
+
+    def __repr__(self):
+        return f'<Category {self.name}>'
+
+class Supplier(db.Model):
+    # Lookup table behind Product.supplier; rows are found or created by name (see facets.py)
+    __tablename__ = 'supplier'
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(100), nullable=False, unique=True) # facet_key(name)
+    name = db.Column(db.String(100), nullable=False)
+    product_count = db.Column(db.Integer, nullable=False, default=0) # Maintained by inventory_app.facets
+
+    def __repr__(self):
+        return f'<Supplier {self.name}>'
+
 class Product(db.Model):
     __tablename__ = 'product'
+    # Backs the low stock report: WHERE low_stock ORDER BY quantity reads only flagged rows.
+    # The others back the product listing's sort orders and filters (see listing.py).
+    __table_args__ = (
+        db.Index('ix_product_low_stock_quantity', 'low_stock', 'quantity'),
+        db.Index('ix_product_low_stock_name', 'low_stock', 'name'),
+        db.Index('ix_product_price', 'price'),
+        db.Index('ix_product_quantity', 'quantity'),
+        db.Index('ix_product_category_name', 'category_id', 'name'),
+        db.Index('ix_product_category_price', 'category_id', 'price'),
+        db.Index('ix_product_supplier_name', 'supplier_id', 'name'),
+        db.Index('ix_product_supplier_price', 'supplier_id', 'price'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, unique=True)
     description = db.Column(db.Text, nullable=True)
     quantity = db.Column(db.Integer, nullable=False, default=0)
-    price = db.Column(db.Float, nullable=False, default=0.0) # Consider using Numeric or Decimal for currency
+    price = db.Column('price_cents', Cents, key='price', nullable=False, default=0) # Stored as integer cents, read as Decimal (see money.py)
     sku = db.Column(db.String(50), unique=True, nullable=True) # Stock Keeping Unit
-    category = db.Column(db.String(100), nullable=True)
-    supplier = db.Column(db.String(100), nullable=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=True)
+    supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id'), nullable=True)
+    reorder_point = db.Column(db.Integer, nullable=True) # Low stock at or below this; NULL uses LOW_STOCK_THRESHOLD
+    low_stock = db.Column(db.Boolean, nullable=False, default=False) # Maintained by inventory_app.summary
+    stock_shards = db.Column(db.Integer, nullable=True) # Stock split over this many StockShard rows; NULL keeps it in quantity (see shards.py)
     date_added = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     last_updated = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
+    # Loaded with the product in the same query: the lookup tables are small and every listing shows both names
+    category_ref = db.relationship('Category', lazy='joined')
+    supplier_ref = db.relationship('Supplier', lazy='joined')
+
+    # Category and supplier read and assign as plain text. A new name is kept pending on the
+    # instance and resolved to its lookup row (created if needed) when the session flushes.
+    @hybrid_property
+    def category(self):
+        return self._facet_name('category')
+
+    @category.inplace.setter
+    def _category_setter(self, value):
+        self._set_facet_name('category', value)
+
+    @category.inplace.expression
+    @classmethod
+    def _category_expression(cls):
+        return select(Category.name).where(Category.id == cls.category_id).scalar_subquery().label('category')
+
+    @hybrid_property
+    def supplier(self):
+        return self._facet_name('supplier')
+
+    @supplier.inplace.setter
+    def _supplier_setter(self, value):
+        self._set_facet_name('supplier', value)
+
+    @supplier.inplace.expression
+    @classmethod
+    def _supplier_expression(cls):
+        return select(Supplier.name).where(Supplier.id == cls.supplier_id).scalar_subquery().label('supplier')
+
+    def _facet_name(self, facet):
+        pending = self.__dict__.get('pending_facets', {})
+        if facet in pending:
+            return pending[facet]
+        ref = getattr(self, f'{facet}_ref')
+        return ref.name if ref is not None else None
+
+    def _set_facet_name(self, facet, value):
+        name = normalize_facet_name(value)
+        pending = self.__dict__.setdefault('pending_facets', {})
+        pending.pop(facet, None)
+        current = self._facet_name(facet)
+        if name is None:
+            setattr(self, f'{facet}_ref', None)
+        elif current is None or facet_key(current) != facet_key(name):
+            pending[facet] = name
+            flag_dirty(self) # So the flush sees the product even if nothing else changed
+
     def __repr__(self):
         return f'<Product {self.name}>'
 
 class InventoryMovement(db.Model):
     __tablename__ = 'inventory_movement'
+    # Composite indexes backing the keyset-paginated ledger (newest first on timestamp, id),
+    # one per supported filter so every filtered page is an index range scan.
+    __table_args__ = (
+        db.Index('ix_inventory_movement_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_inventory_movement_product_timestamp_id', 'product_id', 'timestamp', 'id'),
+        db.Index('ix_inventory_movement_user_timestamp_id', 'user_id', 'timestamp', 'id'),
+        db.Index('ix_inventory_movement_type_timestamp_id', 'movement_type', 'timestamp', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False) # User who made the change
@@ -73,7 +181,119 @@ class InventoryMovement(db.Model):
     def __repr__(self):
         return f'<InventoryMovement {self.movement_type} for Product ID {self.product_id} by User ID {self.user_id}>'
 
+class StockShard(db.Model):
+    # One of the counters holding the stock of a sharded product (Product.stock_shards is set).
+    # Writers change a single shard, so concurrent sales of a hot product do not queue on one row;
+    # Product.quantity then caches the sum, refreshed by inventory_app.shards.fold_stock_shards().
+    __tablename__ = 'stock_shard'
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True) # 0 .. Product.stock_shards - 1
+    quantity = db.Column(db.Integer, nullable=False, default=0) # Never negative
+
+    def __repr__(self):
+        return f'<StockShard {self.product_id}/{self.shard} quantity={self.quantity}>'
+
+class InventorySummary(db.Model):
+    # Single-row table (id=1) holding catalogue-wide aggregates for the /products dashboard.
+    # Kept current by inventory_app.summary in the same transaction as every product write.
+    __tablename__ = 'inventory_summary'
+    id = db.Column(db.Integer, primary_key=True)
+    product_count = db.Column(db.Integer, nullable=False, default=0)
+    total_units = db.Column(db.Integer, nullable=False, default=0)
+    low_stock_count = db.Column(db.Integer, nullable=False, default=0)
+    low_stock_threshold = db.Column(db.Integer, nullable=False) # Threshold low_stock_count was computed with
+    catalogue_version = db.Column(db.Integer, nullable=False, default=0) # Bumped by every product write
+    catalogue_updated = db.Column(db.DateTime, default=datetime.datetime.utcnow) # Time of the last product write
+    last_rebuilt = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    def __repr__(self):
+        return f'<InventorySummary products={self.product_count} units={self.total_units}>'
+
+class StockSnapshot(db.Model):
+    # Checkpoint of every product's quantity, taken by inventory_app.snapshots.
+    # last_movement_id is the newest ledger row already reflected in the lines, so point-in-time
+    # queries only replay movements with a higher id.
+    __tablename__ = 'stock_snapshot'
+    id = db.Column(db.Integer, primary_key=True)
+    taken_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow, index=True)
+    last_movement_id = db.Column(db.Integer, nullable=False, default=0)
+    product_count = db.Column(db.Integer, nullable=False, default=0)
+    total_units = db.Column(db.Integer, nullable=False, default=0)
+
+    lines = db.relationship('StockSnapshotLine', backref='snapshot', lazy='dynamic', cascade='all, delete-orphan', passive_deletes=True)
+
+    def __repr__(self):
+        return f'<StockSnapshot {self.taken_at} up to movement {self.last_movement_id}>'
+
+class StockSnapshotLine(db.Model):
+    __tablename__ = 'stock_snapshot_line'
+    snapshot_id = db.Column(db.Integer, db.ForeignKey('stock_snapshot.id', ondelete='CASCADE'), primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<StockSnapshotLine snapshot={self.snapshot_id} product={self.product_id} quantity={self.quantity}>'
+
+class MovementArchiveSegment(db.Model):
+    # One gzip NDJSON file of inventory movements moved out of the live table by
+    # inventory_app.archive; rows are sorted by (timestamp, id). A month normally has one segment,
+    # more if movements were archived from it in several runs.
+    __tablename__ = 'movement_archive_segment'
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Date, nullable=False, index=True) # First day of the month the movements belong to
+    file_name = db.Column(db.String(255), nullable=False, unique=True) # Inside ARCHIVE_DIR
+    row_count = db.Column(db.Integer, nullable=False)
+    first_movement_id = db.Column(db.Integer, nullable=False)
+    last_movement_id = db.Column(db.Integer, nullable=False)
+    first_timestamp = db.Column(db.DateTime, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False, index=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    totals = db.relationship('MovementArchiveTotal', backref='segment', lazy='dynamic', cascade='all, delete-orphan', passive_deletes=True)
+
+    def __repr__(self):
+        return f'<MovementArchiveSegment {self.month:%Y-%m} rows={self.row_count}>'
+
+class MovementArchiveTotal(db.Model):
+    # Net quantity change per product within a segment, so stock and reconciliation queries can
+    # account for archived movements without opening the file.
+    __tablename__ = 'movement_archive_total'
+    segment_id = db.Column(db.Integer, db.ForeignKey('movement_archive_segment.id', ondelete='CASCADE'), primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True, index=True) # No FK: archived history outlives deleted products
+    quantity_change = db.Column(db.Integer, nullable=False)
+    movement_count = db.Column(db.Integer, nullable=False)
+
+class Job(db.Model):
+    # Background job queued by the web app and run by `flask worker` (see inventory_app.jobs).
+    # status goes queued -> running -> succeeded | failed; the output file lives in JOB_OUTPUT_DIR.
+    __tablename__ = 'job'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}') # JSON object
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    worker = db.Column(db.String(120), nullable=True) # host:pid of the worker that claimed it
+    result_file = db.Column(db.String(255), nullable=True) # File name inside JOB_OUTPUT_DIR
+    result_name = db.Column(db.String(255), nullable=True) # Download name offered to the user
+    result_mimetype = db.Column(db.String(100), nullable=True)
+    result_size = db.Column(db.Integer, nullable=True) # Bytes
+    error = db.Column(db.Text, nullable=True)
+
+    user = db.relationship('User')
+
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
 # Function to initialize the database (and create tables)
 def init_db(app):
     with app.app_context():
         db.create_all()
+        from .summary import rebuild_summary
+        rebuild_summary()
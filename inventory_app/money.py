@@ -0,0 +1,60 @@
+# Money as integer minor units (cents).
+# Product.price is stored in the integer column price_cents through the Cents column type, which
+# converts to and from Decimal at the ORM boundary, so Python code keeps reading and assigning
+# prices in currency units while the database (and every SUM over it) only sees exact integers.
+# Bulk price changes convert whole columns at once with numpy when it is installed.
+
+import decimal
+
+from sqlalchemy import Integer, TypeDecorator
+
+try:
+    import numpy
+except ImportError: # Optional; prices_to_cents() falls back to a Python loop
+    numpy = None
+
+CENT = decimal.Decimal('0.01')
+
+
+def to_cents(value):
+    """Price in currency units (str, int, float or Decimal) to integer cents, rounding half up."""
+    if value is None:
+        return None
+    if isinstance(value, float):
+        value = repr(value) # The shortest repr is what the user typed: 0.285 -> '0.285', not 0.28499...
+    amount = decimal.Decimal(value)
+    if not amount.is_finite():
+        raise ValueError(f'Invalid price: {value}')
+    return int((amount * 100).quantize(decimal.Decimal(1), rounding=decimal.ROUND_HALF_UP))
+
+
+def cents_to_decimal(cents):
+    if cents is None:
+        return None
+    return (decimal.Decimal(cents) / 100).quantize(CENT)
+
+
+def prices_to_cents(values):
+    """Convert a sequence of non-negative prices to a list of integer cents in one pass.
+
+    With numpy the conversion is vectorized; amounts are rounded to 1e-6 cent first so binary
+    noise (0.285 * 100 = 28.499999...) cannot flip the half-up rounding.
+    """
+    if numpy is None:
+        return [to_cents(value) for value in values]
+    amounts = numpy.asarray(values, dtype=numpy.float64)
+    if not numpy.isfinite(amounts).all():
+        raise ValueError('Invalid price in batch.')
+    return numpy.floor(numpy.round(amounts * 100, 6) + 0.5).astype(numpy.int64).tolist()
+
+
+class Cents(TypeDecorator):
+    """Integer column holding cents; Python values are Decimal currency amounts."""
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return to_cents(value)
+
+    def process_result_value(self, value, dialect):
+        return cents_to_decimal(value)
@@ -0,0 +1,39 @@
+# Keyset (cursor) pagination helpers.
+# A cursor is the sort key of the last row on a page, serialized as URL-safe base64 JSON
+# so it can travel in a query string. Datetimes are stored in ISO format.
+
+import base64
+import datetime
+import json
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(*values):
+    payload = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, expected_length):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        if not isinstance(values, list) or len(values) != expected_length:
+            raise InvalidCursor('Malformed cursor.')
+        return [_decode_value(v) for v in values]
+    except (ValueError, TypeError, UnicodeError) as exc:
+        raise InvalidCursor('Malformed cursor.') from exc
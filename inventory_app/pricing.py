@@ -0,0 +1,64 @@
+# Bulk price updates.
+# A price list (SKU, new price) is applied chunk by chunk: each chunk's prices are converted to
+# cents in one vectorized pass (money.prices_to_cents) and written with a single executemany
+# UPDATE on the raw price_cents column, skipping the per-value Decimal conversion of the ORM type.
+
+import csv
+import datetime
+
+from sqlalchemy import Integer, bindparam, select, update
+
+from . import db, summary
+from .models import Product
+from .money import prices_to_cents
+
+PRICE_UPDATE_CHUNK_SIZE = 5000
+
+
+class PriceUpdateResult:
+    def __init__(self):
+        self.updated = 0
+        self.unknown_skus = []
+
+
+def _apply_chunk(chunk, result):
+    skus = [sku for sku, _ in chunk]
+    known = set(db.session.execute(select(Product.sku).where(Product.sku.in_(skus))).scalars())
+    chunk = [(sku, price) for sku, price in chunk if sku in known]
+    result.unknown_skus.extend(sku for sku in skus if sku not in known)
+    if not chunk:
+        return
+    cents = prices_to_cents([price for _, price in chunk])
+    table = Product.__table__
+    db.session.execute(
+        update(table).where(table.c.sku == bindparam('b_sku'))
+                     .values({table.c.price: bindparam('b_cents', type_=Integer),
+                              table.c.last_updated: datetime.datetime.utcnow()}),
+        [{'b_sku': sku, 'b_cents': value} for (sku, _), value in zip(chunk, cents)])
+    # Prices are not in the summary counters, but cached reports key on the catalogue version
+    summary.apply_delta(db.session.connection())
+    db.session.commit()
+    result.updated += len(chunk)
+
+
+def update_prices(rows, chunk_size=PRICE_UPDATE_CHUNK_SIZE):
+    """Set the price of each (sku, price) pair; prices must be non-negative numbers. Commits per chunk."""
+    result = PriceUpdateResult()
+    chunk = []
+    for sku, price in rows:
+        price = float(price)
+        if price < 0:
+            raise ValueError(f'Negative price for {sku}: {price}')
+        chunk.append((sku, price))
+        if len(chunk) >= chunk_size:
+            _apply_chunk(chunk, result)
+            chunk = []
+    if chunk:
+        _apply_chunk(chunk, result)
+    return result
+
+
+def read_price_list(stream):
+    """Yield (sku, price) from a CSV with 'sku' and 'price' columns."""
+    for row in csv.DictReader(stream):
+        yield row['sku'].strip(), row['price'].strip()
@@ -1,14 +1,38 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, current_app, abort, Response, stream_with_context, send_file
 from flask_login import login_user, logout_user, login_required, current_user
 from functools import wraps # For admin_required
+import csv
+import datetime
+import io
 
 # Import db instance and models from .models
 # The db instance is initialized in __init__.py's create_app
 from . import db # Import db from __init__.py of the current package
-from .models import User, Product, InventoryMovement
+from .models import User, Product, InventoryMovement, Job
+from .ledger import parse_ledger_filters, movement_page
+from .listing import parse_product_filters, parse_sort, product_page, product_total
+from .facets import FACETS, facet_counts
+from .pagination import InvalidCursor
+from .summary import catalogue_version, get_summary
+from .search import search_products
+from .snapshots import stock_as_of, parse_as_of
+from .database import use_replica
+from .instrumentation import get_request_stats
+from .warmup import get_startup_timings
+from .valuation import inventory_valuation
+from .forecast import ForecastUnavailable, reorder_suggestions
+from .jobs import JOB_KINDS, enqueue_job, job_output_path, job_params
+from .events import event_stream, get_event_broker
+from .shards import current_stock
+
+LEDGER_FILTER_ARGS = ('product', 'product_id', 'user', 'user_id', 'movement_type', 'start_date', 'end_date', 'per_page')
+PRODUCT_LISTING_ARGS = ('category_id', 'supplier_id', 'stock', 'min_price', 'max_price', 'sort')
 
 # Import forms
-from .forms import LoginForm, RegistrationForm, ProductForm, AddStockForm, RemoveStockForm
+from .forms import LoginForm, RegistrationForm, ProductForm, AddStockForm, RemoveStockForm, ImportProductsForm, BatchStockAdjustmentForm, parse_price
+from .importer import import_products, detect_format, open_text_stream
+from .stock import record_stock_movement, apply_quantity_delta, InsufficientStock, apply_batch
+from .exporter import iter_export, parse_since, EXPORT_FORMATS, EXPORT_MIMETYPES
 
 main = Blueprint('main', __name__)
 
@@ -78,20 +102,45 @@ def logout():
 @main.route('/products')
 @login_required
 def products():
-    page = request.args.get('page', 1, type=int)
     per_page = current_app.config.get('ITEMS_PER_PAGE', 10)
-    products_query = Product.query.order_by(Product.name)
-    paginated_products = products_query.paginate(page=page, per_page=per_page, error_out=False)
-    total_unique_products = products_query.count()
-    total_units_in_inventory = db.session.query(db.func.sum(Product.quantity)).scalar() or 0
+    filters = parse_product_filters(request.args)
+    sort = parse_sort(request.args.get('sort'))
+    # Aggregates come from the incrementally maintained summary row instead of scanning the table
+    with use_replica():
+        summary = get_summary()
+        try:
+            page, next_cursor = product_page(filters, sort, cursor=request.args.get('cursor'), per_page=per_page)
+        except InvalidCursor:
+            abort(400)
+        total, total_exact = product_total(filters, summary)
+        facets = {facet: facet_counts(facet, summary.catalogue_version) for facet in FACETS}
     low_stock_threshold = current_app.config.get('LOW_STOCK_THRESHOLD', 10)
+    # Raw filter values are echoed back into the form and the pagination and facet links.
+    listing_args = {key: request.args[key] for key in PRODUCT_LISTING_ARGS if request.args.get(key)}
     return render_template('products.html',
-                           products=paginated_products,
-                           total_unique_products=total_unique_products,
-                           total_units_in_inventory=total_units_in_inventory,
+                           products=page,
+                           next_cursor=next_cursor,
+                           is_first_page=not request.args.get('cursor'),
+                           total=total,
+                           total_exact=total_exact,
+                           facets=facets,
+                           filters=filters,
+                           sort=sort,
+                           listing_args=listing_args,
+                           total_unique_products=summary.product_count,
+                           total_units_in_inventory=summary.total_units,
+                           low_stock_count=summary.low_stock_count,
                            low_stock_threshold=low_stock_threshold,
                            footer_text="Elaborado por Kevin Castellanos")
 
+@main.route('/products/search')
+@login_required
+def product_search():
+    query = request.args.get('q', '').strip()
+    results = search_products(query, limit=current_app.config.get('SEARCH_RESULTS_LIMIT', 50)) if query else []
+    return render_template('product_search.html', title='Buscar Productos', query=query, results=results,
+                           footer_text="Elaborado por Kevin Castellanos")
+
 @main.route('/product/add', methods=['GET', 'POST'])
 @admin_required
 def add_product():
@@ -108,12 +157,13 @@ def add_product():
                 return render_template('product_form.html', title='Add New Product', form=form, footer_text="Elaborado por Kevin Castellanos")
         product = Product(
             name=form.name.data, description=form.description.data,
-            quantity=int(form.quantity.data), price=float(form.price.data),
+            quantity=int(form.quantity.data), price=parse_price(form.price.data),
             sku=form.sku.data if form.sku.data else None,
-            category=form.category.data, supplier=form.supplier.data
+            category=form.category.data, supplier=form.supplier.data,
+            reorder_point=int(form.reorder_point.data) if form.reorder_point.data else None
         )
         db.session.add(product)
-        db.session.commit()
+        db.session.flush() # Assigns product.id; product, movement and summary commit together
         if product.quantity > 0:
             initial_movement = InventoryMovement(
                 product_id=product.id, user_id=current_user.id,
@@ -121,16 +171,32 @@ def add_product():
                 notes='Product created with initial stock.'
             )
             db.session.add(initial_movement)
-            db.session.commit()
+        db.session.commit()
         flash('Product added successfully!', 'success')
         return redirect(url_for('main.products'))
     return render_template('product_form.html', title='Add New Product', form=form, footer_text="Elaborado por Kevin Castellanos")
 
+@main.route('/products/import', methods=['GET', 'POST'])
+@admin_required
+def import_products_upload():
+    form = ImportProductsForm()
+    result = None
+    if form.validate_on_submit():
+        upload = form.file.data
+        result = import_products(open_text_stream(upload.stream), detect_format(upload.filename), current_user.id)
+        flash(f'Imported {result.created} products, rejected {result.rejected} rows.',
+              'success' if not result.rejected else 'warning')
+    return render_template('import_products.html', title='Import Products', form=form, result=result, footer_text="Elaborado por Kevin Castellanos")
+
 @main.route('/product/<int:product_id>/edit', methods=['GET', 'POST'])
 @admin_required
 def edit_product(product_id):
     product = Product.query.get_or_404(product_id)
     form = ProductForm(obj=product)
+    # A sharded product's stock is the sum of its shards; its row only caches it (see shards.py)
+    current_quantity = current_stock(product)
+    if request.method == 'GET':
+        form.quantity.data = current_quantity
     if form.validate_on_submit():
         if product.name != form.name.data:
             existing_product_name = Product.query.filter_by(name=form.name.data).first()
@@ -143,23 +209,34 @@ def edit_product(product_id):
                 flash('Product SKU already exists.', 'danger')
                 return render_template('product_form.html', title='Edit Product', form=form, product=product, footer_text="Elaborado por Kevin Castellanos")
 
-        original_quantity = product.quantity
+        original_quantity = current_quantity
         new_quantity = int(form.quantity.data)
         product.name = form.name.data
         product.description = form.description.data
-        product.quantity = new_quantity
-        product.price = float(form.price.data)
+        product.price = parse_price(form.price.data)
         product.sku = form.sku.data if form.sku.data else None
         product.category = form.category.data
         product.supplier = form.supplier.data
-        product.last_updated = db.func.now()
+        product.reorder_point = int(form.reorder_point.data) if form.reorder_point.data else None
+        # Python-side timestamp (like the column default) keeps sub-second precision for API validators
+        product.last_updated = datetime.datetime.utcnow()
 
         if original_quantity != new_quantity:
+            # Applied as a delta with the same conditional UPDATE as stock movements, so a sale
+            # committed since the quantity was read is kept rather than overwritten
+            delta = new_quantity - original_quantity
+            db.session.flush() # The other edits first: their low_stock flag is computed from the loaded quantity
+            try:
+                quantity = apply_quantity_delta(product.id, delta)
+            except InsufficientStock as exc:
+                db.session.rollback()
+                flash(f'Cannot remove {exc.requested} units. Only {exc.available} available.', 'danger')
+                return render_template('product_form.html', title='Edit Product', form=form, product=product, footer_text="Elaborado por Kevin Castellanos")
             movement = InventoryMovement(
                 product_id=product.id, user_id=current_user.id,
-                quantity_change=new_quantity - original_quantity,
+                quantity_change=delta,
                 movement_type='adjustment_edit',
-                notes=f"Product details edited. Quantity changed from {original_quantity} to {new_quantity}."
+                notes=f"Product details edited. Quantity changed from {quantity - delta} to {quantity}."
             )
             db.session.add(movement)
         db.session.commit()
@@ -184,18 +261,11 @@ def add_stock(product_id):
     form = AddStockForm()
     if form.validate_on_submit():
         quantity_added = int(form.quantity_added.data)
-        product.quantity += quantity_added
-        product.last_updated = db.func.now()
-        movement = InventoryMovement(
-            product_id=product.id, user_id=current_user.id,
-            quantity_change=quantity_added, movement_type='stock_entry',
-            notes=form.notes.data
-        )
-        db.session.add(movement)
+        record_stock_movement(product.id, quantity_added, 'stock_entry', current_user.id, notes=form.notes.data)
         db.session.commit()
         flash(f'{quantity_added} units of {product.name} added to stock.', 'success')
         return redirect(url_for('main.products'))
-    return render_template('stock_adjustment_form.html', title=f'Add Stock for {product.name}', form=form, product=product, footer_text="Elaborado por Kevin Castellanos")
+    return render_template('stock_adjustment_form.html', title=f'Add Stock for {product.name}', form=form, product=product, current_quantity=current_stock(product), footer_text="Elaborado por Kevin Castellanos")
 
 @main.route('/product/<int:product_id>/remove_stock', methods=['GET', 'POST'])
 @admin_required
@@ -204,21 +274,53 @@ def remove_stock(product_id):
     form = RemoveStockForm()
     if form.validate_on_submit():
         quantity_removed = int(form.quantity_removed.data)
-        if quantity_removed > product.quantity:
-            flash(f'Cannot remove {quantity_removed} units. Only {product.quantity} available.', 'danger')
-            return render_template('stock_adjustment_form.html', title=f'Remove Stock for {product.name}', form=form, product=product, footer_text="Elaborado por Kevin Castellanos")
-        product.quantity -= quantity_removed
-        product.last_updated = db.func.now()
-        movement = InventoryMovement(
-            product_id=product.id, user_id=current_user.id,
-            quantity_change=-quantity_removed, movement_type=form.reason.data,
-            notes=form.notes.data
-        )
-        db.session.add(movement)
+        try:
+            # The availability check is part of the UPDATE itself, so concurrent sales cannot oversell
+            record_stock_movement(product.id, -quantity_removed, form.reason.data, current_user.id, notes=form.notes.data)
+        except InsufficientStock as exc:
+            db.session.rollback()
+            flash(f'Cannot remove {quantity_removed} units. Only {exc.available} available.', 'danger')
+            return render_template('stock_adjustment_form.html', title=f'Remove Stock for {product.name}', form=form, product=product, current_quantity=current_stock(product), footer_text="Elaborado por Kevin Castellanos")
         db.session.commit()
         flash(f'{quantity_removed} units of {product.name} removed from stock.', 'success')
         return redirect(url_for('main.products'))
-    return render_template('stock_adjustment_form.html', title=f'Remove Stock for {product.name}', form=form, product=product, footer_text="Elaborado por Kevin Castellanos")
+    return render_template('stock_adjustment_form.html', title=f'Remove Stock for {product.name}', form=form, product=product, current_quantity=current_stock(product), footer_text="Elaborado por Kevin Castellanos")
+
+def parse_batch_lines(text):
+    """Turn the batch form's textarea into batch lines: SKU or #id, delta, movement type[, reference ID]."""
+    lines = []
+    for row in csv.reader(io.StringIO(text)):
+        row = [value.strip() for value in row]
+        if not any(row):
+            continue
+        row += [''] * (4 - len(row))
+        product, delta, movement_type, reference_id = row[:4]
+        line = dict(delta=delta, movement_type=movement_type, reference_id=reference_id or None)
+        if product.startswith('#'):
+            line['product_id'] = product[1:]
+        else:
+            line['sku'] = product
+        lines.append(line)
+    return lines
+
+@main.route('/stock/batch', methods=['GET', 'POST'])
+@admin_required
+def batch_stock_adjustment():
+    form = BatchStockAdjustmentForm()
+    result = None
+    if form.validate_on_submit():
+        lines = parse_batch_lines(form.lines.data)
+        max_lines = current_app.config.get('STOCK_BATCH_MAX_LINES', 1000)
+        if len(lines) > max_lines:
+            flash(f'A batch can have at most {max_lines} lines.', 'danger')
+        else:
+            result = apply_batch(lines, current_user.id, atomic=(form.mode.data == 'atomic'))
+            if result.committed:
+                flash(f'Batch applied: {result.applied} lines applied, {result.rejected} rejected.',
+                      'success' if not result.rejected else 'warning')
+            else:
+                flash('Batch rejected: no lines were applied.', 'danger')
+    return render_template('batch_stock_form.html', title='Batch Stock Adjustment', form=form, result=result, footer_text="Elaborado por Kevin Castellanos")
 
 @main.route('/reports')
 @login_required
@@ -229,10 +331,18 @@ def reports_index():
 @login_required
 def low_stock_report():
     low_stock_threshold = current_app.config.get('LOW_STOCK_THRESHOLD', 10)
-    low_stock_products = Product.query.filter(Product.quantity <= low_stock_threshold)\
-                                      .order_by(Product.quantity.asc(), Product.name.asc()).all()
+    with use_replica():
+        version = catalogue_version()
+
+    def load_products():
+        # Reads only the flagged rows through ix_product_low_stock_quantity
+        with use_replica():
+            return Product.query.filter(Product.low_stock.is_(True))\
+                                .order_by(Product.quantity.asc(), Product.name.asc()).all()
+
     return render_template('low_stock_report.html',
-                           products=low_stock_products,
+                           load_products=load_products,
+                           catalogue_version=version,
                            low_stock_threshold=low_stock_threshold,
                            title="Reporte de Productos con Bajo Stock",
                            footer_text="Elaborado por Kevin Castellanos")
@@ -240,13 +350,165 @@ def low_stock_report():
 @main.route('/reports/inventory_movements')
 @login_required
 def inventory_movements_report():
-    # Placeholder: Add pagination and filtering later
-    movements = InventoryMovement.query.order_by(InventoryMovement.timestamp.desc()).limit(20).all()
+    per_page = request.args.get('per_page', current_app.config.get('MOVEMENTS_PER_PAGE', 50), type=int)
+    filters = parse_ledger_filters(request.args)
+    with use_replica():
+        version = catalogue_version()
+
+    def load_page():
+        try:
+            with use_replica():
+                return movement_page(filters, cursor=request.args.get('cursor'), per_page=per_page)
+        except InvalidCursor:
+            abort(400)
+
+    # Raw filter values are echoed back into the form and the pagination links.
+    filter_args = {key: request.args[key] for key in LEDGER_FILTER_ARGS if request.args.get(key)}
     return render_template('inventory_movements_report.html',
-                           movements=movements,
+                           load_page=load_page,
+                           catalogue_version=version,
+                           report_args=tuple(sorted(request.args.items(multi=True))),
+                           is_first_page=not request.args.get('cursor'),
+                           filter_args=filter_args,
                            title="Reporte de Movimientos de Inventario",
                            footer_text="Elaborado por Kevin Castellanos")
 
+@main.route('/reports/valuation')
+@login_required
+def valuation_report():
+    by = request.args.get('by', 'category')
+    try:
+        rows = inventory_valuation(by)
+    except ValueError:
+        abort(400)
+    return render_template('valuation_report.html',
+                           rows=rows,
+                           by=by,
+                           title="Reporte de Valor de Inventario",
+                           footer_text="Elaborado por Kevin Castellanos")
+
+@main.route('/reports/reorder')
+@login_required
+def reorder_report():
+    config = current_app.config
+    rows, error = [], None
+    try:
+        rows = reorder_suggestions(limit=config.get('FORECAST_REPORT_LIMIT', 200))
+    except ForecastUnavailable as exc:
+        error = str(exc)
+    return render_template('reorder_report.html',
+                           rows=rows,
+                           error=error,
+                           window_days=config.get('FORECAST_WINDOW_DAYS', 90),
+                           lead_time_days=config.get('FORECAST_LEAD_TIME_DAYS', 7),
+                           review_days=config.get('FORECAST_REVIEW_DAYS', 14),
+                           title="Sugerencias de Reabastecimiento",
+                           footer_text="Elaborado por Kevin Castellanos")
+
+@main.route('/reports/stock_as_of')
+@login_required
+def stock_as_of_report():
+    as_of_arg = request.args.get('as_of', '').strip()
+    snapshot, rows = None, None
+    if as_of_arg:
+        try:
+            as_of = parse_as_of(as_of_arg)
+        except ValueError:
+            abort(400)
+        snapshot, rows = stock_as_of(as_of)
+    return render_template('stock_as_of_report.html',
+                           as_of=as_of_arg,
+                           snapshot=snapshot,
+                           rows=rows,
+                           total_units=sum(row.quantity for row in rows) if rows else 0,
+                           title="Reporte de Stock a una Fecha",
+                           footer_text="Elaborado por Kevin Castellanos")
+
+@main.route('/export/<any(products, movements):kind>.<fmt>')
+@admin_required
+def export_data(kind, fmt):
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    try:
+        since = parse_since(request.args.get('since'))
+    except ValueError:
+        abort(400)
+    # stream_with_context keeps the app context (and its db session) alive while the body is generated
+    response = Response(stream_with_context(iter_export(kind, fmt, since)), mimetype=EXPORT_MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={kind}.{fmt}'
+    return response
+
+@main.route('/events/stock')
+@login_required
+def stock_events():
+    # Server-Sent Events for the live product list and low stock report (see events.py)
+    broker = get_event_broker()
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    subscription = broker.subscribe(last_event_id)
+    db.session.remove() # The stream never queries, so it must not hold a pooled connection
+    config = current_app.config
+    response = Response(event_stream(broker, subscription, heartbeat=config.get('EVENTS_HEARTBEAT', 15),
+                                     max_duration=config.get('EVENTS_STREAM_MAX_DURATION', 300)),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Disable proxy buffering (nginx)
+    return response
+
+@main.route('/jobs')
+@admin_required
+def jobs():
+    recent = Job.query.order_by(Job.id.desc()).limit(50).all()
+    return render_template('jobs.html', jobs=recent, job_kinds=JOB_KINDS, title="Trabajos en Segundo Plano",
+                           footer_text="Elaborado por Kevin Castellanos")
+
+@main.route('/jobs/<kind>', methods=['POST'])
+@admin_required
+def enqueue_job_view(kind):
+    job_kind = JOB_KINDS.get(kind)
+    if job_kind is None:
+        abort(404)
+    try:
+        params = job_kind.parse_params(request.form)
+    except ValueError:
+        abort(400)
+    job = enqueue_job(kind, params, user_id=current_user.id)
+    flash(f"'{job_kind.title}' queued as job #{job.id}.", "info")
+    return redirect(url_for('main.job_status', job_id=job.id))
+
+def _visible_job_or_404(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None or (current_user.role != 'admin' and job.user_id != current_user.id):
+        abort(404)
+    return job
+
+@main.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = _visible_job_or_404(job_id)
+    return render_template('job_status.html', job=job, job_kind=JOB_KINDS.get(job.kind), params=job_params(job),
+                           title=f"Trabajo #{job.id}", footer_text="Elaborado por Kevin Castellanos")
+
+@main.route('/jobs/<int:job_id>/download')
+@login_required
+def job_download(job_id):
+    job = _visible_job_or_404(job_id)
+    if job.status != 'succeeded':
+        abort(404)
+    return send_file(job_output_path(job), mimetype=job.result_mimetype, as_attachment=True,
+                     download_name=job.result_name)
+
+@main.route('/admin/performance')
+@admin_required
+def performance_report():
+    stats = get_request_stats()
+    return render_template('performance_report.html',
+                           enabled=stats is not None,
+                           rows=stats.summary() if stats is not None else [],
+                           window=current_app.config.get('INSTRUMENTATION_WINDOW', 1000),
+                           startup=get_startup_timings(current_app),
+                           title="Rendimiento por Endpoint",
+                           footer_text="Elaborado por Kevin Castellanos")
+
 @main.route('/account')
 @login_required
 def account():
@@ -0,0 +1,150 @@
+# Product search.
+# On SQLite the catalogue is indexed in an FTS5 virtual table (product_fts) over the searchable
+# product columns plus the category and supplier names, read through the product_search_content
+# view. Triggers on the product table keep it in sync for every write, ORM or Core; lookup names
+# are never renamed in place (see facets.py), so the category and supplier tables need none.
+# Other databases fall back to a portable LIKE scan until a native backend is added to
+# SEARCH_BACKENDS.
+
+import re
+
+from flask import current_app
+from sqlalchemy import DDL, event, or_, select, text
+
+from . import db
+from .models import Product
+
+SEARCH_COLUMNS = ('name', 'description', 'sku', 'category', 'supplier')
+_columns = ', '.join(SEARCH_COLUMNS)
+
+
+def _values(row):
+    """Column values of a product trigger row (new or old), with the lookup names selected by id."""
+    return (f'{row}.name, {row}.description, {row}.sku, '
+            f'(SELECT name FROM category WHERE id = {row}.category_id), '
+            f'(SELECT name FROM supplier WHERE id = {row}.supplier_id)')
+
+
+# External-content FTS5 table: the text lives in product and the lookup tables, the index in product_fts.
+# prefix='2 3' adds prefix indexes so type-ahead queries do not scan the whole term list.
+FTS5_DDL = (
+    "CREATE VIEW IF NOT EXISTS product_search_content AS "
+    "SELECT product.id AS id, product.name AS name, product.description AS description, product.sku AS sku, "
+    "category.name AS category, supplier.name AS supplier FROM product "
+    "LEFT JOIN category ON category.id = product.category_id "
+    "LEFT JOIN supplier ON supplier.id = product.supplier_id",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5({_columns}, content='product_search_content', "
+    f"content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f"CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN "
+    f"INSERT INTO product_fts(rowid, {_columns}) VALUES (new.id, {_values('new')}); END",
+    f"CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN "
+    f"INSERT INTO product_fts(product_fts, rowid, {_columns}) VALUES ('delete', old.id, {_values('old')}); END",
+    # Stock changes only touch quantity/last_updated, so they do not fire this trigger.
+    f"CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF name, description, sku, category_id, supplier_id "
+    f"ON product BEGIN "
+    f"INSERT INTO product_fts(product_fts, rowid, {_columns}) VALUES ('delete', old.id, {_values('old')}); "
+    f"INSERT INTO product_fts(rowid, {_columns}) VALUES (new.id, {_values('new')}); END",
+)
+# Objects to drop before the product table (or its indexed columns) changes
+FTS5_DROP = ('DROP TRIGGER IF EXISTS product_fts_ai', 'DROP TRIGGER IF EXISTS product_fts_ad',
+             'DROP TRIGGER IF EXISTS product_fts_au', 'DROP TABLE IF EXISTS product_fts',
+             'DROP VIEW IF EXISTS product_search_content')
+
+
+def fts5_available(connection):
+    if connection.dialect.name != 'sqlite':
+        return False
+    return bool(connection.execute(text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar())
+
+
+def _create_fts5_if_available(ddl, target, bind, **kw):
+    return fts5_available(bind)
+
+
+for _statement in FTS5_DDL:
+    event.listen(Product.__table__, 'after_create', DDL(_statement).execute_if(callable_=_create_fts5_if_available))
+for _statement in FTS5_DROP[3:]:
+    event.listen(Product.__table__, 'before_drop', DDL(_statement).execute_if(dialect='sqlite'))
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query or '', flags=re.UNICODE)
+
+
+class LikeSearchBackend:
+    """Portable fallback: every term must appear in one of the searchable columns (full scan)."""
+    name = 'like'
+
+    def search(self, query, limit):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        statement = select(Product.id)
+        for term in terms:
+            statement = statement.where(or_(*(getattr(Product, column).icontains(term, autoescape=True)
+                                              for column in SEARCH_COLUMNS)))
+        return list(db.session.execute(statement.order_by(Product.name).limit(limit)).scalars())
+
+
+class FTS5SearchBackend:
+    """SQLite FTS5: every term is matched as a prefix, results ranked by bm25."""
+    name = 'fts5'
+
+    def search(self, query, limit):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        match = ' '.join('"{}"*'.format(term) for term in terms)
+        rows = db.session.execute(
+            text('SELECT rowid FROM product_fts WHERE product_fts MATCH :match ORDER BY rank LIMIT :limit'),
+            {'match': match, 'limit': limit})
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def rebuild():
+        """Create the FTS objects if missing (older databases) and reindex every product."""
+        connection = db.session.connection()
+        for statement in FTS5_DDL:
+            connection.execute(text(statement))
+        connection.execute(text("INSERT INTO product_fts(product_fts) VALUES ('rebuild')"))
+        db.session.commit()
+
+
+SEARCH_BACKENDS = {
+    'fts5': FTS5SearchBackend,
+    'like': LikeSearchBackend,
+}
+
+
+def _fts5_index_exists(connection):
+    return fts5_available(connection) and connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_fts'")).first() is not None
+
+
+def get_search_backend():
+    """Backend named by SEARCH_BACKEND config; 'auto' picks FTS5 when its index exists, LIKE otherwise."""
+    name = current_app.config.get('SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        # Resolved once per app; rebuild_search_index() resets it
+        name = current_app.extensions.get('search_backend')
+        if name is None:
+            name = 'fts5' if _fts5_index_exists(db.session.connection()) else 'like'
+            current_app.extensions['search_backend'] = name
+    return SEARCH_BACKENDS[name]()
+
+
+def rebuild_search_index():
+    """Rebuild the native index where there is one. Returns the backend name now in use."""
+    if fts5_available(db.session.connection()):
+        FTS5SearchBackend.rebuild()
+    current_app.extensions.pop('search_backend', None)
+    return get_search_backend().name
+
+
+def search_products(query, limit=20):
+    """Return matching Product objects, best match first."""
+    ids = get_search_backend().search(query, limit)
+    if not ids:
+        return []
+    products = {product.id: product for product in Product.query.filter(Product.id.in_(ids))}
+    return [products[product_id] for product_id in ids if product_id in products]
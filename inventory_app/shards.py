@@ -0,0 +1,201 @@
+# Sharded stock counters for hot products.
+# Every stock change of a product normally updates its product row, so during a promotion all
+# sales of a top SKU queue on that one row lock. A product switched to sharded mode
+# (shard_product) keeps its stock in Product.stock_shards StockShard rows instead: an increment
+# goes to a random shard, and a decrement is the usual conditional UPDATE (quantity + delta >= 0)
+# on one shard, trying the shards in turn from a random one and only spreading over several
+# when no single shard holds enough. Shards never go negative, so neither does their sum, which
+# is the product's stock. Under heavy contention a decrement may be refused while units are
+# briefly moving between shards; it is never applied without the stock to cover it.
+#
+# Sharded writes leave the product row and the inventory summary counters alone; they only move
+# the summary's catalogue version, so the caches keyed on it (movement ledger, API ETags) pick up
+# the new movements. Product.quantity, low_stock and the summary counters are brought up to the
+# shard totals by fold_stock_shards(), run by `flask fold-stock-shards`, which also evens the
+# shards out again. Listings and reports show sharded products as of the last
+# fold; the availability check, the stock.changed events, snapshots and reconciliation use the
+# shard totals.
+
+import datetime
+import random
+
+from sqlalchemy import case, delete, event, func, insert, select, update
+
+from . import db
+from .models import Product, StockShard
+from . import summary
+
+
+def live_quantity(table=None):
+    """SQL expression for a product's current stock: its shard total when sharded, else quantity."""
+    table = table if table is not None else Product.__table__
+    shard = StockShard.__table__
+    total = select(func.coalesce(func.sum(shard.c.quantity), 0))\
+        .where(shard.c.product_id == table.c.id).scalar_subquery()
+    return case((table.c.stock_shards.is_(None), table.c.quantity), else_=total)
+
+
+def shard_totals(product_ids):
+    """{product id: stock} summed over the shards of the given products."""
+    shard = StockShard.__table__
+    return dict(db.session.execute(select(shard.c.product_id, func.sum(shard.c.quantity))
+                                   .where(shard.c.product_id.in_(product_ids))
+                                   .group_by(shard.c.product_id)).all())
+
+
+def shard_total(product_id):
+    return shard_totals([product_id]).get(product_id, 0)
+
+
+def current_stock(product):
+    """Stock of a loaded Product: its shard total when sharded, else its quantity."""
+    return shard_total(product.id) if product.stock_shards is not None else product.quantity
+
+
+def _shard_update(product_id, shard, delta):
+    """Conditionally add `delta` to one shard; True if it applied."""
+    table = StockShard.__table__
+    new_quantity = table.c.quantity + delta
+    return db.session.execute(update(table).where(table.c.product_id == product_id, table.c.shard == shard,
+                                                  new_quantity >= 0)
+                              .values(quantity=new_quantity)).rowcount > 0
+
+
+def _take_across_shards(product_id, units):
+    """Remove `units` spread over several shards, fullest first. Returns False (and puts back what
+    was taken) if the shards do not hold enough."""
+    table = StockShard.__table__
+    rows = db.session.execute(select(table.c.shard, table.c.quantity)
+                              .where(table.c.product_id == product_id, table.c.quantity > 0)
+                              .order_by(table.c.quantity.desc())).all()
+    taken, remaining = {}, units
+    for shard, quantity in rows:
+        take = min(quantity, remaining)
+        if _shard_update(product_id, shard, -take): # Fails if a concurrent sale emptied it meanwhile
+            taken[shard] = take
+            remaining -= take
+        if not remaining:
+            return True
+    for shard, take in taken.items():
+        _shard_update(product_id, shard, take)
+    return False
+
+
+def apply_shard_delta(product_id, shards, delta):
+    """Add `delta` to a sharded product's stock and return the new total, or None if a
+    decrement is not covered (or the product stopped being sharded). Does not commit."""
+    start = random.randrange(shards)
+    if delta > 0:
+        applied = _shard_update(product_id, start, delta)
+    else:
+        applied = any(_shard_update(product_id, (start + offset) % shards, delta) for offset in range(shards)) \
+            or _take_across_shards(product_id, -delta)
+    return shard_total(product_id) if applied else None
+
+
+def _even_out(product_id):
+    """Move stock from the fullest shards to the emptiest so each holds about the same."""
+    table = StockShard.__table__
+    rows = db.session.execute(select(table.c.shard, table.c.quantity).where(table.c.product_id == product_id)
+                              .order_by(table.c.shard)).all()
+    if not rows:
+        return
+    share, extra = divmod(sum(quantity for _, quantity in rows), len(rows))
+    targets = {shard: share + (1 if index < extra else 0) for index, (shard, _) in enumerate(rows)}
+    # Only what actually left a shard is handed out, so concurrent sales cannot make stock appear
+    moved = 0
+    for shard, quantity in rows:
+        if quantity > targets[shard] and _shard_update(product_id, shard, targets[shard] - quantity):
+            moved += quantity - targets[shard]
+    for shard, quantity in rows:
+        give = min(targets[shard] - quantity, moved)
+        if give > 0:
+            _shard_update(product_id, shard, give)
+            moved -= give
+    if moved:
+        _shard_update(product_id, rows[0].shard, moved)
+
+
+def _store_quantity(product_id, old_quantity, reorder_point, quantity, **values):
+    """Write `quantity` into the product row and return the summary (units, low stock) deltas."""
+    table = Product.__table__
+    stored = db.session.execute(update(table).where(table.c.id == product_id).values(
+        quantity=quantity, low_stock=summary.is_low_stock(quantity, reorder_point=reorder_point),
+        last_updated=datetime.datetime.utcnow(), **values)).rowcount
+    if not stored: # Deleted meanwhile; the delete already took its last folded quantity off the summary
+        return 0, 0
+    units_delta, low_delta = summary.quantity_change_delta(old_quantity, quantity, reorder_point)
+    if low_delta:
+        summary.queue_low_stock_change(db.session(), product_id, low_delta > 0)
+    return units_delta, low_delta
+
+
+def fold_stock_shards(product_ids=None):
+    """Copy the shard totals of sharded products (all, or those in `product_ids`) into
+    Product.quantity and the summary, and even out their shards. Does not commit.
+
+    Returns the number of products whose quantity changed.
+    """
+    table = Product.__table__
+    query = select(table.c.id, table.c.quantity, table.c.reorder_point).where(table.c.stock_shards.isnot(None))
+    if product_ids is not None:
+        query = query.where(table.c.id.in_(product_ids))
+    products = db.session.execute(query).all()
+    totals = shard_totals([row.id for row in products]) if products else {}
+    changed = units_delta = low_delta = 0
+    for row in products:
+        _even_out(row.id)
+        total = totals.get(row.id, 0)
+        if total != row.quantity:
+            line_units, line_low = _store_quantity(row.id, row.quantity, row.reorder_point, total)
+            units_delta += line_units
+            low_delta += line_low
+            changed += 1
+    if changed:
+        summary.apply_delta(db.session.connection(), total_units=units_delta, low_stock_count=low_delta)
+    return changed
+
+
+def unshard_product(product_id):
+    """Move a sharded product's stock back into Product.quantity. Returns its quantity. Does not commit."""
+    table = Product.__table__
+    product = db.session.execute(select(table.c.quantity, table.c.reorder_point, table.c.stock_shards)
+                                 .where(table.c.id == product_id)).first()
+    if product is None or product.stock_shards is None:
+        return None if product is None else product.quantity
+    shard = StockShard.__table__
+    removed = delete(shard).where(shard.c.product_id == product_id)
+    if db.session.get_bind().dialect.delete_returning:
+        # Exactly the stock that was in the rows deleted, even with sales landing meanwhile
+        total = sum(db.session.execute(removed.returning(shard.c.quantity)).scalars())
+    else:
+        total = shard_total(product_id)
+        db.session.execute(removed)
+    units_delta, low_delta = _store_quantity(product_id, product.quantity, product.reorder_point, total,
+                                             stock_shards=None)
+    summary.apply_delta(db.session.connection(), total_units=units_delta, low_stock_count=low_delta)
+    return total
+
+
+def shard_product(product_id, shards):
+    """Split a product's stock over `shards` counter rows (re-splitting it if already sharded).
+    Returns its quantity, or None if the product does not exist. Does not commit."""
+    if shards < 2:
+        raise ValueError('A sharded product needs at least 2 shards.')
+    total = unshard_product(product_id)
+    if total is None:
+        return None
+    share, extra = divmod(total, shards)
+    db.session.execute(insert(StockShard.__table__), [
+        {'product_id': product_id, 'shard': shard, 'quantity': share + (1 if shard < extra else 0)}
+        for shard in range(shards)])
+    table = Product.__table__
+    db.session.execute(update(table).where(table.c.id == product_id).values(stock_shards=shards))
+    return total
+
+
+@event.listens_for(Product, 'after_delete')
+def _product_deleted(mapper, connection, target):
+    if target.stock_shards is not None: # Without enforced foreign keys (SQLite) the cascade does not run
+        shard = StockShard.__table__
+        connection.execute(delete(shard).where(shard.c.product_id == target.id))
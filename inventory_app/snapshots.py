@@ -0,0 +1,106 @@
+# Periodic stock snapshots.
+# A snapshot copies every product's quantity into stock_snapshot_line and records the id of the
+# newest InventoryMovement it already reflects. The stock of any product at a past moment is then
+# the nearest snapshot taken at or before that moment plus the movements recorded after it, so a
+# point-in-time query replays only the ledger since the checkpoint instead of the whole history.
+# Archived movements (archive.py) are added from their per-segment totals. Sharded products are
+# copied with their shard totals, which may be ahead of the quantity cached in the product row.
+
+import collections
+import datetime
+
+from sqlalchemy import and_, func, insert, literal, or_, select
+
+from . import db
+from .archive import archived_deltas, latest_archived_id
+from .models import Product, InventoryMovement, StockSnapshot, StockSnapshotLine
+from .shards import live_quantity
+
+
+def latest_snapshot(as_of=None):
+    """Newest snapshot taken at or before `as_of` (or at all), or None."""
+    query = StockSnapshot.query
+    if as_of is not None:
+        query = query.filter(StockSnapshot.taken_at <= as_of)
+    return query.order_by(StockSnapshot.taken_at.desc(), StockSnapshot.id.desc()).first()
+
+
+def take_snapshot(force=False):
+    """Checkpoint every product's current quantity and commit. Returns the new StockSnapshot.
+
+    Unless `force` is set, returns None without writing anything when no movement has been
+    recorded since the previous snapshot. The copy is a single INSERT ... SELECT; when called
+    outside a transaction it runs in a SERIALIZABLE one, so the quantities and last_movement_id
+    describe the same state.
+    """
+    if db.session().in_transaction():
+        connection = db.session.connection()
+    else:
+        connection = db.session.connection(execution_options={'isolation_level': 'SERIALIZABLE'})
+    movement_table = InventoryMovement.__table__
+    last_movement_id = max(connection.execute(select(func.coalesce(func.max(movement_table.c.id), 0))).scalar(),
+                           latest_archived_id())
+    previous = latest_snapshot()
+    if not force and previous is not None and previous.last_movement_id == last_movement_id:
+        db.session.rollback()
+        return None
+
+    product_table = Product.__table__
+    quantity = live_quantity(product_table)
+    product_count, total_units = connection.execute(select(
+        func.count(product_table.c.id), func.coalesce(func.sum(quantity), 0))).one()
+    snapshot = StockSnapshot(taken_at=datetime.datetime.utcnow(), last_movement_id=last_movement_id,
+                             product_count=product_count, total_units=total_units)
+    db.session.add(snapshot)
+    db.session.flush()
+    connection.execute(insert(StockSnapshotLine.__table__).from_select(
+        ['snapshot_id', 'product_id', 'quantity'],
+        select(literal(snapshot.id), product_table.c.id, quantity)))
+    db.session.commit()
+    return snapshot
+
+
+StockRow = collections.namedtuple('StockRow', 'id name sku quantity')
+
+
+def stock_as_of(as_of):
+    """Return (snapshot used or None, rows) with each product's quantity at `as_of` (inclusive).
+
+    Rows are (product id, name, sku, quantity) ordered by name, for products added at or before
+    `as_of`. Without an earlier snapshot the ledger is replayed from the beginning.
+    """
+    snapshot = latest_snapshot(as_of)
+    after_id = snapshot.last_movement_id if snapshot else 0
+    movement_table = InventoryMovement.__table__
+    movements_since = select(movement_table.c.product_id, func.sum(movement_table.c.quantity_change).label('delta'))\
+        .where(movement_table.c.id > after_id,
+               movement_table.c.timestamp <= as_of)\
+        .group_by(movement_table.c.product_id)\
+        .subquery()
+
+    product_table = Product.__table__
+    quantity = func.coalesce(movements_since.c.delta, 0)
+    statement = select(product_table.c.id, product_table.c.name, product_table.c.sku)
+    if snapshot is not None:
+        line_table = StockSnapshotLine.__table__
+        statement = statement.outerjoin(line_table, and_(line_table.c.snapshot_id == snapshot.id,
+                                                         line_table.c.product_id == product_table.c.id))
+        quantity = func.coalesce(line_table.c.quantity, 0) + quantity
+    statement = statement.add_columns(quantity.label('quantity'))\
+        .outerjoin(movements_since, movements_since.c.product_id == product_table.c.id)\
+        .where(or_(product_table.c.date_added.is_(None), product_table.c.date_added <= as_of))\
+        .order_by(product_table.c.name, product_table.c.id)
+    rows = db.session.execute(statement).all()
+    deltas = archived_deltas(after_id, as_of)
+    if deltas:
+        rows = [StockRow(row.id, row.name, row.sku, row.quantity + deltas.get(row.id, 0)) for row in rows]
+    return snapshot, rows
+
+
+def parse_as_of(value):
+    """Parse an ISO date or datetime. A bare date means the end of that day."""
+    value = (value or '').strip()
+    try:
+        return datetime.datetime.combine(datetime.date.fromisoformat(value), datetime.time.max)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value)
@@ -0,0 +1,107 @@
+/* Live updates for the product list and the low stock report, pushed over Server-Sent Events
+   (/events/stock) instead of reloading the page on a timer.
+   data-mode="products": quantities are patched in place; new or deleted products reload the page.
+   data-mode="low-stock": listed quantities are patched in place; the report reloads when a product
+   enters or leaves it, runs out, or is edited or deleted. */
+(function () {
+    var script = document.currentScript;
+    if (!script || !window.EventSource) {
+        return;
+    }
+    var mode = script.getAttribute('data-mode');
+    var source = new EventSource(script.getAttribute('data-events-url'));
+    var reloadTimer = null;
+
+    function reloadSoon() {
+        // Coalesce bursts (batch adjustments) into a single reload
+        if (reloadTimer === null) {
+            reloadTimer = window.setTimeout(function () { window.location.reload(); }, 2000);
+        }
+    }
+
+    function rowFor(productId) {
+        return document.querySelector('tr[data-product-id="' + productId + '"]');
+    }
+
+    // Products that reloaded the report without showing up in it. A sharded product is listed only
+    // after its next fold, so until then its sales must not reload the page over and over.
+    var unlistedKey = 'stock-events:unlisted';
+
+    function loadUnlisted() {
+        try {
+            return JSON.parse(window.sessionStorage.getItem(unlistedKey) || '{}');
+        } catch (e) {
+            return {};
+        }
+    }
+
+    function saveUnlisted() {
+        try {
+            window.sessionStorage.setItem(unlistedKey, JSON.stringify(unlisted));
+        } catch (e) {
+            // Storage disabled: such products may reload the report again
+        }
+    }
+
+    var unlisted = mode === 'low-stock' ? loadUnlisted() : {};
+    Object.keys(unlisted).forEach(function (productId) {
+        if (rowFor(productId)) {
+            delete unlisted[productId];
+        }
+    });
+    saveUnlisted();
+
+    function onLowStockChange(event, data, row) {
+        if (!row) {
+            if (data.low_stock && event.type !== 'product.deleted') {
+                if (!unlisted[data.product_id]) { // Entered low stock
+                    unlisted[data.product_id] = true;
+                    saveUnlisted();
+                    reloadSoon();
+                }
+            } else if (unlisted[data.product_id]) {
+                delete unlisted[data.product_id];
+                saveUnlisted();
+            }
+            return;
+        }
+        if (event.type !== 'stock.changed' || !data.low_stock) {
+            reloadSoon(); // Edited, deleted or no longer low
+            return;
+        }
+        var quantity = row.querySelector('[data-field="quantity"]');
+        if (quantity && data.quantity !== undefined) {
+            if ((data.quantity === 0) !== (quantity.textContent.trim() === '0')) {
+                reloadSoon(); // The out-of-stock badge and row colour change
+            }
+            quantity.textContent = data.quantity;
+        }
+    }
+
+    function onChange(event) {
+        var data = JSON.parse(event.data);
+        var row = rowFor(data.product_id);
+        if (mode === 'low-stock') {
+            onLowStockChange(event, data, row);
+            return;
+        }
+        if (event.type === 'product.created' || event.type === 'product.deleted') {
+            reloadSoon();
+            return;
+        }
+        if (!row) {
+            return;
+        }
+        var quantity = row.querySelector('[data-field="quantity"]');
+        if (quantity && data.quantity !== undefined) {
+            quantity.textContent = data.quantity;
+        }
+        if (event.type === 'product.updated' || data.low_stock !== (row.getAttribute('data-low-stock') === 'true')) {
+            reloadSoon(); // Badges, row colours and the summary depend on more than the quantity
+        }
+    }
+
+    ['stock.changed', 'product.created', 'product.updated', 'product.deleted'].forEach(function (type) {
+        source.addEventListener(type, onChange);
+    });
+})();
@@ -0,0 +1,275 @@
+# Stock mutations.
+# Quantities are changed with a single conditional UPDATE evaluated by the database
+# (quantity = quantity + delta WHERE quantity + delta >= 0), never by reading the row into
+# Python first, so concurrent writers cannot lose each other's updates or oversell.
+# Callers add the InventoryMovement and commit, keeping both in one transaction. Every applied
+# change queues a stock.changed event, published to live viewers after the commit (events.py).
+# Products in sharded mode keep their stock in StockShard rows instead (shards.py): the UPDATE of
+# the product row does not match them, and the change is applied to a shard.
+
+import collections
+import datetime
+
+from sqlalchemy import insert, select, update
+
+from . import db
+from .models import Product, InventoryMovement
+from . import events, shards, summary
+
+# Stands in for the product row returned by the UPDATE when the change went to a shard
+ShardedStock = collections.namedtuple('ShardedStock', 'quantity reorder_point')
+
+
+class StockError(Exception):
+    pass
+
+
+class ProductNotFound(StockError):
+    def __init__(self, product_id):
+        super().__init__(f'Product {product_id} does not exist.')
+        self.product_id = product_id
+
+
+class InsufficientStock(StockError):
+    def __init__(self, product_id, requested, available):
+        super().__init__(f'Cannot remove {requested} units. Only {available} available.')
+        self.product_id = product_id
+        self.requested = requested
+        self.available = available
+
+
+def _update_quantity(product_id, delta):
+    """Run the conditional UPDATE (which also sets the low_stock flag) and return the product's
+    (new quantity, reorder point) row, or None if it did not apply."""
+    table = Product.__table__
+    new_quantity = table.c.quantity + delta
+    statement = update(table)\
+        .where(table.c.id == product_id, table.c.stock_shards.is_(None), new_quantity >= 0)\
+        .values(quantity=new_quantity, low_stock=summary.low_stock_expression(table, new_quantity),
+                last_updated=datetime.datetime.utcnow())
+    if db.session.get_bind().dialect.update_returning:
+        return db.session.execute(statement.returning(table.c.quantity, table.c.reorder_point)).first()
+    if db.session.execute(statement).rowcount:
+        return db.session.execute(select(table.c.quantity, table.c.reorder_point).where(table.c.id == product_id)).first()
+    return None
+
+
+def _queue_stock_event(product_id, row):
+    events.queue_product_event(db.session(), 'stock.changed', product_id, quantity=row.quantity,
+                               low_stock=summary.is_low_stock(row.quantity, reorder_point=row.reorder_point))
+
+
+def _quantity_change_deltas(product_id, delta, row):
+    """Return the summary deltas for an applied update; queue its live event and low-stock crossing, if any."""
+    if isinstance(row, ShardedStock):
+        _queue_stock_event(product_id, row)
+        return 0, 0 # Folded into the product row and the summary later (shards.fold_stock_shards)
+    units_delta, low_delta = summary.quantity_change_delta(row.quantity - delta, row.quantity, row.reorder_point)
+    if low_delta:
+        summary.queue_low_stock_change(db.session(), product_id, low_delta > 0)
+    _queue_stock_event(product_id, row)
+    return units_delta, low_delta
+
+
+def _apply_change(product_id, delta):
+    """Apply `delta` to the product row or, for a sharded product, to one of its shards.
+
+    Returns the (quantity, reorder_point) row after the change. Raises InsufficientStock or
+    ProductNotFound, in which case nothing is written.
+    """
+    row = _update_quantity(product_id, delta)
+    if row is not None:
+        return row
+    table = Product.__table__
+    product = db.session.execute(select(table.c.quantity, table.c.reorder_point, table.c.stock_shards)
+                                 .where(table.c.id == product_id)).first()
+    if product is None:
+        raise ProductNotFound(product_id)
+    if product.stock_shards is None:
+        raise InsufficientStock(product_id, -delta, product.quantity)
+    quantity = shards.apply_shard_delta(product_id, product.stock_shards, delta)
+    if quantity is None:
+        raise InsufficientStock(product_id, -delta, shards.shard_total(product_id))
+    return ShardedStock(quantity, product.reorder_point)
+
+
+def apply_quantity_delta(product_id, delta):
+    """Atomically add `delta` (may be negative) to a product's quantity and return the new quantity.
+
+    Raises InsufficientStock if the result would be negative and ProductNotFound if the product
+    does not exist; in both cases nothing is written. Does not commit.
+    """
+    row = _apply_change(product_id, delta)
+
+    # Core UPDATEs bypass the Product mapper events, so the summary is adjusted here. Sharded
+    # changes leave its counters to the fold but still move the catalogue version (cache keys).
+    units_delta, low_delta = _quantity_change_deltas(product_id, delta, row)
+    summary.apply_delta(db.session.connection(), total_units=units_delta, low_stock_count=low_delta)
+    return row.quantity
+
+
+def record_stock_movement(product_id, delta, movement_type, user_id, notes=None, reference_id=None):
+    """Apply a stock change and add its InventoryMovement to the session. Returns the new quantity."""
+    new_quantity = apply_quantity_delta(product_id, delta)
+    db.session.add(InventoryMovement(
+        product_id=product_id, user_id=user_id,
+        quantity_change=delta, movement_type=movement_type,
+        notes=notes, reference_id=reference_id,
+    ))
+    return new_quantity
+
+
+class BatchLineResult:
+    def __init__(self, index, line):
+        self.index = index
+        self.product_id = line.get('product_id')
+        self.sku = line.get('sku')
+        self.delta = line.get('delta')
+        self.status = 'pending' # 'applied', 'rejected' or 'not_applied' (rolled back with the batch)
+        self.error = None
+        self.new_quantity = None
+
+    def reject(self, message):
+        self.status = 'rejected'
+        self.error = message
+
+    def as_dict(self):
+        return {'line': self.index, 'product_id': self.product_id, 'sku': self.sku, 'delta': self.delta,
+                'status': self.status, 'error': self.error, 'new_quantity': self.new_quantity}
+
+
+class BatchResult:
+    def __init__(self, lines, committed):
+        self.lines = lines
+        self.committed = committed
+
+    @property
+    def applied(self):
+        return sum(1 for line in self.lines if line.status == 'applied')
+
+    @property
+    def rejected(self):
+        return sum(1 for line in self.lines if line.status == 'rejected')
+
+    def as_dict(self):
+        return {'committed': self.committed, 'applied': self.applied, 'rejected': self.rejected,
+                'lines': [line.as_dict() for line in self.lines]}
+
+
+def _validate_batch_line(line, result):
+    if not isinstance(line, dict):
+        result.reject('Line must be an object.')
+        return None
+    product_id, sku = line.get('product_id'), line.get('sku')
+    if product_id is not None:
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            result.reject('product_id must be a whole number.')
+            return None
+    elif sku:
+        sku = str(sku)
+    else:
+        result.reject('Either product_id or sku is required.')
+        return None
+    try:
+        delta = int(line.get('delta'))
+        if isinstance(line.get('delta'), bool) or delta == 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        result.reject('delta must be a non-zero whole number.')
+        return None
+    movement_type = str(line.get('movement_type') or '').strip()
+    if not movement_type or len(movement_type) > 50:
+        result.reject('movement_type is required (max 50 characters).')
+        return None
+    reference_id = line.get('reference_id')
+    if reference_id is not None and len(str(reference_id)) > 100:
+        result.reject('reference_id cannot be longer than 100 characters.')
+        return None
+    notes = line.get('notes')
+    if notes is not None and (not isinstance(notes, str) or len(notes) > 500): # The stock forms' limit
+        result.reject('notes must be text of at most 500 characters.')
+        return None
+    return dict(product_id=product_id, sku=sku, delta=delta, movement_type=movement_type,
+                reference_id=str(reference_id) if reference_id is not None else None,
+                notes=notes)
+
+
+def apply_batch(lines, user_id, atomic=True):
+    """Apply many stock adjustment lines in one transaction and report a result per line.
+
+    Each line is a dict with `product_id` or `sku`, `delta`, `movement_type` and optionally
+    `reference_id` and `notes`. Products are resolved with one query, each quantity change is
+    the same conditional UPDATE used for single adjustments, the movements are written with one
+    bulk INSERT and the summary is adjusted once. With `atomic` any failing line rolls back the
+    whole batch; otherwise failing lines are skipped and the rest is committed.
+    """
+    results = [BatchLineResult(index, line if isinstance(line, dict) else {}) for index, line in enumerate(lines)]
+    validated = [_validate_batch_line(line, result) for line, result in zip(lines, results)]
+
+    # Resolve every referenced product with a single query
+    wanted_ids = {values['product_id'] for values in validated if values and values['product_id'] is not None}
+    wanted_skus = {values['sku'] for values in validated if values and values['product_id'] is None}
+    table = Product.__table__
+    known_ids, ids_by_sku = set(), {}
+    if wanted_ids or wanted_skus:
+        rows = db.session.execute(select(table.c.id, table.c.sku).where(
+            table.c.id.in_(wanted_ids) | table.c.sku.in_(wanted_skus)))
+        for product_id, sku in rows:
+            known_ids.add(product_id)
+            ids_by_sku[sku] = product_id
+
+    for values, result in zip(validated, results):
+        if values is None:
+            continue
+        if values['product_id'] is not None:
+            if values['product_id'] in known_ids:
+                result.product_id = values['product_id']
+            else:
+                result.reject(f"Unknown product_id: {values['product_id']}")
+        elif values['sku'] in ids_by_sku:
+            result.product_id = ids_by_sku[values['sku']]
+        else:
+            result.reject(f"Unknown sku: {values['sku']}")
+
+    if atomic and any(result.status == 'rejected' for result in results):
+        for result in results:
+            if result.status == 'pending':
+                result.status = 'not_applied'
+        return BatchResult(results, committed=False)
+
+    movements, units_delta, low_delta = [], 0, 0
+    for values, result in zip(validated, results):
+        if result.status != 'pending':
+            continue
+        try:
+            row = _apply_change(result.product_id, values['delta'])
+        except StockError as exc:
+            result.reject(str(exc))
+            if atomic:
+                break
+            continue
+        result.status = 'applied'
+        result.new_quantity = row.quantity
+        line_units, line_low = _quantity_change_deltas(result.product_id, values['delta'], row)
+        units_delta += line_units
+        low_delta += line_low
+        movements.append(dict(product_id=result.product_id, user_id=user_id, quantity_change=values['delta'],
+                              movement_type=values['movement_type'], reference_id=values['reference_id'],
+                              notes=values['notes']))
+
+    if atomic and any(result.status == 'rejected' for result in results):
+        db.session.rollback()
+        for result in results:
+            if result.status in ('pending', 'applied'):
+                result.status = 'not_applied'
+                result.new_quantity = None
+        return BatchResult(results, committed=False)
+
+    if movements:
+        # render_nulls keeps rows with and without optional values in a single executemany
+        db.session.execute(insert(InventoryMovement).execution_options(render_nulls=True), movements)
+        summary.apply_delta(db.session.connection(), total_units=units_delta, low_stock_count=low_delta)
+    db.session.commit()
+    return BatchResult(results, committed=True)
@@ -0,0 +1,199 @@
+# Incrementally maintained inventory summary (product count, total units, low-stock count).
+# Every product write adjusts the single inventory_summary row with a relative UPDATE on the
+# same connection, so the counters commit or roll back together with the write itself.
+# The same writes keep Product.low_stock current (quantity at or below the product's reorder
+# point, or LOW_STOCK_THRESHOLD when it has none) and announce every product that enters or
+# leaves low stock through the low_stock_changed signal once the transaction commits.
+# ORM writes are picked up by the mapper events below; code that changes products with bulk or
+# Core statements must set low_stock, call apply_delta() and queue_low_stock_change() itself.
+
+import datetime
+
+from blinker import Namespace
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+
+from . import db
+from .database import use_replica
+from .models import Product, InventorySummary
+
+SUMMARY_ID = 1
+_CHANGES_KEY = 'low_stock_changes'
+
+_signals = Namespace()
+# Sent after commit with the app as sender and product_id=, low_stock= keyword arguments
+low_stock_changed = _signals.signal('low-stock-changed')
+
+
+def low_stock_threshold():
+    return current_app.config.get('LOW_STOCK_THRESHOLD', 10)
+
+
+def is_low_stock(quantity, threshold=None, reorder_point=None):
+    """True if `quantity` is at or below the product's reorder point (default: the global threshold)."""
+    if reorder_point is not None:
+        threshold = reorder_point
+    elif threshold is None:
+        threshold = low_stock_threshold()
+    return quantity is not None and quantity <= threshold
+
+
+def low_stock_expression(table, quantity=None, threshold=None):
+    """SQL expression computing the low_stock flag for rows of the product `table`."""
+    if quantity is None:
+        quantity = table.c.quantity
+    if threshold is None:
+        threshold = low_stock_threshold()
+    return quantity <= func.coalesce(table.c.reorder_point, threshold)
+
+
+def apply_delta(connection, product_count=0, total_units=0, low_stock_count=0):
+    """Adjust the summary counters by the given deltas on `connection` and bump the catalogue version.
+
+    Call it for every product write, even one that leaves the counters unchanged, so the version
+    (used for API ETags) moves. If the summary row does not exist yet this is a no-op; the next
+    get_summary() rebuilds it.
+    """
+    table = InventorySummary.__table__
+    connection.execute(
+        update(table).where(table.c.id == SUMMARY_ID).values(
+            product_count=table.c.product_count + product_count,
+            total_units=table.c.total_units + total_units,
+            low_stock_count=table.c.low_stock_count + low_stock_count,
+            catalogue_version=table.c.catalogue_version + 1,
+            catalogue_updated=datetime.datetime.utcnow(),
+        )
+    )
+
+
+def quantity_change_delta(old_quantity, new_quantity, reorder_point=None):
+    """Return the (total_units, low_stock_count) deltas for a quantity change."""
+    threshold = low_stock_threshold()
+    low_delta = int(is_low_stock(new_quantity, threshold, reorder_point)) - \
+        int(is_low_stock(old_quantity, threshold, reorder_point))
+    return new_quantity - old_quantity, low_delta
+
+
+def queue_low_stock_change(session, product_id, low_stock):
+    """Announce through low_stock_changed, once `session` commits, that a product entered or left low stock."""
+    session.info.setdefault(_CHANGES_KEY, {})[product_id] = bool(low_stock)
+
+
+def refresh_low_stock_flags():
+    """Recompute Product.low_stock where it disagrees with the current thresholds. Does not commit."""
+    table = Product.__table__
+    flag = low_stock_expression(table)
+    # last_updated moves with the flag so API ETags and cached product rows see the change
+    return db.session.execute(update(table).where(table.c.low_stock != flag)
+                              .values(low_stock=flag, last_updated=datetime.datetime.utcnow())).rowcount
+
+
+def rebuild_summary():
+    """Recompute the low-stock flags, facet counts and the summary from the product table and store them. Fixes any drift."""
+    from .facets import rebuild_facet_counts
+    threshold = low_stock_threshold()
+    refresh_low_stock_flags()
+    rebuild_facet_counts()
+    with use_replica(False): # Rebuild from the primary even when called from a report
+        product_count, total_units, low_stock_count = db.session.query(
+            func.count(Product.id),
+            func.coalesce(func.sum(Product.quantity), 0),
+            func.coalesce(func.sum(db.case((Product.low_stock, 1), else_=0)), 0),
+        ).one()
+        summary = db.session.get(InventorySummary, SUMMARY_ID)
+    if summary is None:
+        summary = InventorySummary(id=SUMMARY_ID)
+        db.session.add(summary)
+    summary.product_count = product_count
+    summary.total_units = total_units
+    summary.low_stock_count = low_stock_count
+    summary.low_stock_threshold = threshold
+    summary.last_rebuilt = datetime.datetime.utcnow()
+    # Rebuilding may change what the summary reports, so it counts as a new catalogue version
+    summary.catalogue_version = (summary.catalogue_version or 0) + 1
+    summary.catalogue_updated = summary.last_rebuilt
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker created the row concurrently; theirs is just as fresh.
+        db.session.rollback()
+        summary = db.session.get(InventorySummary, SUMMARY_ID)
+    return summary
+
+
+def get_summary():
+    """Return the summary row, rebuilding it if missing or computed with another threshold."""
+    summary = db.session.get(InventorySummary, SUMMARY_ID)
+    if summary is None or summary.low_stock_threshold != low_stock_threshold():
+        summary = rebuild_summary()
+    return summary
+
+
+def catalogue_version():
+    """Return the current catalogue version without loading or rebuilding the summary, or None if
+    the summary row does not exist yet."""
+    table = InventorySummary.__table__
+    return db.session.execute(select(table.c.catalogue_version).where(table.c.id == SUMMARY_ID)).scalar()
+
+
+def _committed_value(target, attribute):
+    history = inspect(target).attrs[attribute].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(target, attribute)
+
+
+@event.listens_for(Product, 'before_insert')
+@event.listens_for(Product, 'before_update')
+def _set_low_stock_flag(mapper, connection, target):
+    flag = is_low_stock(target.quantity or 0, reorder_point=target.reorder_point)
+    if target.low_stock is None or target.low_stock != flag:
+        target.low_stock = flag
+
+
+@event.listens_for(Product, 'after_insert')
+def _product_inserted(mapper, connection, target):
+    apply_delta(connection, product_count=1, total_units=target.quantity or 0, low_stock_count=int(target.low_stock))
+    if target.low_stock:
+        queue_low_stock_change(object_session(target), target.id, True)
+
+
+@event.listens_for(Product, 'after_update')
+def _product_updated(mapper, connection, target):
+    history = inspect(target).attrs.quantity.history
+    units_delta = 0
+    if history.has_changes() and history.deleted:
+        units_delta = (target.quantity or 0) - (history.deleted[0] or 0)
+    low_delta = 0
+    low_history = inspect(target).attrs.low_stock.history
+    if low_history.has_changes() and low_history.deleted:
+        low_delta = int(target.low_stock) - int(bool(low_history.deleted[0]))
+    apply_delta(connection, total_units=units_delta, low_stock_count=low_delta)
+    if low_delta:
+        queue_low_stock_change(object_session(target), target.id, target.low_stock)
+
+
+@event.listens_for(Product, 'after_delete')
+def _product_deleted(mapper, connection, target):
+    # The counters hold what they were given for this product. For a sharded product that is the
+    # quantity of the last fold (its later shard changes are not in total_units yet), which is
+    # Product.quantity, so the unfolded shard deltas disappear with the shards.
+    quantity = _committed_value(target, 'quantity') or 0
+    low_stock = bool(_committed_value(target, 'low_stock'))
+    apply_delta(connection, product_count=-1, total_units=-quantity, low_stock_count=-int(low_stock))
+
+
+@event.listens_for(Session, 'after_commit')
+def _send_low_stock_changes(session):
+    changes = session.info.pop(_CHANGES_KEY, None)
+    if changes and has_app_context():
+        app = current_app._get_current_object()
+        for product_id, low_stock in changes.items():
+            low_stock_changed.send(app, product_id=product_id, low_stock=low_stock)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_low_stock_changes(session, previous_transaction):
+    session.info.pop(_CHANGES_KEY, None)
@@ -0,0 +1,111 @@
+# Cache of the user identities Flask-Login loads on every authenticated request.
+# Entries are plain snapshots (CachedUser), not ORM instances, so they can be shared between
+# requests and threads. Each request still reads the user's auth_version (a primary key lookup
+# of one integer, instead of the whole row); it is bumped whenever role or is_active changes, so
+# a user demoted or deactivated by any process is reloaded on their next request everywhere.
+# Any ORM update or delete of a User also evicts its entry in this process, both at flush and
+# again after commit; USER_CACHE_TTL bounds how long other processes show an old username or
+# email.
+
+from flask import current_app, has_app_context
+from flask_login import UserMixin
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, object_session
+
+from . import db
+from .cache import LRUCache
+from .models import User
+
+_EVICT_KEY = 'user_cache_evict'
+
+
+class CachedUser(UserMixin):
+    """Read-only copy of the User columns the views use (current_user.id, username, role...)."""
+    is_active = True # Overrides UserMixin's property with the stored flag
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.role = user.role
+        self.is_active = user.is_active
+        self.auth_version = user.auth_version
+
+    def __repr__(self):
+        return f'<CachedUser {self.username}>'
+
+
+class UserCache(LRUCache):
+    """LRU of CachedUser by user id, each entry valid for `ttl` seconds."""
+
+    def __init__(self, max_size=1024, ttl=300):
+        super().__init__(max_size=max_size, ttl=ttl)
+
+    def put(self, user):
+        self.set(user.id, user)
+
+
+def get_user_cache():
+    cache = current_app.extensions.get('user_cache')
+    if cache is None:
+        cache = current_app.extensions['user_cache'] = UserCache(
+            max_size=current_app.config.get('USER_CACHE_SIZE', 1024),
+            ttl=current_app.config.get('USER_CACHE_TTL', 300))
+    return cache
+
+
+def load_cached_user(user_id):
+    """Flask-Login user_loader: return the CachedUser for `user_id`, loading the row only when it
+    is not cached or its auth_version moved."""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    cache = get_user_cache()
+    cached = cache.get(user_id)
+    if cached is not None:
+        version = db.session.execute(select(User.auth_version).where(User.id == user_id)).scalar()
+        if version == cached.auth_version:
+            return cached
+        cache.evict(user_id)
+        if version is None: # Deleted
+            return None
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    cached = CachedUser(user)
+    cache.put(cached)
+    return cached
+
+
+@event.listens_for(User, 'before_update')
+def _bump_auth_version(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.role.history.has_changes() or state.attrs.is_active.history.has_changes():
+        target.auth_version = User.auth_version + 1 # In SQL, so concurrent bumps both count
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    if not has_app_context():
+        return
+    get_user_cache().evict(target.id)
+    # Evict again once committed, in case a concurrent request re-cached the old row meanwhile
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_EVICT_KEY, set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _evict_committed_users(session):
+    user_ids = session.info.pop(_EVICT_KEY, None)
+    if user_ids and has_app_context():
+        cache = get_user_cache()
+        for user_id in user_ids:
+            cache.evict(user_id)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending_evictions(session, previous_transaction):
+    session.info.pop(_EVICT_KEY, None)
@@ -0,0 +1,82 @@
+# Inventory valuation (quantity x unit price) rolled up by category and supplier.
+# The grouping runs in SQL as a UNION ALL of the three ROLLUP levels (SQLite has no GROUP BY
+# ROLLUP): one row per (first, second) pair, a subtotal per first-level value and a grand total.
+# Groups are formed on the indexed category_id/supplier_id columns and named from the lookup
+# tables. Money is summed as integer cents straight from the price_cents column, so totals are exact
+# whatever the number of rows, and converted to Decimal only for display.
+# Results are cached per catalogue version, which every product and stock write moves forward.
+
+from flask import current_app
+from sqlalchemy import Integer, func, literal, null, select, type_coerce, union_all
+
+from . import db
+from .cache import LRUCache
+from .database import use_replica
+from .models import Category, Product, Supplier
+from .money import cents_to_decimal
+from .summary import catalogue_version
+
+VALUATION_GROUPINGS = ('category', 'supplier')
+GROUPING_MODELS = {'category': Category, 'supplier': Supplier}
+DETAIL, SUBTOTAL, GRAND_TOTAL = 0, 1, 2
+
+
+def price_cents_expression():
+    """SQL expression for the unit price of a product in integer cents."""
+    return type_coerce(Product.price, Integer) # The raw column, without the Decimal conversion
+
+
+def valuation_statement(first='category', second='supplier'):
+    """SELECT of (level, first, second, products, units, value_cents), ordered for display."""
+    first_model, second_model = GROUPING_MODELS[first], GROUPING_MODELS[second]
+    first_id, second_id = getattr(Product, f'{first}_id'), getattr(Product, f'{second}_id')
+    measures = (func.count(Product.id).label('products'),
+                func.coalesce(func.sum(Product.quantity), 0).label('units'),
+                func.coalesce(func.sum(Product.quantity * price_cents_expression()), 0).label('value_cents'))
+
+    def grouped(*columns):
+        return select(*columns, *measures).select_from(Product)\
+            .outerjoin(first_model, first_id == first_model.id)\
+            .outerjoin(second_model, second_id == second_model.id)
+
+    detail = grouped(literal(DETAIL).label('level'), first_model.name.label('first'), second_model.name.label('second'))\
+        .group_by(first_id, second_id, first_model.name, second_model.name)
+    subtotal = grouped(literal(SUBTOTAL).label('level'), first_model.name.label('first'), null().label('second'))\
+        .group_by(first_id, first_model.name)
+    grand_total = select(literal(GRAND_TOTAL).label('level'), null().label('first'), null().label('second'), *measures)
+    rollup = union_all(detail, subtotal, grand_total).subquery()
+    # Subtotals follow the detail rows of their group; the grand total comes last
+    return select(rollup).order_by(
+        (rollup.c.level == GRAND_TOTAL), rollup.c.first.is_(None), rollup.c.first,
+        rollup.c.level, rollup.c.second.is_(None), rollup.c.second)
+
+
+def compute_valuation(first='category', second='supplier'):
+    """Return the rollup rows as dicts with the value as a Decimal."""
+    rows = db.session.execute(valuation_statement(first, second)).mappings()
+    return [dict(row, value=cents_to_decimal(row['value_cents'] or 0)) for row in rows]
+
+
+def get_valuation_cache():
+    cache = current_app.extensions.get('valuation_cache')
+    if cache is None:
+        cache = current_app.extensions['valuation_cache'] = LRUCache(
+            max_size=current_app.config.get('VALUATION_CACHE_SIZE', 8))
+    return cache
+
+
+def inventory_valuation(by='category'):
+    """Valuation rolled up by `by` ('category' or 'supplier') and then by the other grouping."""
+    if by not in VALUATION_GROUPINGS:
+        raise ValueError(f'Unsupported grouping: {by}')
+    second = 'supplier' if by == 'category' else 'category'
+    with use_replica():
+        version = catalogue_version()
+        if version is None: # No summary row yet, so nothing to key the cache on
+            return compute_valuation(by, second)
+        cache = get_valuation_cache()
+        rows = cache.get((version, by))
+        if rows is None:
+            rows = compute_valuation(by, second)
+            cache.set((version, by), rows)
+    return rows
@@ -0,0 +1,102 @@
+# Worker cold start.
+# A fresh worker otherwise compiles each template on its first hit and opens its first database
+# connection inside a user request. warm_up() does both before the worker takes traffic, and
+# JINJA_BYTECODE_CACHE_DIR lets workers load compiled templates that another worker (or the
+# `flask warmup` deploy step) already wrote instead of compiling them again. The measured startup
+# times are logged as JSON to 'inventory_app.startup' and shown on the admin performance page.
+
+import json
+import logging
+import os
+import time
+import weakref
+
+from jinja2 import FileSystemBytecodeCache
+
+from . import db
+from .database import get_replica_engine, is_sqlite
+
+startup_logger = logging.getLogger('inventory_app.startup')
+_fork_safe_engines = weakref.WeakSet()
+
+
+def configure_bytecode_cache(app):
+    """Store compiled templates under JINJA_BYTECODE_CACHE_DIR, if set. Call before the first render."""
+    directory = app.config.get('JINJA_BYTECODE_CACHE_DIR')
+    if not directory:
+        return
+    directory = os.path.join(app.instance_path, directory) # No-op for absolute paths
+    os.makedirs(directory, exist_ok=True)
+    # Writes go to a temporary file and are renamed into place, so workers can share the directory
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def compile_templates(app):
+    """Load every template of the app (and its blueprints) into the Jinja cache. Returns the count."""
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def connect_pool(engine, connections):
+    """Open `connections` connections on `engine` at once and return them to the pool."""
+    opened = []
+    try:
+        for _ in range(connections):
+            opened.append(engine.connect())
+    finally:
+        for connection in opened:
+            connection.close()
+    _dispose_after_fork(engine)
+
+
+def _dispose_after_fork(engine):
+    # Forked workers (gunicorn --preload) must not share the connections opened here
+    if engine in _fork_safe_engines:
+        return
+    _fork_safe_engines.add(engine)
+    engine_ref = weakref.ref(engine)
+
+    def dispose():
+        forked = engine_ref()
+        if forked is not None:
+            forked.dispose(close=False)
+    os.register_at_fork(after_in_child=dispose)
+
+
+def warm_up(app, started=None):
+    """Compile all templates and pre-connect the database pools; return the timings in ms.
+
+    `started` is the time.perf_counter() value taken when the process began loading the app,
+    so the figures include imports and create_app().
+    """
+    began = time.perf_counter()
+    timings = {}
+    with app.app_context():
+        templates = compile_templates(app)
+        timings['templates'] = templates
+        timings['templates_ms'] = round((time.perf_counter() - began) * 1000, 2)
+
+        connected = time.perf_counter()
+        uri = app.config['SQLALCHEMY_DATABASE_URI']
+        pool_size = 1 if is_sqlite(uri) else app.config.get('DB_POOL_SIZE') or 1
+        connect_pool(db.engine, pool_size)
+        replica = get_replica_engine()
+        if replica is not None:
+            connect_pool(replica, 1 if replica.dialect.name == 'sqlite' else pool_size)
+        timings['connections'] = pool_size
+        timings['connect_ms'] = round((time.perf_counter() - connected) * 1000, 2)
+
+    timings['warmup_ms'] = round((time.perf_counter() - began) * 1000, 2)
+    if started is not None:
+        timings['load_ms'] = round((began - started) * 1000, 2)
+        timings['total_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    timings['pid'] = os.getpid()
+    app.extensions['startup_timings'] = timings
+    startup_logger.info(json.dumps(timings))
+    return timings
+
+
+def get_startup_timings(app):
+    return app.extensions.get('startup_timings')
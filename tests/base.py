@@ -17,6 +17,8 @@ else:
 from inventory_app import create_app, db # db is also exposed from __init__
 from inventory_app.models import User, Product, InventoryMovement # Models themselves
 from flask import url_for # Import url_for
+from sqlalchemy import event
+import contextlib
 
 # from inventory_app.config import TestingConfig # Not needed if create_app handles config
 
@@ -74,5 +76,17 @@ class BaseTestCase(unittest.TestCase):
         db.session.commit()
         return product
 
+    @contextlib.contextmanager
+    def count_queries(self):
+        """Collect the SQL statements issued inside the block into the yielded list."""
+        statements = []
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,70 @@
+from tests.base import BaseTestCase
+from inventory_app.models import db, Product
+from flask import url_for
+import unittest
+
+class TestProductsApi(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_admin_user()
+        self.login_user(email_or_username=self.admin.email, password="password")
+        for name, sku in (("Charlie", "C1"), ("Alpha", "A1"), ("Bravo", "B1")):
+            self.create_product(name=name, quantity=3, sku=sku)
+
+    def test_listing_pages_with_cursor(self):
+        response = self.client.get(url_for('api.products', limit=2))
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual([p['name'] for p in body['products']], ["Alpha", "Bravo"])
+        self.assertEqual(body['total'], 3)
+        response = self.client.get(url_for('api.products', limit=2, cursor=body['next_cursor']))
+        body = response.get_json()
+        self.assertEqual([p['name'] for p in body['products']], ["Charlie"])
+        self.assertIsNone(body['next_cursor'])
+
+    def test_unchanged_catalogue_answers_304_without_listing_query(self):
+        first = self.client.get(url_for('api.products'))
+        etag = first.headers['ETag']
+        self.assertIsNotNone(first.headers.get('Last-Modified'))
+
+        with self.count_queries() as statements:
+            second = self.client.get(url_for('api.products'), headers={'If-None-Match': etag})
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.data, b'')
+        self.assertFalse([s for s in statements if 'FROM product' in s])
+
+        # Any product write moves the catalogue version
+        product = Product.query.filter_by(sku="B1").one()
+        product.description = "Now with a description"
+        db.session.commit()
+        third = self.client.get(url_for('api.products'), headers={'If-None-Match': etag})
+        self.assertEqual(third.status_code, 200)
+        self.assertNotEqual(third.headers['ETag'], etag)
+
+    def test_etag_varies_with_arguments(self):
+        self.assertNotEqual(self.client.get(url_for('api.products', limit=1)).headers['ETag'],
+                            self.client.get(url_for('api.products', limit=2)).headers['ETag'])
+
+    def test_product_detail_conditional_get(self):
+        product = Product.query.filter_by(sku="A1").one()
+        response = self.client.get(url_for('api.product_detail', product_id=product.id))
+        self.assertEqual(response.get_json()['sku'], "A1")
+        etag = response.headers['ETag']
+        self.assertEqual(self.client.get(url_for('api.product_detail', product_id=product.id),
+                                         headers={'If-None-Match': etag}).status_code, 304)
+        self.assertEqual(self.client.get(url_for('api.product_detail', product_id=product.id),
+                                         headers={'If-Modified-Since': response.headers['Last-Modified']}).status_code, 304)
+
+        self.client.post(url_for('main.add_stock', product_id=product.id), data=dict(quantity_added="4"))
+        response = self.client.get(url_for('api.product_detail', product_id=product.id), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['quantity'], 7)
+
+    def test_missing_product_and_auth(self):
+        self.assertEqual(self.client.get(url_for('api.product_detail', product_id=999)).status_code, 404)
+        self.logout_user()
+        self.assertEqual(self.client.get(url_for('api.products')).status_code, 401)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+from tests.base import BaseTestCase
+from inventory_app.models import db, InventoryMovement, MovementArchiveSegment, MovementArchiveTotal
+from inventory_app.archive import archive_movements, segment_path
+from inventory_app.exporter import iter_export
+from inventory_app.jobs import run_reconciliation
+from inventory_app.ledger import movement_page
+from inventory_app.snapshots import stock_as_of, take_snapshot
+from inventory_app.stock import record_stock_movement
+from flask import url_for
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+NOW = datetime.datetime(2025, 6, 15)
+
+class TestMovementArchive(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.archive_dir = tempfile.mkdtemp()
+        self.app.config['ARCHIVE_DIR'] = self.archive_dir # Absolute, so the instance folder is not used
+        self.app.config['ARCHIVE_AFTER_DAYS'] = 365
+        self.admin = self.create_admin_user()
+        self.product = self.create_product(name="Widget", quantity=0, sku="W1")
+        self.product.date_added = datetime.datetime(2023, 1, 1)
+        db.session.commit()
+        # Two archivable months (2024-01, 2024-03), then live history from 2024-06 (the horizon month)
+        for delta, when in [(10, datetime.datetime(2024, 1, 5)), (-2, datetime.datetime(2024, 1, 20)),
+                            (4, datetime.datetime(2024, 3, 1)), (-1, datetime.datetime(2024, 6, 2)),
+                            (3, datetime.datetime(2025, 5, 1))]:
+            self.move(delta, when)
+
+    def tearDown(self):
+        shutil.rmtree(self.archive_dir)
+        super().tearDown()
+
+    def move(self, delta, when):
+        record_stock_movement(self.product.id, delta, 'adjustment', self.admin.id, notes=f'{delta:+d}')
+        db.session.commit()
+        movement = InventoryMovement.query.order_by(InventoryMovement.id.desc()).first()
+        movement.timestamp = when
+        db.session.commit()
+        return movement
+
+    def all_pages(self, filters=None, per_page=2):
+        movements, cursor = movement_page(filters or {}, per_page=per_page)
+        while cursor:
+            page, cursor = movement_page(filters or {}, cursor=cursor, per_page=per_page)
+            movements.extend(page)
+        return movements
+
+    def test_archives_whole_months_before_horizon(self):
+        segments = archive_movements(now=NOW)
+        self.assertEqual([(segment.month, segment.row_count) for segment in segments],
+                         [(datetime.date(2024, 1, 1), 2), (datetime.date(2024, 3, 1), 1)])
+        self.assertEqual(InventoryMovement.query.count(), 2)
+        self.assertTrue(all(os.path.exists(segment_path(segment)) for segment in segments))
+        january = MovementArchiveTotal.query.filter_by(segment_id=segments[0].id).one()
+        self.assertEqual((january.product_id, january.quantity_change, january.movement_count), (self.product.id, 8, 2))
+        # Nothing left to archive; a second run is a no-op
+        self.assertEqual(archive_movements(now=NOW), [])
+        self.assertEqual(MovementArchiveSegment.query.count(), 2)
+
+    def test_newest_movement_is_never_archived(self):
+        archive_movements(now=datetime.datetime(2030, 1, 1))
+        self.assertEqual([movement.notes for movement in InventoryMovement.query], ['+3'])
+
+    def test_ledger_pages_span_live_and_archived(self):
+        before = [(movement.id, movement.notes) for movement in self.all_pages()]
+        archive_movements(now=NOW)
+        movements = self.all_pages()
+        self.assertEqual([(movement.id, movement.notes) for movement in movements], before)
+        self.assertEqual(movements[-1].product.name, "Widget")
+        self.assertEqual(movements[-1].user.username, self.admin.username)
+        # Filters apply to archived rows too
+        january = self.all_pages({'start': datetime.datetime(2024, 1, 10), 'end': datetime.datetime(2024, 4, 1)})
+        self.assertEqual([movement.notes for movement in january], ['+4', '-2'])
+
+    def test_movements_report_shows_archived_history(self):
+        archive_movements(now=NOW)
+        self.login_user(email_or_username=self.admin.email, password="password")
+        response = self.client.get(url_for('main.inventory_movements_report', start_date='2024-01-01', end_date='2024-01-31'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('+10', response.get_data(as_text=True))
+
+    def test_stock_and_reconciliation_include_archived_totals(self):
+        as_of = datetime.datetime(2024, 3, 31)
+        _, rows = stock_as_of(as_of)
+        before = {row.name: row.quantity for row in rows}
+        archive_movements(now=NOW)
+        _, rows = stock_as_of(as_of)
+        self.assertEqual({row.name: row.quantity for row in rows}, before)
+        self.assertEqual(before, {"Widget": 12})
+        # A window cutting through a segment reads its rows
+        _, rows = stock_as_of(datetime.datetime(2024, 1, 10))
+        self.assertEqual([row.quantity for row in rows], [10])
+
+        stream = io.StringIO()
+        run_reconciliation({}, stream)
+        self.assertEqual(stream.getvalue().strip().splitlines()[1:], []) # Ledger still matches the stock
+
+    def test_snapshot_checkpoint_counts_archived_ids(self):
+        archive_movements(now=NOW)
+        InventoryMovement.query.delete() # Leave only archived history
+        db.session.commit()
+        snapshot = take_snapshot()
+        self.assertEqual(snapshot.last_movement_id, MovementArchiveSegment.query.order_by(
+            MovementArchiveSegment.last_movement_id.desc()).first().last_movement_id)
+
+    def test_export_merges_archived_rows_in_order(self):
+        before = list(iter_export('movements', 'ndjson'))
+        archive_movements(now=NOW)
+        after = list(iter_export('movements', 'ndjson'))
+        self.assertEqual(after, before)
+        self.assertEqual(json.loads(after[0])['product_name'], "Widget")
+        self.assertEqual(len(list(iter_export('movements', 'ndjson', since=datetime.datetime(2024, 2, 1)))), 3)
+
+if __name__ == '__main__':
+    unittest.main()
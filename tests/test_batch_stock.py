@@ -0,0 +1,94 @@
+from tests.base import BaseTestCase
+from inventory_app.models import db, Product, InventoryMovement
+from inventory_app.summary import rebuild_summary, get_summary
+from flask import url_for
+import unittest
+
+class TestBatchStockAdjustment(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_admin_user()
+        self.login_user(email_or_username=self.admin.email, password="password")
+        self.bolt = self.create_product(name="Bolt", quantity=10, sku="BOLT")
+        self.nut = self.create_product(name="Nut", quantity=2, sku="NUT")
+        rebuild_summary()
+
+    def quantities(self):
+        db.session.expire_all()
+        return (db.session.get(Product, self.bolt.id).quantity, db.session.get(Product, self.nut.id).quantity)
+
+    def post_batch(self, lines, mode='atomic'):
+        return self.client.post(url_for('api.stock_batch'), json=dict(mode=mode, lines=lines))
+
+    def test_atomic_batch_commits_all_lines(self):
+        with self.count_queries() as statements:
+            response = self.post_batch([
+                dict(sku="BOLT", delta=5, movement_type="stock_entry", reference_id="PO-1"),
+                dict(product_id=self.nut.id, delta=-2, movement_type="sale"),
+                dict(sku="BOLT", delta=-3, movement_type="sale"),
+            ])
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertTrue(body['committed'])
+        self.assertEqual([line['new_quantity'] for line in body['lines']], [15, 0, 12])
+        self.assertEqual(self.quantities(), (12, 0))
+        self.assertEqual(InventoryMovement.query.filter_by(reference_id="PO-1").count(), 1)
+        self.assertEqual(InventoryMovement.query.count(), 3)
+        self.assertEqual(get_summary().total_units, 12)
+        # One lookup for all products and a single INSERT for all movements
+        self.assertEqual(len([s for s in statements if s.startswith('INSERT INTO inventory_movement')]), 1)
+
+    def test_atomic_batch_rolls_back_on_insufficient_stock(self):
+        response = self.post_batch([
+            dict(sku="BOLT", delta=-4, movement_type="sale"),
+            dict(sku="NUT", delta=-3, movement_type="sale"),
+        ])
+        self.assertEqual(response.status_code, 409)
+        body = response.get_json()
+        self.assertFalse(body['committed'])
+        self.assertEqual([line['status'] for line in body['lines']], ['not_applied', 'rejected'])
+        self.assertEqual(body['lines'][1]['error'], 'Cannot remove 3 units. Only 2 available.')
+        self.assertEqual(self.quantities(), (10, 2))
+        self.assertEqual(InventoryMovement.query.count(), 0)
+
+    def test_partial_batch_skips_failing_lines(self):
+        response = self.post_batch([
+            dict(sku="BOLT", delta=-4, movement_type="sale"),
+            dict(sku="NOPE", delta=1, movement_type="stock_entry"),
+            dict(sku="NUT", delta=-3, movement_type="sale"),
+            dict(sku="NUT", delta=0, movement_type="sale"),
+            dict(sku="NUT", delta=1),
+            dict(sku="NUT", delta=1, movement_type="stock_entry", notes={"po": 7}),
+            dict(sku="NUT", delta=1, movement_type="stock_entry", notes="x" * 501),
+        ], mode='partial')
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual([line['status'] for line in body['lines']],
+                         ['applied', 'rejected', 'rejected', 'rejected', 'rejected', 'rejected', 'rejected'])
+        self.assertEqual(body['lines'][1]['error'], 'Unknown sku: NOPE')
+        self.assertEqual(body['lines'][5]['error'], 'notes must be text of at most 500 characters.')
+        self.assertEqual(self.quantities(), (6, 2))
+        self.assertEqual(get_summary().total_units, 8)
+
+    def test_bad_payloads(self):
+        self.assertEqual(self.client.post(url_for('api.stock_batch'), json=[1, 2]).status_code, 400)
+        self.assertEqual(self.post_batch([], mode='sometimes').status_code, 400)
+        self.app.config['STOCK_BATCH_MAX_LINES'] = 1
+        self.assertEqual(self.post_batch([{}, {}]).status_code, 413)
+
+    def test_api_requires_admin(self):
+        self.logout_user()
+        self.assertEqual(self.post_batch([]).status_code, 401)
+        self.register_user(username="plainuser", email="plain@example.com")
+        self.login_user(email_or_username="plain@example.com")
+        self.assertEqual(self.post_batch([]).status_code, 403)
+
+    def test_form_variant(self):
+        response = self.client.post(url_for('main.batch_stock_adjustment'), data=dict(
+            lines=f"BOLT, 24, stock_entry, PO-9\n\n#{self.nut.id}, -1, sale\n", mode='atomic'))
+        self.assertIn(b'Batch applied: 2 lines applied, 0 rejected.', response.data)
+        self.assertEqual(self.quantities(), (34, 1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+from benchmarks.__main__ import main, create_bench_app
+from benchmarks.compare import compare
+from inventory_app import db
+from inventory_app.models import Product, InventoryMovement
+from sqlalchemy import func
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+class TestBenchmarkSuite(unittest.TestCase):
+    """Smoke run of the benchmark suite at tiny volumes."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmpdir, 'bench.db')
+        self.output = os.path.join(self.tmpdir, 'result.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_suite(self):
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            report = main(['--products', '40', '--movements', '600', '--requests', '3', '--threads', '2',
+                           '--db', self.db_path, '--output', self.output, '--only', 'products,add_stock,movements'])
+        return report, stdout.getvalue()
+
+    def test_seeds_consistent_data_and_writes_results(self):
+        report, output = self.run_suite()
+        app = create_bench_app(self.db_path)
+        with app.app_context():
+            ledger = dict(db.session.query(InventoryMovement.product_id, func.sum(InventoryMovement.quantity_change))
+                          .group_by(InventoryMovement.product_id))
+            for product in Product.query:
+                self.assertEqual(product.quantity, ledger.get(product.id, 0))
+            db.engine.dispose()
+
+        with open(self.output) as stream:
+            saved = json.load(stream)
+        self.assertEqual(saved, report)
+        self.assertEqual(saved['meta']['products'], 40)
+        for driver in ('test_client', 'wsgi_server'):
+            figures = saved['results'][driver]['products']
+            self.assertEqual(figures['errors'], 0)
+            self.assertEqual(figures['requests'], 3)
+            self.assertGreater(figures['queries_per_request']['mean'], 0)
+            self.assertIn('p95', figures['latency_ms'])
+        self.assertIn('movements_report_by_user', saved['results']['test_client'])
+
+        # The seeded database is reused by later runs
+        self.assertIn('Reusing seeded database', self.run_suite()[1])
+
+    def test_compare_flags_regressions(self):
+        def result(p95, throughput, queries):
+            return {'meta': {'commit': 'x'}, 'results': {'test_client': {'products': {
+                'latency_ms': {'p95': p95}, 'throughput_rps': throughput, 'queries_per_request': {'mean': queries}}}}}
+        rows, regressions = compare(result(10, 100, 2), result(10.5, 98, 2))
+        self.assertEqual((len(rows), regressions), (1, []))
+        self.assertEqual(len(compare(result(10, 100, 2), result(20, 100, 2))[1]), 1)
+        self.assertEqual(len(compare(result(10, 100, 2), result(10, 100, 3))[1]), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+from inventory_app import create_app, db
+from inventory_app.config import ProductionConfig
+from inventory_app.database import engine_options, use_replica
+from inventory_app.models import User, Product
+from flask import url_for
+from sqlalchemy import text
+import os
+import shutil
+import tempfile
+import unittest
+
+class TestEngineProfiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_pool_options_only_for_server_databases(self):
+        config = {key: getattr(ProductionConfig, key) for key in dir(ProductionConfig) if key.isupper()}
+        self.assertEqual(engine_options(config, 'sqlite:///inventory.db'), {})
+        options = engine_options(config, 'postgresql://inventory@db/inventory')
+        self.assertEqual(options['pool_size'], ProductionConfig.DB_POOL_SIZE)
+        self.assertEqual(options['pool_recycle'], 1800)
+        self.assertTrue(options['pool_pre_ping'])
+
+    def test_production_sqlite_pragmas_applied_on_connect(self):
+        app = create_app('test', config_overrides={
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(self.tmpdir, 'prod.db'),
+            'SQLITE_PRAGMAS': ProductionConfig.SQLITE_PRAGMAS,
+        })
+        with app.app_context():
+            with db.engine.connect() as connection:
+                self.assertEqual(connection.execute(text('PRAGMA journal_mode')).scalar(), 'wal')
+                self.assertEqual(connection.execute(text('PRAGMA busy_timeout')).scalar(), 5000)
+                self.assertEqual(connection.execute(text('PRAGMA synchronous')).scalar(), 1) # NORMAL
+                self.assertEqual(connection.execute(text('PRAGMA cache_size')).scalar(), -65536)
+            db.engine.dispose()
+
+
+class TestReadReplica(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.app = create_app('test', config_overrides={
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(self.tmpdir, 'primary.db'),
+            'REPLICA_DATABASE_URI': 'sqlite:///' + os.path.join(self.tmpdir, 'replica.db'),
+        })
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.metadata.create_all(self.app.extensions['replica_engine'])
+        admin = User(username="admin", email="admin@example.com", role='admin')
+        admin.set_password("password")
+        db.session.add_all([admin, Product(name="Primary Only", quantity=1, price=1, sku="P1")])
+        db.session.commit()
+        # The replica has not caught up with the primary yet
+        with self.app.extensions['replica_engine'].begin() as connection:
+            connection.execute(Product.__table__.insert().values(
+                name="Replica Only", quantity=2, price=1, sku="R1", low_stock=True))
+        self.client = self.app.test_client()
+        self.client.post(url_for('main.login'), data=dict(email_or_username="admin", password="password"))
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.app.extensions['replica_engine'].dispose()
+        self.app_context.pop()
+        shutil.rmtree(self.tmpdir)
+
+    def test_reports_read_from_replica(self):
+        response = self.client.get(url_for('main.low_stock_report'))
+        self.assertIn(b"Replica Only", response.data)
+        self.assertNotIn(b"Primary Only", response.data)
+
+    def test_writes_inside_replica_block_go_to_primary(self):
+        with use_replica():
+            self.assertEqual([p.name for p in Product.query.all()], ["Replica Only"])
+            db.session.add(Product(name="New", quantity=3, price=1, sku="N1"))
+            db.session.commit()
+            with use_replica(False):
+                self.assertEqual(Product.query.count(), 2)
+        self.assertEqual(Product.query.filter_by(sku="N1").count(), 1)
+        with self.app.extensions['replica_engine'].connect() as connection:
+            self.assertEqual(connection.execute(text("SELECT count(*) FROM product WHERE sku = 'N1'")).scalar(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+from tests.base import BaseTestCase
+from inventory_app.models import db, Product
+from inventory_app.events import FileEventBroker, get_event_broker
+from inventory_app.stock import apply_batch, record_stock_movement
+from flask import url_for
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+class TestStockEvents(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_admin_user()
+        self.product = self.create_product(name="Widget", quantity=20, sku="WID")
+        self.broker = get_event_broker()
+        self.subscription = self.broker.subscribe()
+
+    def tearDown(self):
+        self.broker.unsubscribe(self.subscription)
+        super().tearDown()
+
+    def received(self):
+        events = []
+        while True:
+            event = self.subscription.get(timeout=0)
+            if event is None:
+                return events
+            events.append(event)
+
+    def test_stock_changes_publish_after_commit(self):
+        record_stock_movement(self.product.id, -15, 'sale', self.admin.id)
+        self.assertEqual(self.received(), []) # Nothing before the commit
+        db.session.commit()
+        [event] = self.received()
+        self.assertEqual(event['type'], 'stock.changed')
+        self.assertEqual(event['data'], {'product_id': self.product.id, 'quantity': 5, 'low_stock': True})
+
+        record_stock_movement(self.product.id, 1, 'return', self.admin.id)
+        db.session.rollback()
+        self.assertEqual(self.received(), [])
+
+    def test_product_views_publish_events(self):
+        self.login_user(email_or_username=self.admin.email, password="password")
+        self.client.post(url_for('main.add_product'), data=dict(name="Gadget", quantity="3", price="1.50", sku="GAD"))
+        self.client.post(url_for('main.add_stock', product_id=self.product.id), data=dict(quantity_added="5"))
+        self.client.post(url_for('main.edit_product', product_id=self.product.id),
+                         data=dict(name="Widget XL", quantity="25", price="2", sku="WID"))
+        events = self.received()
+        self.assertEqual([event['type'] for event in events], ['product.created', 'stock.changed', 'product.updated'])
+        self.assertEqual(events[0]['data']['price'], '1.50')
+        self.assertEqual(events[1]['data']['quantity'], 25)
+        self.assertEqual(events[2]['data']['name'], "Widget XL")
+
+    def test_batch_coalesces_events_per_product(self):
+        apply_batch([{'product_id': self.product.id, 'delta': -2, 'movement_type': 'sale'},
+                     {'product_id': self.product.id, 'delta': -3, 'movement_type': 'sale'}], self.admin.id)
+        [event] = self.received()
+        self.assertEqual(event['data']['quantity'], 15)
+
+    def test_stream_replays_from_last_event_id(self):
+        self.app.config.update(EVENTS_HEARTBEAT=0.01, EVENTS_STREAM_MAX_DURATION=0.05)
+        record_stock_movement(self.product.id, 1, 'return', self.admin.id)
+        db.session.commit()
+        [event] = self.received()
+        self.login_user(email_or_username=self.admin.email, password="password")
+        response = self.client.get(url_for('main.stock_events'), headers={'Last-Event-ID': str(event['id'] - 1)})
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        body = response.get_data(as_text=True)
+        self.assertIn(f"id: {event['id']}\nevent: stock.changed\n", body)
+        self.assertIn('"quantity":21', body)
+        self.assertIn(': keepalive', body)
+        self.assertEqual(self.broker.subscriber_count, 1) # The stream unsubscribed when it ended
+
+    def test_stream_requires_login(self):
+        self.assertEqual(self.client.get(url_for('main.stock_events')).status_code, 302)
+
+class TestFileEventBroker(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'events.ndjson')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_events_fan_out_between_brokers(self):
+        publisher = FileEventBroker(self.path, poll_interval=0.01)
+        viewer = FileEventBroker(self.path, poll_interval=0.01)
+        subscription = viewer.subscribe()
+        subscription.get(timeout=0.05) # Let the tailer open the file
+        publisher.publish({'type': 'stock.changed', 'data': {'product_id': 1, 'quantity': 3}})
+        event = subscription.get(timeout=2)
+        self.assertEqual(event['data'], {'product_id': 1, 'quantity': 3})
+        with open(self.path) as stream:
+            self.assertEqual(json.loads(stream.readline())['id'], event['id'])
+
+    def test_file_is_rotated_once(self):
+        first = FileEventBroker(self.path, max_bytes=100)
+        second = FileEventBroker(self.path, max_bytes=100)
+        with open(self.path, 'a', encoding='utf-8') as stale: # A process that was about to rotate
+            stale.write('{"id":1}\n' * 12)
+            stale.flush()
+            second.publish({'type': 'stock.changed', 'data': {'product_id': 1}})
+            self.assertFalse(os.path.exists(self.path))
+            first.publish({'type': 'stock.changed', 'data': {'product_id': 2}})
+            first._rotate(stale) # Too late: the file it wrote to was already moved away
+        with open(self.path + '.1') as stream:
+            lines = stream.read().splitlines()
+        self.assertEqual(len(lines), 13)
+        self.assertEqual(json.loads(lines[-1])['data'], {'product_id': 1})
+        with open(self.path) as stream:
+            self.assertEqual(json.loads(stream.readline())['data'], {'product_id': 2})
+
+if __name__ == '__main__':
+    unittest.main()
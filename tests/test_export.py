@@ -0,0 +1,68 @@
+from tests.base import BaseTestCase
+from inventory_app.models import db, Product, InventoryMovement
+from flask import url_for
+import csv
+import datetime
+import io
+import json
+import unittest
+
+class TestExport(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_admin_user()
+        self.old = self.create_product(name="Old Product", quantity=5, price=2.5, sku="OLD001")
+        self.old.last_updated = datetime.datetime(2024, 1, 1)
+        self.new = self.create_product(name="New, \"quoted\" Product", quantity=7, price=1.0, sku="NEW001")
+        self.new.last_updated = datetime.datetime(2024, 6, 1)
+        db.session.add_all([
+            InventoryMovement(product_id=self.old.id, user_id=self.admin.id, quantity_change=5,
+                              movement_type='initial_stock', timestamp=datetime.datetime(2024, 1, 1)),
+            InventoryMovement(product_id=self.new.id, user_id=self.admin.id, quantity_change=7,
+                              movement_type='stock_entry', timestamp=datetime.datetime(2024, 6, 1), notes='PO-7'),
+        ])
+        db.session.commit()
+        self.login_user(email_or_username=self.admin.email, password="password")
+
+    def test_products_csv(self):
+        response = self.client.get(url_for('main.export_data', kind='products', fmt='csv'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual([row['name'] for row in rows], ["Old Product", "New, \"quoted\" Product"])
+        self.assertEqual(rows[0]['last_updated'], '2024-01-01T00:00:00')
+
+    def test_movements_ndjson_since(self):
+        response = self.client.get(url_for('main.export_data', kind='movements', fmt='ndjson', since='2024-03-01'))
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 1)
+        movement = json.loads(lines[0])
+        self.assertEqual(movement['product_sku'], 'NEW001')
+        self.assertEqual(movement['username'], self.admin.username)
+        self.assertEqual(movement['notes'], 'PO-7')
+        self.assertEqual(movement['timestamp'], '2024-06-01T00:00:00')
+
+    def test_empty_csv_still_has_header(self):
+        response = self.client.get(url_for('main.export_data', kind='movements', fmt='csv', since='2030-01-01'))
+        self.assertTrue(response.get_data(as_text=True).startswith('id,timestamp,product_id,product_name'))
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(url_for('main.export_data', kind='products', fmt='xml')).status_code, 404)
+        self.assertEqual(self.client.get(url_for('main.export_data', kind='products', fmt='csv', since='yesterday')).status_code, 400)
+
+    def test_export_requires_admin(self):
+        self.logout_user()
+        self.register_user(username="plainuser", email="plain@example.com")
+        self.login_user(email_or_username="plain@example.com")
+        response = self.client.get(url_for('main.export_data', kind='products', fmt='csv'), follow_redirects=True)
+        self.assertIn(b'You do not have permission to access this page.', response.data)
+
+    def test_export_cli(self):
+        result = self.app.test_cli_runner().invoke(args=['export-products', '--format', 'ndjson', '--since', '2024-03-01'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual([json.loads(line)['sku'] for line in result.output.splitlines()], ['NEW001'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+from tests.base import BaseTestCase
+from inventory_app import create_app
+from inventory_app.models import db, Category, Product, Supplier
+from inventory_app.facets import facet_counts
+from inventory_app.importer import import_products
+from inventory_app.migrations import migrate
+from inventory_app.search import search_products
+from inventory_app.summary import get_summary, rebuild_summary
+from flask import url_for
+from sqlalchemy import text
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+class TestFacets(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_admin_user()
+
+    def add(self, name, category=None, supplier=None):
+        product = Product(name=name, quantity=1, price=1, category=category, supplier=supplier)
+        db.session.add(product)
+        db.session.commit()
+        return product
+
+    def counts(self, facet='category'):
+        return {name: count for _, name, count in facet_counts(facet)}
+
+    def test_names_resolve_to_shared_lookup_rows(self):
+        hammer = self.add("Hammer", category="Tools", supplier="Acme")
+        saw = self.add("Saw", category="  tools ", supplier="ACME")
+        self.assertEqual(Category.query.count(), 1)
+        self.assertEqual(hammer.category_id, saw.category_id)
+        self.assertEqual((saw.category, saw.supplier), ("Tools", "Acme")) # First spelling wins
+        self.assertEqual(self.counts(), {"Tools": 2})
+        self.assertEqual(self.counts('supplier'), {"Acme": 2})
+
+    def test_counts_follow_updates_and_deletes(self):
+        hammer = self.add("Hammer", category="Tools")
+        self.add("Glue", category="Adhesives")
+        hammer.category = "Garden"
+        db.session.commit()
+        self.assertEqual(self.counts(), {"Adhesives": 1, "Garden": 1}) # Unused categories are left out
+        hammer.category = None
+        db.session.commit()
+        self.assertIsNone(hammer.category_id)
+        db.session.delete(Product.query.filter_by(name="Glue").one())
+        db.session.commit()
+        self.assertEqual(self.counts(), {})
+        # A rebuild agrees with the maintained counts
+        self.add("Rake", category="garden")
+        rebuild_summary()
+        self.assertEqual(self.counts(), {"Garden": 1})
+
+    def test_import_and_form_keep_plain_text(self):
+        stream = io.StringIO("name,quantity,price,category,supplier\nNails,5,1,Hardware,Acme\nScrews,5,1,hardware,\n")
+        result = import_products(stream, 'csv', self.admin.id)
+        self.assertEqual(result.created, 2)
+        self.assertEqual(self.counts(), {"Hardware": 2})
+        self.assertEqual(Product.query.filter_by(name="Screws").one().supplier, None)
+
+        self.login_user(email_or_username=self.admin.email, password="password")
+        self.client.post(url_for('main.add_product'), data=dict(name="Bolts", quantity="1", price="1", category="HARDWARE"))
+        self.assertEqual(self.counts(), {"Hardware": 3})
+        self.assertEqual(sorted(product.name for product in search_products("hardware")), ["Bolts", "Nails", "Screws"])
+
+    def test_facets_api_is_cached_per_catalogue_version(self):
+        self.add("Hammer", category="Tools", supplier="Acme")
+        self.login_user(email_or_username=self.admin.email, password="password")
+        response = self.client.get('/api/facets')
+        self.assertEqual(response.get_json(), {
+            'category': [{'id': 1, 'name': "Tools", 'count': 1}],
+            'supplier': [{'id': 1, 'name': "Acme", 'count': 1}]})
+        version = get_summary().catalogue_version
+        with self.count_queries() as queries:
+            facet_counts('category', version)
+        self.assertEqual(len(queries), 0)
+
+class TestFacetMigration(unittest.TestCase):
+
+    def test_free_text_values_are_deduplicated(self):
+        directory = tempfile.mkdtemp()
+        try:
+            app = create_app('test', {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory, 'old.db')})
+            with app.app_context():
+                db.session.execute(text(
+                    'CREATE TABLE product (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(100) NOT NULL UNIQUE, '
+                    'description TEXT, quantity INTEGER NOT NULL, price FLOAT NOT NULL, sku VARCHAR(50) UNIQUE, '
+                    'category VARCHAR(100), supplier VARCHAR(100), date_added DATETIME, last_updated DATETIME)'))
+                db.session.execute(text(
+                    "INSERT INTO product (name, quantity, price, category, supplier) VALUES "
+                    "('A', 1, 1, 'tools', 'Acme'), ('B', 1, 1, 'Tools', NULL), ('C', 1, 1, ' Tools', 'acme'), "
+                    "('D', 1, 1, 'Garden', ''), ('E', 1, 1, NULL, NULL)"))
+                db.session.commit()
+                self.assertIn('normalize_categories_and_suppliers', migrate())
+                self.assertEqual(migrate(), [])
+                self.assertEqual(sorted((row.name, row.product_count) for row in Category.query),
+                                 [("Garden", 1), ("Tools", 3)])
+                self.assertEqual([(row.name, row.product_count) for row in Supplier.query], [("Acme", 2)])
+                self.assertEqual([product.category for product in Product.query.order_by(Product.name)],
+                                 ["Tools", "Tools", "Tools", "Garden", None])
+                self.assertEqual([product.name for product in search_products("garden")], ["D"])
+                db.session.remove()
+                db.engine.dispose()
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+from tests.base import BaseTestCase
+from inventory_app.models import db, InventoryMovement
+from inventory_app.forecast import _load_history, _save_history, demand_history, forecast_cache_dir, reorder_suggestions
+from inventory_app.shards import shard_product
+from inventory_app.stock import record_stock_movement
+from flask import url_for
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+TODAY = datetime.date(2025, 3, 31)
+
+class TestForecast(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.app.config.update(FORECAST_CACHE_DIR=self.cache_dir, FORECAST_WINDOW_DAYS=10,
+                               FORECAST_LEAD_TIME_DAYS=3, FORECAST_REVIEW_DAYS=1, FORECAST_SERVICE_FACTOR=0)
+        self.admin = self.create_admin_user()
+        self.fast = self.create_product(name="Fast", quantity=100, sku="F1")
+        self.slow = self.create_product(name="Slow", quantity=100, sku="S1")
+        self.idle = self.create_product(name="Idle", quantity=5, sku="I1")
+        for day in range(1, 11): # 2025-03-21 .. 2025-03-30: 6 units a day of Fast
+            self.sell(self.fast, 6, datetime.datetime(2025, 3, 20 + day, 12))
+        self.sell(self.slow, 10, datetime.datetime(2025, 3, 25, 9))
+        self.sell(self.slow, 1, datetime.datetime(2025, 3, 31, 9)) # Today: not in the window yet
+        self.sell(self.slow, 50, datetime.datetime(2025, 3, 1, 9)) # Before the window
+        record_stock_movement(self.idle.id, 3, 'stock_entry', self.admin.id) # Entries are not demand
+        db.session.commit()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        super().tearDown()
+
+    def sell(self, product, units, when):
+        record_stock_movement(product.id, -units, 'sale', self.admin.id)
+        db.session.commit()
+        movement = InventoryMovement.query.order_by(InventoryMovement.id.desc()).first()
+        movement.timestamp = when
+        db.session.commit()
+
+    def test_demand_cover_and_suggestion(self):
+        rows = reorder_suggestions(today=TODAY)
+        self.assertEqual([row['name'] for row in rows], ["Fast", "Slow"]) # Idle sold nothing
+        fast, slow = rows
+        self.assertEqual((fast['quantity'], fast['daily_demand'], fast['days_of_cover']), (40, 6.0, 6.7))
+        self.assertEqual(fast['suggested_order'], 0) # 6/day over 4 days = 24 < 40 on hand
+        self.assertEqual((slow['quantity'], slow['daily_demand'], slow['days_of_cover']), (39, 1.0, 39.0))
+
+        self.app.config['FORECAST_LEAD_TIME_DAYS'] = 9
+        self.assertEqual(reorder_suggestions(today=TODAY)[0]['suggested_order'], 20) # 6 x 10 - 40
+        everything = reorder_suggestions(today=TODAY, only_selling=False)
+        self.assertEqual(everything[-1]['name'], "Idle")
+        self.assertIsNone(everything[-1]['days_of_cover'])
+
+    def test_sharded_products_use_the_shard_total(self):
+        shard_product(self.fast.id, 4)
+        record_stock_movement(self.fast.id, -30, 'sale', self.admin.id) # Today, not folded yet
+        db.session.commit()
+        fast = reorder_suggestions(today=TODAY)[0]
+        self.assertEqual((fast['quantity'], fast['days_of_cover'], fast['suggested_order']), (10, 1.7, 14))
+
+    def test_safety_stock_uses_daily_variation(self):
+        self.app.config['FORECAST_SERVICE_FACTOR'] = 1
+        slow = reorder_suggestions(today=TODAY)[1]
+        # 10 units on one day of ten: mean 1, std 3; 1 x 4 + 3 x sqrt(4) = 10 < 39
+        self.assertEqual(slow['suggested_order'], 0)
+        history = demand_history(TODAY)
+        self.assertAlmostEqual(float(history.std[history.product_ids.tolist().index(self.slow.id)]), 3.0)
+
+    def test_history_is_cached_per_day(self):
+        demand_history(TODAY)
+        self.assertTrue(os.path.exists(os.path.join(forecast_cache_dir(), 'demand-2025-03-31-10d.npz')))
+        with self.count_queries() as queries:
+            demand_history(TODAY)
+        self.assertEqual(len(queries), 0)
+        # Another process (empty memory cache) reads the file instead of the ledger
+        self.app.extensions.pop('forecast_cache')
+        with self.count_queries() as queries:
+            history = demand_history(TODAY)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(len(history.product_ids), 3)
+
+    def test_concurrent_workers_share_the_cache_directory(self):
+        history = demand_history(TODAY)
+        directory = forecast_cache_dir()
+        errors = []
+
+        def save(day):
+            try:
+                for offset in range(50): # Every save also removes the other days' files
+                    _save_history(os.path.join(directory, f'demand-2025-04-{day + offset % 2:02d}-10d.npz'), history)
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=save, args=(day,)) for day in (1, 1, 2, 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertFalse([name for name in os.listdir(directory) if '.part' in name])
+        for name in os.listdir(directory):
+            loaded = _load_history(os.path.join(directory, name), TODAY, 10)
+            self.assertEqual(loaded.product_ids.tolist(), history.product_ids.tolist())
+        with open(os.path.join(directory, 'torn.npz'), 'wb') as stream:
+            stream.write(b'PK\x03\x04 not a zip file')
+        self.assertIsNone(_load_history(os.path.join(directory, 'torn.npz'), TODAY, 10))
+
+    def test_report_page(self):
+        self.login_user(email_or_username=self.admin.email, password="password")
+        response = self.client.get(url_for('main.reorder_report'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Sugerencias de Reabastecimiento', response.get_data(as_text=True))
+
+if __name__ == '__main__':
+    unittest.main()
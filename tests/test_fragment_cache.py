@@ -0,0 +1,88 @@
+from tests.base import BaseTestCase
+from inventory_app.models import db, Product, User
+from inventory_app.fragments import CSRF_MARKER, get_fragment_cache
+from inventory_app.summary import get_summary
+from flask import url_for, g
+from sqlalchemy import update
+import re
+import unittest
+
+class TestFragmentCache(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_admin_user()
+        self.login_user(email_or_username=self.admin.email, password="password")
+        self.client.post(url_for('main.add_product'), data=dict(name="Widget", quantity="3", price="2.50", sku="WID"))
+        self.widget = Product.query.filter_by(sku="WID").one()
+        get_summary() # Report bodies are versioned by the summary row
+
+    def get(self, endpoint, **kwargs):
+        # The test app context is shared between requests; drop Flask-Login's per-request copy
+        g.pop('_login_user', None)
+        return self.client.get(url_for(endpoint, **kwargs))
+
+    def rename_behind_the_cache(self, name):
+        # Core update that leaves last_updated and the catalogue version alone
+        db.session.execute(update(Product).where(Product.id == self.widget.id).values(name=name, last_updated=Product.last_updated))
+        db.session.commit()
+
+    def test_product_row_is_reused_until_last_updated_changes(self):
+        self.assertIn(b"Widget", self.get('main.products').data)
+        self.rename_behind_the_cache("Gadget")
+        self.assertIn(b"Widget", self.get('main.products').data)
+        self.client.post(url_for('main.add_stock', product_id=self.widget.id), data=dict(quantity_added="1"))
+        response = self.get('main.products')
+        self.assertIn(b"Gadget", response.data)
+        self.assertNotIn(b"Widget", response.data)
+
+    def test_cached_rows_carry_the_current_csrf_token(self):
+        self.get('main.products')
+        self.logout_user()
+        self.login_user(email_or_username=self.admin.email, password="password")
+        response = self.get('main.products')
+        self.assertNotIn(CSRF_MARKER.encode(), response.data)
+        tokens = set(re.findall(rb'name="csrf_token" value="([^"]+)"', response.data))
+        self.assertEqual(len(tokens), 1)
+        with self.client.session_transaction() as session:
+            self.assertIn('csrf_token', session)
+
+    def test_rows_are_cached_per_role(self):
+        self.assertIn(b"Eliminar Producto", self.get('main.products').data)
+        clerk = User(username="clerk", email="clerk@example.com")
+        clerk.set_password("password")
+        db.session.add(clerk)
+        db.session.commit()
+        self.logout_user()
+        self.login_user(email_or_username="clerk", password="password")
+        response = self.get('main.products')
+        self.assertIn(b"Widget", response.data)
+        self.assertNotIn(b"Eliminar Producto", response.data)
+
+    def test_low_stock_report_body_is_served_from_cache(self):
+        self.get('main.low_stock_report')
+        with self.count_queries() as statements:
+            response = self.get('main.low_stock_report')
+        self.assertIn(b"<td>WID</td>", response.data)
+        self.assertEqual([s for s in statements if 'FROM product' in s], [])
+        self.client.post(url_for('main.add_stock', product_id=self.widget.id), data=dict(quantity_added="50"))
+        self.assertNotIn(b"<td>WID</td>", self.get('main.low_stock_report').data)
+
+    def test_movement_report_sees_new_movements(self):
+        self.assertNotIn(b"restock run", self.get('main.inventory_movements_report').data)
+        self.client.post(url_for('main.add_stock', product_id=self.widget.id),
+                         data=dict(quantity_added="4", notes="restock run"))
+        self.assertIn(b"restock run", self.get('main.inventory_movements_report').data)
+
+    def test_size_bound_and_disabled_cache(self):
+        cache = get_fragment_cache()
+        for i in range(cache.max_size + 10):
+            cache.set(('key', i), 'html')
+        self.assertEqual(len(cache), cache.max_size)
+        cache.max_size = 0
+        cache.clear()
+        self.assertIn(b"Widget", self.get('main.products').data)
+        self.assertEqual(len(cache), 0)
+
+if __name__ == '__main__':
+    unittest.main()
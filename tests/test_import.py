@@ -0,0 +1,99 @@
+from tests.base import BaseTestCase
+from inventory_app.models import db, Product, InventoryMovement
+from inventory_app.importer import import_products
+from inventory_app.summary import get_summary, rebuild_summary
+from flask import url_for
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+CSV_DATA = """name,description,quantity,price,sku,category,supplier
+Hammer,Steel hammer,10,12.50,HAM001,Tools,Acme
+Nails,Box of nails,0,3.99,NAI001,Tools,Acme
+Saw,,2,20,,Tools,
+X,,1,1.00,TOOSHORT,,
+Drill,,-4,80,DRI001,,
+Level,,3,abc,LEV001,,
+Hammer,,1,1.00,HAM002,,
+"""
+
+class TestProductImport(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_admin_user()
+
+    def test_import_csv_validates_and_writes_in_chunks(self):
+        self.create_product(name="Existing", quantity=1, sku="NAI001")
+        rebuild_summary() # So the import has to keep an existing summary row current
+        result = import_products(io.StringIO(CSV_DATA), 'csv', self.admin.id, chunk_size=2)
+
+        self.assertEqual(result.created, 2) # Hammer and Saw
+        self.assertEqual(result.rejected, 5)
+        messages = dict(result.errors)
+        self.assertIn('already exists', messages[3]) # Nails' SKU is taken in the database
+        self.assertIn('at least 2 characters', messages[5])
+        self.assertEqual(messages[6], 'Quantity cannot be negative.')
+        self.assertEqual(messages[7], 'Invalid price. Must be a number.')
+        self.assertIn('Duplicate product name', messages[8])
+
+        hammer = Product.query.filter_by(sku="HAM001").one()
+        self.assertEqual((hammer.quantity, hammer.price, hammer.category, hammer.supplier), (10, 12.5, "Tools", "Acme"))
+        self.assertIsNone(Product.query.filter_by(name="Saw").one().sku)
+        movements = InventoryMovement.query.filter_by(movement_type='initial_stock').all()
+        self.assertEqual(sorted(m.quantity_change for m in movements), [2, 10])
+        self.assertTrue(all(m.user_id == self.admin.id for m in movements))
+
+        summary = get_summary()
+        self.assertEqual((summary.product_count, summary.total_units), (3, 13))
+
+    def test_import_ndjson(self):
+        data = '{"name": "Paint", "quantity": 5, "price": 9.5, "sku": "PNT001"}\n\nnot json\n[1, 2]\n'
+        result = import_products(io.StringIO(data), 'ndjson', self.admin.id)
+        self.assertEqual(result.created, 1)
+        self.assertEqual([line for line, _ in result.errors], [3, 4])
+        self.assertEqual(Product.query.filter_by(sku="PNT001").one().quantity, 5)
+
+    def test_import_without_insert_returning(self):
+        self.create_product(name="Existing", quantity=1, sku="EX001")
+        data = 'name,quantity,price,sku\nPaint,5,9.50,PNT001\nBrush,0,2.00,BRU001\nTape,3,1.50,\n'
+        with mock.patch.object(db.session.get_bind().dialect, 'insert_returning', False):
+            result = import_products(io.StringIO(data), 'csv', self.admin.id, chunk_size=2)
+        self.assertEqual(result.created, 3)
+        movements = {m.product.name: m.quantity_change
+                     for m in InventoryMovement.query.filter_by(movement_type='initial_stock')}
+        self.assertEqual(movements, {"Paint": 5, "Tape": 3})
+
+    def test_upload_endpoint(self):
+        self.login_user(email_or_username=self.admin.email, password="password")
+        response = self.client.post(url_for('main.import_products_upload'), data=dict(
+            file=(io.BytesIO(CSV_DATA.encode('utf-8')), 'catalogue.csv'),
+        ), content_type='multipart/form-data', follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Imported 3 products, rejected 4 rows.', response.data)
+        self.assertEqual(Product.query.count(), 3)
+
+    def test_upload_endpoint_requires_admin(self):
+        self.register_user(username="plainuser", email="plain@example.com")
+        self.login_user(email_or_username="plain@example.com")
+        response = self.client.post(url_for('main.import_products_upload'), data=dict(
+            file=(io.BytesIO(CSV_DATA.encode('utf-8')), 'catalogue.csv'),
+        ), content_type='multipart/form-data', follow_redirects=True)
+        self.assertIn(b'You do not have permission to access this page.', response.data)
+        self.assertEqual(Product.query.count(), 0)
+
+    def test_import_products_cli(self):
+        handle, path = tempfile.mkstemp(suffix='.ndjson')
+        with os.fdopen(handle, 'w') as f:
+            f.write('{"name": "Brush", "quantity": 3, "price": "4.25"}\n')
+        try:
+            result = self.app.test_cli_runner().invoke(args=['import-products', path, '--user', self.admin.username])
+        finally:
+            os.remove(path)
+        self.assertIn('Imported 1 products, rejected 0 rows.', result.output)
+        self.assertEqual(Product.query.filter_by(name="Brush").one().quantity, 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+from tests.base import BaseTestCase
+from inventory_app import create_app, db
+from inventory_app.instrumentation import RequestStats, percentile
+from flask import url_for
+import unittest
+
+class TestInstrumentation(BaseTestCase):
+
+    def setUp(self):
+        self.app = create_app('test', config_overrides={'INSTRUMENTATION_ENABLED': True, 'SLOW_QUERY_THRESHOLD_MS': 0})
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.admin = self.create_admin_user()
+        self.login_user(email_or_username=self.admin.email, password="password")
+        self.create_product()
+
+    def test_server_timing_header_and_logs(self):
+        with self.assertLogs('inventory_app.requests', level='INFO') as request_logs, \
+                self.assertLogs('inventory_app.slow_queries', level='WARNING') as slow_logs:
+            response = self.client.get(url_for('main.products'))
+        timing = response.headers['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertRegex(timing, r'tpl;dur=[\d.]+')
+        self.assertRegex(timing, r'total;dur=[\d.]+')
+        self.assertIn('"endpoint": "main.products"', request_logs.output[-1])
+        self.assertIn('"endpoint": "main.products"', slow_logs.output[-1])
+        self.assertIn('SELECT', slow_logs.output[-1])
+
+    def test_performance_page_lists_endpoints(self):
+        for _ in range(3):
+            self.client.get(url_for('main.products'))
+        response = self.client.get(url_for('main.performance_report'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"main.products", response.data)
+
+    def test_disabled_by_default(self):
+        app = create_app('test')
+        with app.app_context():
+            db.create_all()
+            response = app.test_client().get(url_for('main.login'))
+            self.assertNotIn('Server-Timing', response.headers)
+            db.drop_all()
+
+    def test_percentiles(self):
+        self.assertEqual(percentile(list(range(1, 101)), 50), 50)
+        self.assertEqual(percentile(list(range(1, 101)), 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        stats = RequestStats(window=2)
+        for total in (100, 1, 2):
+            stats.add('main.products', total, 0.5, 3)
+        row = stats.summary()[0]
+        self.assertEqual((row['count'], row['p99'], row['mean_statements']), (2, 2, 3))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+from tests.base import BaseTestCase
+from inventory_app import create_app
+from inventory_app.models import db, Job, Product, User
+from inventory_app.exporter import iter_export
+from inventory_app.jobs import JOB_KINDS, claim_next_job, enqueue_job, job_kind, run_worker
+from flask import url_for
+from sqlalchemy import update
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+class TestJobs(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.output_dir = tempfile.mkdtemp()
+        self.app.config['JOB_OUTPUT_DIR'] = self.output_dir # Absolute, so the instance folder is not used
+        self.admin = self.create_admin_user()
+        self.login_user(email_or_username=self.admin.email, password="password")
+        self.client.post(url_for('main.add_product'), data=dict(name="Widget", quantity="5", price="2", sku="WID"))
+        self.client.post(url_for('main.add_stock', product_id=1), data=dict(quantity_added="3"))
+
+    def tearDown(self):
+        JOB_KINDS.pop('explode', None)
+        shutil.rmtree(self.output_dir)
+        super().tearDown()
+
+    def test_queued_export_runs_in_worker_and_downloads(self):
+        response = self.client.post(url_for('main.enqueue_job_view', kind='export'), data=dict(kind='movements', fmt='csv'))
+        job = Job.query.one()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(job.status, 'queued')
+        self.assertIn('queued', self.client.get(url_for('main.job_status', job_id=job.id)).get_data(as_text=True))
+        self.assertEqual(self.client.get(url_for('main.job_download', job_id=job.id)).status_code, 404)
+
+        run_worker(self.app, processes=0, once=True)
+        db.session.refresh(job)
+        self.assertEqual(job.status, 'succeeded')
+        self.assertIsNotNone(job.started_at)
+        response = self.client.get(url_for('main.job_download', job_id=job.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment; filename=movements.csv', response.headers['Content-Disposition'])
+        self.assertEqual(response.get_data(as_text=True), ''.join(iter_export('movements', 'csv')))
+        response.close()
+        self.assertEqual(os.listdir(self.output_dir), [job.result_file])
+
+    def test_invalid_parameters_are_rejected_at_enqueue(self):
+        response = self.client.post(url_for('main.enqueue_job_view', kind='export'), data=dict(kind='users', fmt='csv'))
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url_for('main.enqueue_job_view', kind='export'),
+                                    data=dict(kind='products', fmt='csv', since='yesterday'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Job.query.count(), 0)
+
+    def test_reconciliation_reports_drift(self):
+        db.session.execute(update(Product).where(Product.sku == "WID").values(quantity=7))
+        db.session.commit()
+        job = enqueue_job('reconciliation', user_id=self.admin.id)
+        run_worker(self.app, processes=0, once=True)
+        response = self.client.get(url_for('main.job_download', job_id=job.id))
+        lines = response.get_data(as_text=True).splitlines()
+        response.close()
+        self.assertEqual(lines, ['product_id,sku,name,quantity,ledger_quantity,difference', '1,WID,Widget,7,8,-1'])
+
+    def test_failed_job_records_error_and_leaves_no_file(self):
+        @job_kind('explode', 'Explode')
+        def explode(params, stream):
+            stream.write('partial')
+            raise RuntimeError('boom')
+        job = enqueue_job('explode')
+        run_worker(self.app, processes=0, once=True)
+        db.session.refresh(job)
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.error, 'RuntimeError: boom')
+        self.assertEqual(os.listdir(self.output_dir), [])
+        self.assertIn('boom', self.client.get(url_for('main.job_status', job_id=job.id)).get_data(as_text=True))
+
+    def test_jobs_are_claimed_once(self):
+        job = enqueue_job('reconciliation')
+        self.assertEqual(claim_next_job('a:1'), job.id)
+        self.assertIsNone(claim_next_job('b:2'))
+        db.session.refresh(job)
+        self.assertEqual((job.status, job.worker), ('running', 'a:1'))
+
+    def test_jobs_are_claimed_without_update_returning(self):
+        first, second = enqueue_job('reconciliation'), enqueue_job('reconciliation')
+        with mock.patch.object(db.session.get_bind().dialect, 'update_returning', False):
+            self.assertEqual(claim_next_job('a:1'), first.id)
+            self.assertEqual(claim_next_job('b:2'), second.id)
+            self.assertIsNone(claim_next_job('c:3'))
+        db.session.refresh(first)
+        self.assertEqual((first.status, first.worker), ('running', 'a:1'))
+
+    def test_api_status_and_visibility(self):
+        response = self.client.post(url_for('api.enqueue_job', kind='export'), json=dict(kind='products', fmt='ndjson'))
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()['id']
+        self.assertEqual(self.client.get(response.headers['Location']).get_json()['status'], 'queued')
+        run_worker(self.app, processes=0, once=True)
+        status = self.client.get(url_for('api.job_detail', job_id=job_id)).get_json()
+        self.assertEqual(status['status'], 'succeeded')
+        self.assertEqual(status['download_url'], f'/jobs/{job_id}/download')
+
+        self.logout_user()
+        clerk = User(username="clerk", email="clerk@example.com")
+        clerk.set_password("password")
+        db.session.add(clerk)
+        db.session.commit()
+        self.login_user(email_or_username="clerk", password="password")
+        self.assertEqual(self.client.get(url_for('api.job_detail', job_id=job_id)).status_code, 404)
+        self.assertEqual(self.client.get(url_for('main.job_download', job_id=job_id)).status_code, 404)
+
+
+class TestJobProcessPool(unittest.TestCase):
+    # Pool processes build their own app, so the database has to be a file they can all open
+
+    def test_jobs_run_in_pool_processes(self):
+        directory = tempfile.mkdtemp()
+        try:
+            overrides = {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory, 'jobs.db'),
+                         'JOB_OUTPUT_DIR': directory}
+            app = create_app('test', overrides)
+            with app.app_context():
+                db.create_all()
+                job_ids = [enqueue_job('export', {'kind': 'products', 'fmt': 'csv'}).id for _ in range(3)]
+                db.session.remove()
+            run_worker(app, processes=2, poll_interval=0.1, once=True, app_args=('test', overrides))
+            with app.app_context():
+                jobs = Job.query.order_by(Job.id).all()
+                self.assertEqual([job.status for job in jobs], ['succeeded'] * 3)
+                self.assertTrue(all(os.path.exists(os.path.join(directory, job.result_file)) for job in jobs))
+                self.assertEqual([job.id for job in jobs], job_ids)
+                db.session.remove()
+                db.engine.dispose()
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
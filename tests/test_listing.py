@@ -0,0 +1,91 @@
+from tests.base import BaseTestCase
+from inventory_app.models import db, Product
+from inventory_app.listing import parse_product_filters, product_page, product_total
+from inventory_app.pagination import InvalidCursor
+from inventory_app.summary import get_summary
+from flask import url_for
+from sqlalchemy import text
+from werkzeug.datastructures import MultiDict
+import decimal
+import unittest
+
+class TestProductListing(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app.config['LOW_STOCK_THRESHOLD'] = 5
+        self.admin = self.create_admin_user()
+        for name, quantity, price, category, supplier in [
+                ("Hammer", 20, 12.5, "Tools", "Acme"), ("Saw", 0, 30, "Tools", "Acme"),
+                ("Drill", 3, 99.99, "Tools", "Bosch"), ("Rake", 8, 12.5, "Garden", "Acme"),
+                ("Hose", 2, 25, "Garden", None), ("Glue", 50, 4.25, None, None)]:
+            db.session.add(Product(name=name, quantity=quantity, price=price, category=category, supplier=supplier))
+        db.session.commit()
+        self.tools = Product.query.filter_by(name="Hammer").one().category_id
+
+    def walk(self, filters=None, sort='name', per_page=2):
+        names, cursor = [], None
+        while True:
+            page, cursor = product_page(filters or {}, sort, cursor=cursor, per_page=per_page)
+            names.extend(product.name for product in page)
+            if not cursor:
+                return names
+
+    def test_sort_orders_page_through_every_product(self):
+        self.assertEqual(self.walk(), ["Drill", "Glue", "Hammer", "Hose", "Rake", "Saw"])
+        self.assertEqual(self.walk(sort='-name'), ["Saw", "Rake", "Hose", "Hammer", "Glue", "Drill"])
+        # Hammer and Rake share a price: ties are broken by id in both directions
+        self.assertEqual(self.walk(sort='price'), ["Glue", "Hammer", "Rake", "Hose", "Saw", "Drill"])
+        self.assertEqual(self.walk(sort='-price'), ["Drill", "Saw", "Hose", "Rake", "Hammer", "Glue"])
+        self.assertEqual(self.walk(sort='-quantity', per_page=4), ["Glue", "Hammer", "Rake", "Drill", "Hose", "Saw"])
+
+    def test_filters(self):
+        filters = parse_product_filters(MultiDict({'category_id': str(self.tools), 'min_price': '10', 'max_price': 'abc'}))
+        self.assertEqual(filters, {'category_id': self.tools, 'min_price': decimal.Decimal('10.00')})
+        self.assertEqual(self.walk(filters, sort='price'), ["Hammer", "Saw", "Drill"])
+        self.assertEqual(self.walk({'stock': 'low'}), ["Drill", "Hose"])
+        self.assertEqual(self.walk({'stock': 'out'}), ["Saw"])
+        self.assertEqual(self.walk({'stock': 'ok'}), ["Glue", "Hammer", "Rake"])
+        self.assertEqual(self.walk({'max_price': decimal.Decimal('12.50')}, sort='-price'), ["Rake", "Hammer", "Glue"])
+
+    def test_cursor_must_match_the_sort_order(self):
+        _, cursor = product_page({}, 'price', per_page=2)
+        with self.assertRaises(InvalidCursor):
+            product_page({}, 'name', cursor=cursor)
+        self.login_user(email_or_username=self.admin.email, password="password")
+        self.assertEqual(self.client.get(url_for('main.products', cursor='bogus')).status_code, 400)
+
+    def test_totals_use_counters_or_a_bounded_count(self):
+        summary = get_summary()
+        with self.count_queries() as queries:
+            self.assertEqual(product_total({}, summary), (6, True))
+            self.assertEqual(product_total({'category_id': self.tools}, summary), (3, True))
+        self.assertFalse([sql for sql in queries if 'FROM product' in sql]) # Read from the maintained counters
+        self.assertEqual(product_total({'stock': 'low'}, summary), (2, True))
+        self.app.config['PRODUCT_COUNT_LIMIT'] = 2
+        self.assertEqual(product_total({'stock': 'ok'}, summary), (2, False))
+        self.app.config['PRODUCT_COUNT_LIMIT'] = 0
+        self.assertEqual(product_total({'stock': 'ok'}, summary), (None, False))
+
+    def test_filtered_pages_use_an_index(self):
+        for sql in ("SELECT id FROM product WHERE category_id = 1 ORDER BY name, id",
+                    "SELECT id FROM product WHERE price_cents >= 1000 ORDER BY price_cents DESC, id DESC"):
+            plan = ' '.join(row[-1] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)))
+            self.assertIn('INDEX ix_product_', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_listing_page(self):
+        self.login_user(email_or_username=self.admin.email, password="password")
+        self.app.config['ITEMS_PER_PAGE'] = 2
+        response = self.client.get(url_for('main.products', category_id=self.tools, sort='-price'))
+        data = response.get_data(as_text=True)
+        self.assertIn('Drill', data)
+        self.assertIn('Saw', data)
+        self.assertNotIn('Hammer', data)
+        self.assertIn('Tools (3)', data) # Facet counts in the filter form
+        self.assertIn('Total productos: 3', data)
+        self.assertIn('sort=-price', data) # The next page link keeps the filters
+        self.assertIn(f'category_id={self.tools}', data)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+from tests.base import BaseTestCase
+from inventory_app.models import db, Product
+from inventory_app.summary import get_summary, low_stock_changed
+from inventory_app.stock import apply_batch
+from flask import url_for
+import unittest
+
+class TestLowStockFlags(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app.config['LOW_STOCK_THRESHOLD'] = 5
+        self.admin = self.create_admin_user()
+        self.login_user(email_or_username=self.admin.email, password="password")
+        self.client.post(url_for('main.add_product'), data=dict(
+            name="Bolts", quantity="15", price="0.10", sku="BOLT", reorder_point="20"))
+        self.client.post(url_for('main.add_product'), data=dict(name="Nails", quantity="8", price="0.05", sku="NAIL"))
+        self.bolts = Product.query.filter_by(sku="BOLT").one()
+        self.nails = Product.query.filter_by(sku="NAIL").one()
+        self.changes = []
+        low_stock_changed.connect(self.record_change, self.app)
+
+    def tearDown(self):
+        low_stock_changed.disconnect(self.record_change, self.app)
+        super().tearDown()
+
+    def record_change(self, sender, product_id, low_stock):
+        self.changes.append((product_id, low_stock))
+
+    def low_stock_names(self):
+        db.session.expire_all()
+        return [p.name for p in Product.query.filter_by(low_stock=True).order_by(Product.name)]
+
+    def test_reorder_point_overrides_global_threshold(self):
+        self.assertEqual(self.low_stock_names(), ["Bolts"])
+        self.assertEqual(get_summary().low_stock_count, 1)
+
+    def test_stock_routes_flag_crossings_and_signal_after_commit(self):
+        self.client.post(url_for('main.add_stock', product_id=self.bolts.id), data=dict(quantity_added="10"))
+        self.client.post(url_for('main.remove_stock', product_id=self.nails.id), data=dict(quantity_removed="3", reason="sale"))
+        self.assertEqual(self.low_stock_names(), ["Nails"])
+        self.assertEqual(self.changes, [(self.bolts.id, False), (self.nails.id, True)])
+        self.assertEqual(get_summary().low_stock_count, 1)
+
+        # Movements that stay on the same side of the reorder point do not signal
+        self.client.post(url_for('main.remove_stock', product_id=self.nails.id), data=dict(quantity_removed="1", reason="sale"))
+        self.assertEqual(len(self.changes), 2)
+
+    def test_edit_changing_reorder_point_moves_flag(self):
+        self.client.post(url_for('main.edit_product', product_id=self.nails.id), data=dict(
+            name="Nails", quantity="8", price="0.05", sku="NAIL", reorder_point="10"))
+        self.assertEqual(self.low_stock_names(), ["Bolts", "Nails"])
+        self.assertEqual(self.changes, [(self.nails.id, True)])
+        self.assertEqual(get_summary().low_stock_count, 2)
+
+    def test_rolled_back_batch_does_not_signal(self):
+        result = apply_batch([
+            dict(product_id=self.nails.id, delta=-4, movement_type='sale'),
+            dict(product_id=self.bolts.id, delta=-100, movement_type='sale'),
+        ], self.admin.id)
+        self.assertFalse(result.committed)
+        self.assertEqual(self.changes, [])
+        self.assertEqual(self.low_stock_names(), ["Bolts"])
+
+    def test_threshold_change_refreshes_flags(self):
+        self.app.config['LOW_STOCK_THRESHOLD'] = 10
+        self.assertEqual(get_summary().low_stock_count, 2)
+        self.assertEqual(self.low_stock_names(), ["Bolts", "Nails"])
+
+    def test_report_reads_only_flagged_rows(self):
+        with self.count_queries() as statements:
+            response = self.client.get(url_for('main.low_stock_report'))
+        self.assertIn(b"Bolts", response.data)
+        self.assertNotIn(b"Nails", response.data)
+        report_query = [s for s in statements if 'FROM product' in s][-1]
+        self.assertIn('product.low_stock', report_query)
+        self.assertNotIn('product.quantity <=', report_query)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+from tests.base import BaseTestCase
+from inventory_app import create_app
+from inventory_app import money
+from inventory_app.models import db, Product
+from inventory_app.money import to_cents, prices_to_cents
+from inventory_app.migrations import migrate
+from inventory_app.pricing import update_prices
+from inventory_app.summary import get_summary
+from decimal import Decimal
+from flask import url_for
+from sqlalchemy import func, text
+from unittest import mock
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+class TestMoney(BaseTestCase):
+
+    def test_to_cents_rounds_half_up(self):
+        self.assertEqual([to_cents(v) for v in (0.285, '2.005', Decimal('1.994'), 3, '0.1')], [29, 201, 199, 300, 10])
+        with self.assertRaises(ValueError):
+            to_cents('nan')
+
+    def test_vectorized_conversion_matches_scalar(self):
+        rng = random.Random(7)
+        prices = [round(rng.uniform(0, 10000), rng.choice((2, 3))) for _ in range(5000)] + [0.285, 1.005, 0]
+        expected = [to_cents(price) for price in prices]
+        self.assertEqual(prices_to_cents(prices), expected)
+        with mock.patch.object(money, 'numpy', None):
+            self.assertEqual(prices_to_cents(prices), expected)
+
+    def test_price_is_stored_as_integer_cents(self):
+        product = self.create_product(price=0.1)
+        for _ in range(2):
+            db.session.add(Product(name=f"Dime {_}", quantity=1, price='0.10'))
+        db.session.commit()
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Product, product.id).price, Decimal('0.10'))
+        self.assertEqual(db.session.execute(text('SELECT price_cents FROM product WHERE id = :id'), {'id': product.id}).scalar(), 10)
+        self.assertEqual(db.session.execute(text('SELECT sum(price_cents) FROM product')).scalar(), 30)
+        self.assertEqual(Product.query.filter(Product.price > 0.05).count(), 3)
+
+    def test_form_rejects_non_numeric_prices(self):
+        admin = self.create_admin_user()
+        self.login_user(email_or_username=admin.email, password="password")
+        for price in ('abc', 'nan', 'inf', '-1'):
+            self.client.post(url_for('main.add_product'), data=dict(name=f"Bad {price}", quantity="1", price=price))
+        self.client.post(url_for('main.add_product'), data=dict(name="Good", quantity="1", price="12.345"))
+        self.assertEqual([(p.name, p.price) for p in Product.query], [("Good", Decimal('12.35'))])
+
+    def test_update_prices(self):
+        self.create_product(name="A", sku="A1", price=1)
+        self.create_product(name="B", sku="B1", price=2)
+        version = get_summary().catalogue_version
+        result = update_prices([("A1", "3.335"), ("B1", 0.1), ("ZZ", 5)], chunk_size=1)
+        self.assertEqual((result.updated, result.unknown_skus), (2, ["ZZ"]))
+        db.session.expire_all()
+        self.assertEqual([p.price for p in Product.query.order_by(Product.sku)], [Decimal('3.34'), Decimal('0.10')])
+        self.assertGreater(get_summary().catalogue_version, version)
+        with self.assertRaises(ValueError):
+            update_prices([("A1", -1)])
+
+
+class TestMigrations(unittest.TestCase):
+
+    def test_float_prices_are_migrated_to_cents(self):
+        directory = tempfile.mkdtemp()
+        try:
+            app = create_app('test', {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory, 'old.db')})
+            with app.app_context():
+                # The product table as created before reorder points and integer prices
+                db.session.execute(text(
+                    'CREATE TABLE product (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(100) NOT NULL UNIQUE, '
+                    'description TEXT, quantity INTEGER NOT NULL, price FLOAT NOT NULL, sku VARCHAR(50) UNIQUE, '
+                    'category VARCHAR(100), supplier VARCHAR(100), date_added DATETIME, last_updated DATETIME)'))
+                db.session.execute(text("INSERT INTO product (name, quantity, price, sku) VALUES "
+                                        "('Old', 2, 0.285, 'OLD'), ('Older', 50, 19.99, 'OLDER')"))
+                db.session.commit()
+                self.assertIn('convert_price_to_cents', migrate())
+                self.assertEqual(migrate(), [])
+                db.session.expire_all()
+                self.assertEqual([(p.name, p.price, p.low_stock) for p in Product.query.order_by(Product.id)],
+                                 [("Old", Decimal('0.29'), True), ("Older", Decimal('19.99'), False)])
+                self.assertEqual(get_summary().low_stock_count, 1)
+                db.session.remove()
+                db.engine.dispose()
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
 from tests.base import BaseTestCase
-from inventory_app.models import Product, User, db
+from inventory_app import routes
+from inventory_app.models import InventoryMovement, Product, User, db
+from inventory_app.stock import record_stock_movement
 from flask import url_for
+from unittest import mock
 
 class TestProductManagement(BaseTestCase):
 
@@ -111,6 +114,29 @@ class TestProductManagement(BaseTestCase):
         self.assertIsNotNone(movement)
         self.assertEqual(movement.quantity_change, -5) # 5 - 10 = -5
 
+    def test_edit_product_keeps_concurrent_sales(self):
+        admin = self.create_admin_user()
+        self.login_user(email_or_username=admin.email, password="password")
+        product = self.create_product(name="Busy Product", quantity=10, price=10.00, sku="BP001")
+        record_stock_movement(product.id, 10, 'stock_entry', admin.id)
+        db.session.commit()
+
+        def read_then_sell(loaded):
+            # Another request sells 3 units after the edit has read the quantity
+            quantity = loaded.quantity
+            record_stock_movement(product.id, -3, 'sale', admin.id)
+            db.session.commit()
+            return quantity
+
+        with mock.patch.object(routes, 'current_stock', side_effect=read_then_sell):
+            self.client.post(url_for('main.edit_product', product_id=product.id), data=dict(
+                name="Busy Product", quantity="25", price="10.00", sku="BP001"))
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Product, product.id).quantity, 22) # The sale is kept: 20 - 3 + 5
+        movements = InventoryMovement.query.filter_by(product_id=product.id)
+        self.assertEqual(sum(movement.quantity_change for movement in movements) + 10, 22)
+        self.assertEqual(movements.filter_by(movement_type='adjustment_edit').one().quantity_change, 5)
+
     def test_delete_product_admin(self):
         admin = self.create_admin_user()
         self.login_user(email_or_username=admin.email, password="password")
@@ -0,0 +1,119 @@
+from tests.base import BaseTestCase
+from inventory_app.models import db, User, Product, InventoryMovement
+from flask import url_for
+import datetime
+import unittest
+
+class TestInventoryMovementsReport(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_admin_user()
+        self.login_user(email_or_username=self.admin.email, password="password")
+        self.clerk = User(username="clerk", email="clerk@example.com")
+        self.clerk.set_password("password")
+        db.session.add(self.clerk)
+        self.widget = self.create_product(name="Widget", quantity=0, sku="WID001")
+        self.gadget = self.create_product(name="Gadget", quantity=0, sku="GAD001")
+        # 30 movements, one minute apart, alternating products, users and types
+        start = datetime.datetime(2024, 3, 1, 12, 0, 0)
+        for i in range(30):
+            db.session.add(InventoryMovement(
+                product_id=self.widget.id if i % 2 == 0 else self.gadget.id,
+                user_id=self.admin.id if i % 3 else self.clerk.id,
+                quantity_change=i + 1,
+                movement_type='sale' if i % 5 == 0 else 'stock_entry',
+                timestamp=start + datetime.timedelta(minutes=i),
+                notes=f"movement-{i}",
+            ))
+        db.session.commit()
+
+    def test_keyset_pages_cover_all_movements_newest_first(self):
+        response = self.client.get(url_for('main.inventory_movements_report', per_page=10))
+        data = response.data.decode('utf-8')
+        self.assertIn('movement-29', data)
+        self.assertIn('movement-20', data)
+        self.assertNotIn('movement-19', data)
+        self.assertIn('Anteriores', data) # Link to the next (older) page
+
+        # Walk every page through the cursor links and make sure nothing is skipped or repeated
+        seen, cursor = [], None
+        for _ in range(5):
+            movements, cursor = self._page(cursor)
+            seen.extend(m.notes for m in movements)
+            if not cursor:
+                break
+        self.assertEqual(seen, [f"movement-{i}" for i in reversed(range(30))])
+
+    def _page(self, cursor):
+        from inventory_app.ledger import movement_page
+        return movement_page({}, cursor=cursor, per_page=7)
+
+    def test_ties_on_timestamp_are_broken_by_id(self):
+        ts = datetime.datetime(2024, 4, 1)
+        for i in range(5):
+            db.session.add(InventoryMovement(product_id=self.widget.id, user_id=self.admin.id,
+                                             quantity_change=1, movement_type='tie', timestamp=ts))
+        db.session.commit()
+        from inventory_app.ledger import movement_page
+        first, cursor = movement_page({'movement_type': 'tie'}, per_page=2)
+        second, cursor = movement_page({'movement_type': 'tie'}, cursor=cursor, per_page=2)
+        third, cursor = movement_page({'movement_type': 'tie'}, cursor=cursor, per_page=2)
+        ids = [m.id for m in first + second + third]
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(len(set(ids)), 5)
+        self.assertIsNone(cursor)
+
+    def test_filters(self):
+        response = self.client.get(url_for('main.inventory_movements_report', product='GAD001', movement_type='sale'))
+        data = response.data.decode('utf-8')
+        # Gadget movements are the odd ones, sales are multiples of 5: 5, 15, 25
+        for i in range(30):
+            if i % 2 == 1 and i % 5 == 0:
+                self.assertIn(f'movement-{i}<', data)
+            else:
+                self.assertNotIn(f'movement-{i}<', data)
+
+        response = self.client.get(url_for('main.inventory_movements_report', user='clerk', per_page=100))
+        data = response.data.decode('utf-8')
+        self.assertIn('movement-0<', data)
+        self.assertIn('movement-27<', data)
+        self.assertNotIn('movement-1<', data)
+
+        response = self.client.get(url_for('main.inventory_movements_report', product='does-not-exist'))
+        self.assertIn(b'No se encontraron movimientos de inventario.', response.data)
+
+    def test_date_range_filter_is_inclusive(self):
+        db.session.add(InventoryMovement(product_id=self.widget.id, user_id=self.admin.id, quantity_change=1,
+                                         movement_type='stock_entry', timestamp=datetime.datetime(2024, 5, 2, 23, 59),
+                                         notes='late-may-2'))
+        db.session.commit()
+        response = self.client.get(url_for('main.inventory_movements_report', start_date='2024-05-01', end_date='2024-05-02'))
+        data = response.data.decode('utf-8')
+        self.assertIn('late-may-2', data)
+        self.assertNotIn('movement-0<', data)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(url_for('main.inventory_movements_report', cursor='not-a-cursor'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        # One distinct product per movement, so lazy loading would cost one query per row
+        for i in range(30):
+            product = Product(name=f"Distinct {i}", quantity=0, price=1)
+            db.session.add(product)
+            db.session.flush()
+            db.session.add(InventoryMovement(product_id=product.id, user_id=self.admin.id, quantity_change=1,
+                                             movement_type='stock_entry', timestamp=datetime.datetime(2025, 1, 1, 0, i)))
+        db.session.commit()
+        # Expire the identity map so lazy loads would really hit the database
+        db.session.expire_all()
+        with self.count_queries() as small_page:
+            self.client.get(url_for('main.inventory_movements_report', per_page=5))
+        db.session.expire_all()
+        with self.count_queries() as large_page:
+            self.client.get(url_for('main.inventory_movements_report', per_page=30))
+        self.assertEqual(len(small_page), len(large_page))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+from tests.base import BaseTestCase
+from inventory_app.models import db, Product
+from inventory_app.search import search_products, get_search_backend
+from inventory_app.stock import record_stock_movement
+from flask import url_for
+import unittest
+
+class TestProductSearch(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_admin_user()
+        self.login_user(email_or_username=self.admin.email, password="password")
+        self.create_product(name="Tornillo Hexagonal", sku="TOR-01")
+        self.create_product(name="Tuerca Mariposa", sku="TUE-01")
+        product = self.create_product(name="Arandela Plana", sku="ARA-01")
+        product.supplier = "Ferretería Central"
+        db.session.commit()
+
+    def names(self, query):
+        return [product.name for product in search_products(query)]
+
+    def test_uses_fts5_on_sqlite(self):
+        self.assertEqual(get_search_backend().name, 'fts5')
+
+    def test_prefix_and_multi_term_match(self):
+        self.assertEqual(self.names("torn"), ["Tornillo Hexagonal"])
+        self.assertEqual(self.names("hex torn"), ["Tornillo Hexagonal"])
+        self.assertEqual(self.names("ferreteria"), ["Arandela Plana"]) # diacritics folded
+        self.assertEqual(self.names("tue"), ["Tuerca Mariposa"])
+        self.assertEqual(self.names("tornillo tuerca"), [])
+        self.assertEqual(self.names("  ?! "), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        product = Product.query.filter_by(sku="TUE-01").one()
+        product.name = "Tuerca Hexagonal"
+        db.session.commit()
+        self.assertEqual(set(self.names("hexagonal")), {"Tornillo Hexagonal", "Tuerca Hexagonal"})
+        self.assertEqual(self.names("mariposa"), [])
+
+        db.session.delete(product)
+        db.session.commit()
+        self.assertEqual(self.names("hexagonal"), ["Tornillo Hexagonal"])
+
+    def test_stock_changes_keep_product_searchable(self):
+        product = Product.query.filter_by(sku="TOR-01").one()
+        record_stock_movement(product.id, -3, 'sale', self.admin.id)
+        db.session.commit()
+        self.assertEqual(self.names("tornillo"), ["Tornillo Hexagonal"])
+
+    def test_like_backend(self):
+        self.app.config['SEARCH_BACKEND'] = 'like'
+        self.assertEqual(get_search_backend().name, 'like')
+        self.assertEqual(self.names("torn hex"), ["Tornillo Hexagonal"])
+        self.assertEqual(self.names("%"), [])
+
+    def test_search_page_and_api(self):
+        response = self.client.get(url_for('main.product_search', q="arand"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Arandela Plana", response.data)
+        self.assertNotIn(b"Tuerca Mariposa", response.data)
+
+        body = self.client.get(url_for('api.product_search', q="tor")).get_json()
+        self.assertEqual([p['sku'] for p in body['products']], ["TOR-01"])
+
+    def test_rebuild_command(self):
+        db.session.execute(db.text("INSERT INTO product_fts(product_fts) VALUES ('delete-all')"))
+        db.session.commit()
+        self.assertEqual(self.names("tornillo"), [])
+        result = self.app.test_cli_runner().invoke(args=['rebuild-search-index'])
+        self.assertIn("fts5", result.output)
+        self.assertEqual(self.names("tornillo"), ["Tornillo Hexagonal"])
+
+if __name__ == '__main__':
+    unittest.main()
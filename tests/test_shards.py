@@ -0,0 +1,146 @@
+from tests.base import BaseTestCase
+from tests import test_stock
+from inventory_app import db
+from inventory_app.models import InventoryMovement, Product, StockShard
+from inventory_app.shards import fold_stock_shards, shard_product, shard_total, unshard_product
+from inventory_app.snapshots import take_snapshot
+from inventory_app.stock import InsufficientStock, apply_batch, apply_quantity_delta, record_stock_movement
+from inventory_app.summary import get_summary, rebuild_summary
+from flask import url_for
+import threading
+import unittest
+
+class TestShardedStock(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app.config['LOW_STOCK_THRESHOLD'] = 5
+        self.admin = self.create_admin_user()
+        self.product = self.create_product(name="Hot SKU", quantity=10, sku="HOT")
+        shard_product(self.product.id, 4)
+        db.session.commit()
+
+    def shards(self):
+        return [shard.quantity for shard in StockShard.query.filter_by(product_id=self.product.id).order_by(StockShard.shard)]
+
+    def quantity(self):
+        db.session.expire_all()
+        return db.session.get(Product, self.product.id).quantity
+
+    def test_writes_go_to_the_shards_until_folded(self):
+        self.assertEqual(self.shards(), [3, 3, 2, 2])
+        self.assertEqual(record_stock_movement(self.product.id, -3, 'sale', self.admin.id), 7)
+        self.assertEqual(record_stock_movement(self.product.id, 4, 'return', self.admin.id), 11)
+        db.session.commit()
+        self.assertEqual(shard_total(self.product.id), 11)
+        self.assertEqual(self.quantity(), 10) # The product row is a cache of the last fold
+        version = get_summary().catalogue_version
+
+        self.assertEqual(fold_stock_shards(), 1)
+        db.session.commit()
+        self.assertEqual(self.quantity(), 11)
+        self.assertEqual(self.shards(), [3, 3, 3, 2]) # Evened out again
+        summary = get_summary()
+        self.assertEqual(summary.total_units, 11)
+        self.assertGreater(summary.catalogue_version, version)
+        self.assertEqual(fold_stock_shards(), 0)
+
+    def test_stock_never_goes_negative(self):
+        # 9 is more than any one shard holds, so it is taken from several
+        self.assertEqual(record_stock_movement(self.product.id, -9, 'sale', self.admin.id), 1)
+        with self.assertRaises(InsufficientStock) as ctx:
+            record_stock_movement(self.product.id, -2, 'sale', self.admin.id)
+        self.assertEqual(ctx.exception.available, 1)
+        self.assertEqual(sum(self.shards()), 1)
+        self.assertTrue(all(quantity >= 0 for quantity in self.shards()))
+        db.session.commit()
+        fold_stock_shards()
+        db.session.commit()
+        self.assertTrue(db.session.get(Product, self.product.id).low_stock)
+        self.assertEqual(get_summary().low_stock_count, 1)
+
+    def test_sharded_writes_move_the_catalogue_version(self):
+        self.login_user(email_or_username=self.admin.email, password="password")
+        report = url_for('main.inventory_movements_report')
+        self.assertNotIn('<td>Sale</td>', self.client.get(report).get_data(as_text=True)) # Now cached
+        version = get_summary().catalogue_version
+        record_stock_movement(self.product.id, -1, 'sale', self.admin.id)
+        db.session.commit()
+        apply_batch([{'product_id': self.product.id, 'delta': -1, 'movement_type': 'sale'}], self.admin.id)
+        db.session.expire_all()
+        summary = get_summary()
+        self.assertEqual(summary.catalogue_version, version + 2)
+        self.assertEqual(summary.total_units, 10) # The counters still wait for the fold
+        self.assertEqual(self.client.get(report).get_data(as_text=True).count('<td>Sale</td>'), 2)
+
+    def test_views_and_batches_use_the_shard_total(self):
+        self.login_user(email_or_username=self.admin.email, password="password")
+        response = self.client.post(url_for('main.remove_stock', product_id=self.product.id),
+                                    data=dict(quantity_removed="12", reason="sale"), follow_redirects=True)
+        self.assertIn(b'Cannot remove 12 units. Only 10 available.', response.data)
+        self.client.post(url_for('main.edit_product', product_id=self.product.id),
+                         data=dict(name="Hot SKU", quantity="6", price="9.99", sku="HOT"))
+        self.assertEqual(shard_total(self.product.id), 6)
+        self.assertEqual(InventoryMovement.query.one().quantity_change, -4)
+
+        result = apply_batch([{'product_id': self.product.id, 'delta': -5, 'movement_type': 'sale'},
+                              {'product_id': self.product.id, 'delta': -5, 'movement_type': 'sale'}], self.admin.id)
+        self.assertFalse(result.committed) # The second line is not covered: the whole batch rolls back
+        self.assertEqual(result.lines[1].error, 'Cannot remove 5 units. Only 1 available.')
+        self.assertEqual(shard_total(self.product.id), 6)
+
+    def test_snapshots_and_unsharding_use_the_shard_total(self):
+        record_stock_movement(self.product.id, -4, 'sale', self.admin.id)
+        db.session.commit()
+        self.assertEqual(take_snapshot().total_units, 6)
+        self.assertEqual(unshard_product(self.product.id), 6)
+        db.session.commit()
+        self.assertEqual(self.quantity(), 6)
+        self.assertIsNone(db.session.get(Product, self.product.id).stock_shards)
+        self.assertEqual(StockShard.query.count(), 0)
+        self.assertEqual(record_stock_movement(self.product.id, -1, 'sale', self.admin.id), 5)
+
+    def test_deleting_the_product_removes_its_shards(self):
+        self.create_product(name="Other", quantity=7, sku="OTHER")
+        apply_quantity_delta(self.product.id, -3) # Not folded yet
+        db.session.commit()
+        db.session.delete(db.session.get(Product, self.product.id))
+        db.session.commit()
+        self.assertEqual(StockShard.query.count(), 0)
+        self.assertEqual(fold_stock_shards(), 0)
+        db.session.expire_all()
+        summary = get_summary()
+        self.assertEqual((summary.product_count, summary.total_units), (1, 7))
+        self.assertEqual(summary.total_units, rebuild_summary().total_units)
+
+class TestConcurrentShardedWriters(test_stock.TestConcurrentStockWriters):
+    """The same hammering, with the product's stock split over shards and folded at the end."""
+
+    def setUp(self):
+        super().setUp()
+        with self.app.app_context():
+            shard_product(self.product_id, 4)
+            db.session.commit()
+
+    def test_final_quantity_equals_sum_of_movements(self):
+        outcomes = []
+        threads = [threading.Thread(target=self.worker, args=(seed, outcomes)) for seed in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with self.app.app_context():
+            shards = [shard.quantity for shard in StockShard.query.filter_by(product_id=self.product_id)]
+            fold_stock_shards()
+            db.session.commit()
+            quantity = db.session.get(Product, self.product_id).quantity
+            movement_total = db.session.query(db.func.sum(InventoryMovement.quantity_change)).scalar()
+        applied = [delta for delta in outcomes if delta is not None]
+        self.assertEqual(quantity, movement_total)
+        self.assertEqual(quantity, sum(applied))
+        self.assertEqual(quantity, sum(shards))
+        self.assertTrue(all(shard >= 0 for shard in shards))
+
+if __name__ == '__main__':
+    unittest.main()
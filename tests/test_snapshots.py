@@ -0,0 +1,89 @@
+from tests.base import BaseTestCase
+from inventory_app.models import db, Product, InventoryMovement, StockSnapshot
+from inventory_app.snapshots import take_snapshot, stock_as_of, parse_as_of
+from inventory_app.stock import record_stock_movement
+from flask import url_for
+import datetime
+import unittest
+
+class TestStockSnapshots(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_admin_user()
+        self.product = self.create_product(name="Widget", quantity=0, sku="W1")
+        self.product.date_added = datetime.datetime(2024, 1, 1)
+        db.session.commit()
+
+    def move(self, delta, when, product=None):
+        product = product or self.product
+        record_stock_movement(product.id, delta, 'adjustment', self.admin.id)
+        db.session.commit()
+        movement = InventoryMovement.query.order_by(InventoryMovement.id.desc()).first()
+        movement.timestamp = when
+        db.session.commit()
+        return movement
+
+    def quantities(self, as_of):
+        snapshot, rows = stock_as_of(as_of)
+        return snapshot, {row.name: row.quantity for row in rows}
+
+    def test_point_in_time_uses_nearest_snapshot(self):
+        first = self.move(10, datetime.datetime(2024, 1, 2))
+        snapshot = take_snapshot()
+        snapshot.taken_at = datetime.datetime(2024, 1, 15)
+        db.session.commit()
+        self.move(-3, datetime.datetime(2024, 2, 1))
+        self.move(5, datetime.datetime(2024, 3, 1))
+
+        # Before any snapshot the ledger is replayed from the start
+        used, quantities = self.quantities(datetime.datetime(2024, 1, 10))
+        self.assertIsNone(used)
+        self.assertEqual(quantities, {"Widget": 10})
+
+        # History before the checkpoint is not read again
+        db.session.delete(first)
+        db.session.commit()
+        used, quantities = self.quantities(datetime.datetime(2024, 2, 15))
+        self.assertEqual(used.id, snapshot.id)
+        self.assertEqual(quantities, {"Widget": 7})
+        self.assertEqual(self.quantities(datetime.datetime.utcnow())[1], {"Widget": db.session.get(Product, self.product.id).quantity})
+
+    def test_products_added_later_are_excluded(self):
+        self.move(4, datetime.datetime(2024, 1, 2))
+        take_snapshot()
+        later = self.create_product(name="Gadget", quantity=0, sku="G1")
+        self.move(2, datetime.datetime.utcnow(), product=later)
+        self.assertEqual(self.quantities(datetime.datetime(2024, 1, 3))[1], {"Widget": 4})
+        self.assertEqual(self.quantities(datetime.datetime.utcnow())[1], {"Gadget": 2, "Widget": 4})
+
+    def test_unchanged_ledger_skips_snapshot(self):
+        self.move(4, datetime.datetime(2024, 1, 2))
+        snapshot = take_snapshot()
+        self.assertEqual((snapshot.product_count, snapshot.total_units), (1, 4))
+        self.assertEqual(snapshot.lines.one().quantity, 4)
+        self.assertIsNone(take_snapshot())
+        self.assertIsNotNone(take_snapshot(force=True))
+        self.assertEqual(StockSnapshot.query.count(), 2)
+
+    def test_parse_as_of_date_means_end_of_day(self):
+        self.assertEqual(parse_as_of("2024-03-31"), datetime.datetime(2024, 3, 31, 23, 59, 59, 999999))
+        self.assertEqual(parse_as_of("2024-03-31T08:30"), datetime.datetime(2024, 3, 31, 8, 30))
+        with self.assertRaises(ValueError):
+            parse_as_of("31/03/2024")
+
+    def test_cli_and_report(self):
+        self.move(6, datetime.datetime(2024, 1, 2))
+        runner = self.app.test_cli_runner()
+        self.assertIn("1 products, 6 units", runner.invoke(args=['take-stock-snapshot']).output)
+        self.assertIn("skipped", runner.invoke(args=['take-stock-snapshot']).output)
+
+        self.login_user(email_or_username=self.admin.email, password="password")
+        response = self.client.get(url_for('main.stock_as_of_report', as_of="2024-01-02"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Widget", response.data)
+        self.assertIn(b"<strong>6</strong>", response.data)
+        self.assertEqual(self.client.get(url_for('main.stock_as_of_report', as_of="yesterday")).status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+from tests.base import BaseTestCase
+from inventory_app import create_app, db
+from inventory_app.models import User, Product, InventoryMovement
+from inventory_app.stock import record_stock_movement, InsufficientStock, ProductNotFound
+from flask import url_for
+import os
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+
+class TestStockMutations(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_admin_user()
+        self.product = self.create_product(name="Bolt", quantity=5, sku="BOLT")
+
+    def test_insufficient_stock_writes_nothing(self):
+        with self.assertRaises(InsufficientStock) as ctx:
+            record_stock_movement(self.product.id, -6, 'sale', self.admin.id)
+        self.assertEqual(ctx.exception.available, 5)
+        db.session.rollback()
+        self.assertEqual(db.session.get(Product, self.product.id).quantity, 5)
+        self.assertEqual(InventoryMovement.query.count(), 0)
+
+    def test_unknown_product(self):
+        with self.assertRaises(ProductNotFound):
+            record_stock_movement(9999, 1, 'stock_entry', self.admin.id)
+
+    def test_remove_stock_route_rejects_overselling(self):
+        self.login_user(email_or_username=self.admin.email, password="password")
+        response = self.client.post(url_for('main.remove_stock', product_id=self.product.id),
+                                    data=dict(quantity_removed="8", reason="sale"), follow_redirects=True)
+        self.assertIn(b'Cannot remove 8 units. Only 5 available.', response.data)
+        response = self.client.post(url_for('main.remove_stock', product_id=self.product.id),
+                                    data=dict(quantity_removed="5", reason="sale"), follow_redirects=True)
+        self.assertIn(b'5 units of Bolt removed from stock.', response.data)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Product, self.product.id).quantity, 0)
+
+
+class TestConcurrentStockWriters(unittest.TestCase):
+    """Hammer one product from many threads against a file-backed database."""
+
+    THREADS = 8
+    OPERATIONS_PER_THREAD = 40
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.app = create_app('test', config_overrides={
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(self.tmpdir, 'stress.db'),
+            'SQLALCHEMY_ENGINE_OPTIONS': {'connect_args': {'timeout': 30}},
+        })
+        with self.app.app_context():
+            db.create_all()
+            user = User(username="pos", email="pos@example.com")
+            product = Product(name="Hot SKU", quantity=0, price=1)
+            db.session.add_all([user, product])
+            db.session.commit()
+            self.user_id, self.product_id = user.id, product.id
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def worker(self, seed, outcomes):
+        rng = random.Random(seed)
+        with self.app.app_context():
+            for _ in range(self.OPERATIONS_PER_THREAD):
+                delta = rng.choice([5, 3, -2, -4, -7])
+                try:
+                    record_stock_movement(self.product_id, delta, 'sale' if delta < 0 else 'stock_entry', self.user_id)
+                    db.session.commit()
+                    outcomes.append(delta)
+                except InsufficientStock:
+                    db.session.rollback()
+                    outcomes.append(None)
+            db.session.remove()
+
+    def test_final_quantity_equals_sum_of_movements(self):
+        outcomes = []
+        threads = [threading.Thread(target=self.worker, args=(seed, outcomes)) for seed in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(outcomes), self.THREADS * self.OPERATIONS_PER_THREAD)
+        with self.app.app_context():
+            quantity = db.session.get(Product, self.product_id).quantity
+            movement_total = db.session.query(db.func.sum(InventoryMovement.quantity_change)).scalar()
+            movement_count = InventoryMovement.query.count()
+        applied = [delta for delta in outcomes if delta is not None]
+        self.assertEqual(quantity, movement_total)
+        self.assertEqual(quantity, sum(applied))
+        self.assertEqual(movement_count, len(applied))
+        self.assertGreaterEqual(quantity, 0)
+
+if __name__ == '__main__':
+    unittest.main()
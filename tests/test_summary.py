@@ -0,0 +1,73 @@
+from tests.base import BaseTestCase
+from inventory_app.models import db, Product, InventorySummary
+from inventory_app.summary import get_summary, rebuild_summary
+from flask import url_for
+import unittest
+
+class TestInventorySummary(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app.config['LOW_STOCK_THRESHOLD'] = 5
+        admin = self.create_admin_user()
+        self.login_user(email_or_username=admin.email, password="password")
+        rebuild_summary()
+
+    def assertSummary(self, product_count, total_units, low_stock_count):
+        db.session.expire_all()
+        summary = db.session.get(InventorySummary, 1)
+        self.assertEqual((summary.product_count, summary.total_units, summary.low_stock_count),
+                         (product_count, total_units, low_stock_count))
+
+    def test_counters_follow_product_and_stock_writes(self):
+        self.client.post(url_for('main.add_product'), data=dict(name="Tape", quantity="20", price="2.50", sku="TAPE"))
+        self.client.post(url_for('main.add_product'), data=dict(name="Glue", quantity="3", price="1.00", sku="GLUE"))
+        self.assertSummary(2, 23, 1)
+        tape = Product.query.filter_by(sku="TAPE").first()
+        glue = Product.query.filter_by(sku="GLUE").first()
+
+        self.client.post(url_for('main.remove_stock', product_id=tape.id), data=dict(quantity_removed="16", reason="sale"))
+        self.assertSummary(2, 7, 2) # Tape crossed the threshold
+
+        self.client.post(url_for('main.add_stock', product_id=glue.id), data=dict(quantity_added="10"))
+        self.assertSummary(2, 17, 1)
+
+        self.client.post(url_for('main.edit_product', product_id=tape.id), data=dict(
+            name="Tape", quantity="40", price="2.50", sku="TAPE"))
+        self.assertSummary(2, 53, 0)
+
+        spare = self.create_product(name="Spare", quantity=2, sku="SPARE")
+        self.assertSummary(3, 55, 1)
+        self.client.post(url_for('main.delete_product', product_id=spare.id))
+        self.assertSummary(2, 53, 0)
+
+    def test_rebuild_fixes_drift(self):
+        self.create_product(name="Drifty", quantity=4, sku="DR001")
+        db.session.query(InventorySummary).update({'total_units': 999, 'product_count': 0})
+        db.session.commit()
+        self.assertSummary(0, 999, 1)
+        rebuild_summary()
+        self.assertSummary(1, 4, 1)
+
+    def test_threshold_change_triggers_rebuild(self):
+        self.create_product(name="Seven", quantity=7, sku="SEV001")
+        self.assertEqual(get_summary().low_stock_count, 0)
+        self.app.config['LOW_STOCK_THRESHOLD'] = 10
+        self.assertEqual(get_summary().low_stock_count, 1)
+
+    def test_products_page_does_not_scan_for_aggregates(self):
+        for i in range(3):
+            self.create_product(name=f"Item {i}", quantity=i, sku=f"IT{i}")
+        with self.count_queries() as statements:
+            response = self.client.get(url_for('main.products'))
+        self.assertIn('Total de Unidades en Inventario:</strong> 3', response.data.decode('utf-8'))
+        aggregates = [s for s in statements if 'count(' in s.lower() or 'sum(' in s.lower()]
+        self.assertEqual(aggregates, [])
+
+    def test_rebuild_summary_cli(self):
+        self.create_product(name="Cli Product", quantity=2, sku="CLI001")
+        result = self.app.test_cli_runner().invoke(args=['rebuild-summary'])
+        self.assertIn('1 products, 2 units, 1 low stock', result.output)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+from tests.base import BaseTestCase
+from inventory_app.models import db, User
+from inventory_app.user_cache import UserCache, CachedUser, get_user_cache
+from flask import url_for, g
+import time
+import unittest
+
+class TestUserCache(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_admin_user()
+        self.login_user(email_or_username=self.admin.email, password="password")
+
+    def get(self, endpoint, **kwargs):
+        # The test app context is shared between requests; drop Flask-Login's per-request copy
+        g.pop('_login_user', None)
+        return self.client.get(url_for(endpoint, **kwargs))
+
+    def user_queries(self, statements):
+        return [s for s in statements if 'FROM user' in s]
+
+    def test_authenticated_requests_only_check_the_version(self):
+        self.get('main.products')
+        with self.count_queries() as statements:
+            response = self.get('main.products')
+        self.assertEqual(response.status_code, 200)
+        [query] = self.user_queries(statements)
+        self.assertIn('SELECT user.auth_version', query)
+
+    def test_role_change_is_seen_on_next_request(self):
+        self.assertEqual(self.get('main.batch_stock_adjustment').status_code, 200)
+        admin = db.session.get(User, self.admin.id)
+        admin.role = 'user'
+        db.session.commit()
+        self.assertIsNone(get_user_cache().get(admin.id))
+        self.assertEqual(self.get('main.batch_stock_adjustment').status_code, 302)
+
+    def test_changes_made_by_another_process_are_seen(self):
+        self.assertEqual(self.get('main.batch_stock_adjustment').status_code, 200)
+        other = self.app.extensions.pop('user_cache') # The change is made where this cache is not
+        admin = db.session.get(User, self.admin.id)
+        admin.role = 'user'
+        db.session.commit()
+        self.app.extensions['user_cache'] = other
+        self.assertEqual(other.get(self.admin.id).role, 'admin') # Still cached here
+        self.assertEqual(self.get('main.batch_stock_adjustment').status_code, 302)
+        self.assertEqual(get_user_cache().get(self.admin.id).role, 'user')
+
+        self.app.extensions.pop('user_cache')
+        admin.is_active = False
+        db.session.commit()
+        self.app.extensions['user_cache'] = other
+        self.assertEqual(self.get('main.products').status_code, 302)
+
+    def test_rolled_back_change_keeps_old_identity(self):
+        self.get('main.products')
+        admin = db.session.get(User, self.admin.id)
+        admin.is_active = False
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.get('main.batch_stock_adjustment').status_code, 200)
+        self.assertTrue(get_user_cache().get(self.admin.id).is_active)
+
+    def test_lru_and_ttl(self):
+        cache = UserCache(max_size=2, ttl=60)
+        users = [CachedUser(User(id=i, username=f"u{i}", email=f"u{i}@example.com", role='user', is_active=True))
+                 for i in range(3)]
+        cache.put(users[0])
+        cache.put(users[1])
+        cache.get(0)
+        cache.put(users[2])
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(0).username, "u0")
+
+        cache.ttl = 0.01
+        cache.put(users[1])
+        time.sleep(0.02)
+        self.assertIsNone(cache.get(1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+from tests.base import BaseTestCase
+from inventory_app.models import db, Product
+from inventory_app.summary import get_summary
+from inventory_app.valuation import inventory_valuation, compute_valuation, GRAND_TOTAL, SUBTOTAL
+from inventory_app.jobs import enqueue_job, job_output_path, run_worker
+from decimal import Decimal
+from flask import url_for
+import shutil
+import tempfile
+import unittest
+
+class TestValuation(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_admin_user()
+        self.login_user(email_or_username=self.admin.email, password="password")
+        for name, quantity, price, category, supplier in [
+                ("Bolt", 3, 0.1, "Hardware", "Acme"),
+                ("Nut", 7, 0.1, "Hardware", "Acme"),
+                ("Saw", 2, 19.99, "Hardware", "Globex"),
+                ("Glue", 5, 3.35, "Supplies", "Acme"),
+                ("Misc", 1, 1.01, None, None)]:
+            db.session.add(Product(name=name, quantity=quantity, price=price, category=category, supplier=supplier))
+        db.session.commit()
+        get_summary()
+
+    def by_level(self, rows, level):
+        return [row for row in rows if row['level'] == level]
+
+    def test_rollup_levels_and_exact_totals(self):
+        rows = inventory_valuation('category')
+        details = [(row['first'], row['second'], row['value']) for row in rows if row['level'] == 0]
+        self.assertEqual(details, [("Hardware", "Acme", Decimal("1.00")), ("Hardware", "Globex", Decimal("39.98")),
+                                   ("Supplies", "Acme", Decimal("16.75")), (None, None, Decimal("1.01"))])
+        subtotals = {row['first']: (row['products'], row['units'], row['value']) for row in self.by_level(rows, SUBTOTAL)}
+        self.assertEqual(subtotals, {"Hardware": (3, 12, Decimal("40.98")), "Supplies": (1, 5, Decimal("16.75")),
+                                     None: (1, 1, Decimal("1.01"))})
+        [total] = self.by_level(rows, GRAND_TOTAL)
+        self.assertEqual((total['products'], total['units'], total['value']), (5, 18, Decimal("58.74")))
+        self.assertEqual(rows[-1], total)
+        # Float arithmetic would not land on the cent here
+        self.assertNotEqual(sum(p.quantity * p.price for p in Product.query), 58.74)
+
+    def test_grouping_by_supplier(self):
+        subtotals = {row['first']: row['value'] for row in self.by_level(inventory_valuation('supplier'), SUBTOTAL)}
+        self.assertEqual(subtotals, {"Acme": Decimal("17.75"), "Globex": Decimal("39.98"), None: Decimal("1.01")})
+        with self.assertRaises(ValueError):
+            inventory_valuation('name')
+
+    def test_cached_until_a_product_write(self):
+        inventory_valuation('category')
+        with self.count_queries() as statements:
+            inventory_valuation('category')
+        self.assertEqual([s for s in statements if 'FROM product' in s], [])
+        self.client.post(url_for('main.add_stock', product_id=1), data=dict(quantity_added="10"))
+        [total] = self.by_level(inventory_valuation('category'), GRAND_TOTAL)
+        self.assertEqual(total['value'], Decimal("59.74"))
+
+    def test_report_page(self):
+        response = self.client.get(url_for('main.valuation_report', by='supplier'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Total general", response.get_data(as_text=True))
+        self.assertIn("$58.74", response.get_data(as_text=True))
+        self.assertEqual(self.client.get(url_for('main.valuation_report', by='sku')).status_code, 400)
+
+    def test_valuation_job_writes_csv(self):
+        self.app.config['JOB_OUTPUT_DIR'] = output_dir = tempfile.mkdtemp()
+        try:
+            job = enqueue_job('valuation', {'by': 'category'})
+            run_worker(self.app, processes=0, once=True)
+            db.session.refresh(job)
+            with open(job_output_path(job)) as stream:
+                lines = stream.read().splitlines()
+            self.assertEqual(lines[0], 'level,first,second,products,units,value')
+            self.assertEqual(lines[-1], '2,,,5,18,58.74')
+            self.assertEqual(len(lines), 1 + len(compute_valuation()))
+        finally:
+            shutil.rmtree(output_dir)
+
+if __name__ == '__main__':
+    unittest.main()
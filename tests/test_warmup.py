@@ -0,0 +1,51 @@
+from tests.base import BaseTestCase
+from inventory_app import create_app
+from inventory_app.warmup import configure_bytecode_cache, warm_up
+from flask import url_for
+import os
+import tempfile
+import time
+import unittest
+
+class TestWarmup(BaseTestCase):
+
+    def test_warm_up_compiles_every_template(self):
+        timings = warm_up(self.app, started=time.perf_counter())
+        names = self.app.jinja_env.list_templates()
+        self.assertEqual(timings['templates'], len(names))
+        self.assertIn('products.html', names)
+        self.assertEqual(timings['connections'], 1)
+        self.assertGreaterEqual(timings['total_ms'], timings['warmup_ms'])
+        # Loaded templates are kept by the environment, so a render does not compile again
+        cached = {key[1] for key in self.app.jinja_env.cache.keys()}
+        self.assertTrue(set(names) <= cached)
+
+    def test_bytecode_cache_is_shared_between_apps(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.app.config['JINJA_BYTECODE_CACHE_DIR'] = directory
+            configure_bytecode_cache(self.app)
+            warm_up(self.app)
+            written = os.listdir(directory)
+            self.assertEqual(len(written), len(self.app.jinja_env.list_templates()))
+
+            other = create_app('test', {'JINJA_BYTECODE_CACHE_DIR': directory})
+            loads = []
+            original = other.jinja_env.bytecode_cache.load_bytecode
+            def load_bytecode(bucket):
+                original(bucket)
+                loads.append(bucket.code is not None)
+            other.jinja_env.bytecode_cache.load_bytecode = load_bytecode
+            warm_up(other)
+            self.assertTrue(loads and all(loads))
+            self.assertEqual(sorted(os.listdir(directory)), sorted(written))
+
+    def test_startup_timings_on_performance_page(self):
+        admin = self.create_admin_user()
+        self.login_user(email_or_username=admin.email, password="password")
+        self.assertNotIn("Arranque de este proceso", self.client.get(url_for('main.performance_report')).get_data(as_text=True))
+        warm_up(self.app)
+        response = self.client.get(url_for('main.performance_report'))
+        self.assertIn(f"Arranque de este proceso (PID {os.getpid()})", response.get_data(as_text=True))
+
+if __name__ == '__main__':
+    unittest.main()
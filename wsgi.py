@@ -0,0 +1,14 @@
+# Production WSGI entry point, e.g. `gunicorn wsgi:app`.
+# Each worker compiles the templates and connects to the database before it accepts requests;
+# see inventory_app/warmup.py. FLASK_ENV selects the config (default: prod).
+
+import os
+import time
+
+started = time.perf_counter() # Before the app imports, so startup times include them
+
+from inventory_app import create_app
+from inventory_app.warmup import warm_up
+
+app = create_app(os.environ.get('FLASK_ENV', 'prod'))
+warm_up(app, started=started)